@@ -0,0 +1,10 @@
+-- Minimal DomiNode DB objects needed by the import benchmarks
+
+CREATE SCHEMA IF NOT EXISTS lsd_staging;
+
+-- The real function grants staging permissions to the department's roles,
+-- which do not exist in the benchmarks DB
+CREATE OR REPLACE FUNCTION DomiNodeSetStagingPermissions(table_name text)
+RETURNS text AS $$
+    SELECT table_name;
+$$ LANGUAGE sql;
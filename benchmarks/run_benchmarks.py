@@ -0,0 +1,634 @@
+"""Benchmarks for the DomiNode processing scripts
+
+Synthetic index grids, resource names and rasters are generated according to
+the command line options and the scripts are timed against them. Results are
+written as JSON so that runs can be compared across commits. Benchmarks of
+scripts that do not exist in the checked out commit are skipped.
+
+This must be run with the Python interpreter that ships with QGIS. See
+README.md for usage.
+
+"""
+
+import argparse
+import contextlib
+import datetime
+import importlib.util
+import json
+import math
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import typing
+
+# set DOMINODE_REPO_DIR to benchmark another checkout, such as an older commit
+REPO_DIR = os.environ.get(
+    'DOMINODE_REPO_DIR',
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+)
+COLLECTION_DIR = os.path.join(REPO_DIR, 'collections', 'dominode-resources')
+PROCESSING_DIR = os.path.join(COLLECTION_DIR, 'processing')
+EXPRESSIONS_DIR = os.path.join(COLLECTION_DIR, 'expressions')
+
+GRID_CRS = 'EPSG:32620'
+CELL_WIDTH = 1700
+CELL_HEIGHT = 950
+BENCHMARK_SCHEMA = 'dominode_benchmarks'
+BENCHMARK_RESOURCE_NAME = 'lsd_benchmarkgrid_1.0.0'
+BENCHMARK_GROUPS = ('grids', 'expressions', 'names', 'rasters', 'imports')
+
+DEPARTMENTS = ('dwa', 'lsd', 'ppd', 'dwsa', 'odm')
+DATASETS = ('roads', 'buildings', 'contours', 'rivers', 'parcels', 'topo')
+FORMATS = ('', '', '.gpkg', '.tif', '.geojson')
+
+
+class BenchmarkResult(typing.NamedTuple):
+    name: str
+    parameters: typing.Dict
+    timings: typing.List[float]
+
+    def to_dict(self) -> typing.Dict:
+        return {
+            'name': self.name,
+            'parameters': self.parameters,
+            'timings': self.timings,
+            'min': min(self.timings),
+            'median': statistics.median(self.timings),
+        }
+
+
+def measure(
+        name: str,
+        function: typing.Callable[[], typing.Any],
+        repeat: int,
+        setup: typing.Optional[typing.Callable[[], typing.Any]] = None,
+        **parameters
+) -> BenchmarkResult:
+    """Time ``function`` ``repeat`` times, calling ``setup`` before each run
+
+    The time spent in ``setup`` is not measured.
+
+    """
+
+    timings = []
+    for _ in range(repeat):
+        if setup is not None:
+            setup()
+        start = time.perf_counter()
+        function()
+        timings.append(time.perf_counter() - start)
+    result = BenchmarkResult(name, parameters, timings)
+    print(
+        f'{name}: median {statistics.median(timings):.4f}s '
+        f'(min {min(timings):.4f}s, {repeat} runs)'
+    )
+    return result
+
+
+def has_scripts(*names: str) -> bool:
+    """Return whether the scripts exist in the checked out commit"""
+    return all(
+        os.path.isfile(os.path.join(PROCESSING_DIR, name)) for name in names)
+
+
+def skip(name: str):
+    print(f'Skipping {name}, it is not available in this commit')
+
+
+def load_module(path: str):
+    """Load a script in the same way as QGIS does"""
+    name = os.path.splitext(os.path.basename(path))[0]
+    spec = importlib.util.spec_from_file_location(name, path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def start_qgis():
+    from qgis.core import QgsApplication
+    application = QgsApplication([], False)
+    application.initQgis()
+    sys.path.append(
+        os.path.join(QgsApplication.pkgDataPath(), 'python', 'plugins'))
+    from processing.core.Processing import Processing
+    Processing.initialize()
+    return application
+
+
+@contextlib.contextmanager
+def scripts_registered():
+    """Register the processing scripts with the Processing script provider
+
+    Scripts that run other scripts through ``processing.run`` need them.
+    The previous scripts folders setting is restored afterwards.
+
+    """
+
+    from processing.core.ProcessingConfig import ProcessingConfig
+    from processing.script import ScriptUtils
+    from qgis.core import QgsApplication
+    provider = QgsApplication.processingRegistry().providerById('script')
+    previous_folders = ProcessingConfig.getSetting(ScriptUtils.SCRIPTS_FOLDERS)
+    ProcessingConfig.setSettingValue(
+        ScriptUtils.SCRIPTS_FOLDERS, PROCESSING_DIR)
+    provider.refreshAlgorithms()
+    try:
+        yield
+    finally:
+        ProcessingConfig.setSettingValue(
+            ScriptUtils.SCRIPTS_FOLDERS, previous_folders)
+        provider.refreshAlgorithms()
+
+
+@contextlib.contextmanager
+def global_variable(name: str, value: str):
+    """Set a QGIS global variable, restoring its previous value afterwards"""
+    from qgis.core import QgsExpressionContextUtils
+    previous_scope = QgsExpressionContextUtils.globalScope()
+    had_variable = previous_scope.hasVariable(name)
+    previous_value = previous_scope.variable(name)
+    QgsExpressionContextUtils.setGlobalVariable(name, value)
+    try:
+        yield
+    finally:
+        if had_variable:
+            QgsExpressionContextUtils.setGlobalVariable(name, previous_value)
+        else:
+            QgsExpressionContextUtils.removeGlobalVariable(name)
+
+
+def run_algorithm(algorithm_class, parameters: typing.Dict) -> typing.Dict:
+    from qgis.core import (
+        QgsProcessingContext,
+        QgsProcessingFeedback,
+    )
+    algorithm = algorithm_class().create()
+    context = QgsProcessingContext()
+    results, ok = algorithm.run(
+        parameters, context, QgsProcessingFeedback())
+    if not ok:
+        raise RuntimeError(f'Could not run {algorithm.name()!r}')
+    return results
+
+
+def get_grid_dimensions(num_cells: int) -> typing.Tuple[int, int]:
+    num_rows = max(1, int(math.sqrt(num_cells)))
+    return num_rows, max(1, math.ceil(num_cells / num_rows))
+
+
+def create_grid_layer(num_cells: int):
+    """Create a memory layer like the ones made by 'native:creategrid'"""
+    from qgis.core import (
+        QgsFeature,
+        QgsField,
+        QgsGeometry,
+        QgsRectangle,
+        QgsVectorLayer,
+    )
+    from qgis.PyQt.QtCore import QVariant
+    num_rows, num_cols = get_grid_dimensions(num_cells)
+    layer = QgsVectorLayer(f'Polygon?crs={GRID_CRS}', 'grid', 'memory')
+    provider = layer.dataProvider()
+    provider.addAttributes([
+        QgsField('id', QVariant.LongLong),
+        QgsField('left', QVariant.Double),
+        QgsField('top', QVariant.Double),
+        QgsField('right', QVariant.Double),
+        QgsField('bottom', QVariant.Double),
+    ])
+    layer.updateFields()
+    features = []
+    # cells are numbered column by column, from the top left corner
+    for col in range(num_cols):
+        left = col * CELL_WIDTH
+        for row in range(num_rows):
+            top = (num_rows - row) * CELL_HEIGHT
+            cell = (
+                col * num_rows + row + 1,
+                left,
+                top,
+                left + CELL_WIDTH,
+                top - CELL_HEIGHT
+            )
+            feature = QgsFeature(layer.fields())
+            feature.setGeometry(
+                QgsGeometry.fromRect(
+                    QgsRectangle(cell[1], cell[4], cell[3], cell[2])))
+            feature.setAttributes(list(cell))
+            features.append(feature)
+    provider.addFeatures(features)
+    layer.updateExtents()
+    return layer
+
+
+def create_name_corpus(
+        num_names: int,
+        invalid_ratio: float = 0.1
+) -> typing.List[str]:
+    result = []
+    for _ in range(num_names):
+        department = random.choice(DEPARTMENTS)
+        dataset = random.choice(DATASETS) + str(random.randint(1, 50))
+        version = '.'.join(str(random.randint(0, 9)) for _ in range(3))
+        suffix = random.choice(FORMATS)
+        if random.random() < 0.3:
+            name = f'{department}_topomaps_{dataset}_{version}{suffix}'
+        else:
+            name = f'{department}_{dataset}_{version}{suffix}'
+        if random.random() < invalid_ratio:
+            name = name.replace('_', '-', 1)
+        result.append(name)
+    return result
+
+
+def create_raster(path: str, size: int):
+    from osgeo import (
+        gdal,
+        osr,
+    )
+    dataset = gdal.GetDriverByName('GTiff').Create(
+        path, size, size, 1, gdal.GDT_Byte)
+    dataset.SetGeoTransform((0, 10, 0, size * 10, 0, -10))
+    spatial_reference = osr.SpatialReference()
+    spatial_reference.ImportFromEPSG(32620)
+    dataset.SetProjection(spatial_reference.ExportToWkt())
+    dataset.GetRasterBand(1).WriteRaster(
+        0, 0, size, size, bytes(random.getrandbits(6) for _ in range(size * size)))
+    dataset.FlushCache()
+    dataset = None
+
+
+def benchmark_grids(args) -> typing.List[BenchmarkResult]:
+    identifier = load_module(
+        os.path.join(PROCESSING_DIR, 'topogrididentifier.py'))
+    layer = create_grid_layer(args.cells)
+    num_rows, num_cols = get_grid_dimensions(args.cells)
+    extent = (
+        f'0,{num_cols * CELL_WIDTH},0,{num_rows * CELL_HEIGHT} [{GRID_CRS}]')
+    parameters = {'cells': layer.featureCount(), 'depth': args.depth}
+    result = [
+        measure(
+            'topogrididentifier',
+            lambda: run_algorithm(
+                identifier.DomiNodeTopoMapGridIdentifier,
+                {'INPUT': layer, 'DEPTH': args.depth, 'OUTPUT': 'memory:'}
+            ),
+            args.repeat,
+            **parameters
+        ),
+    ]
+    if has_scripts('topogridgenerator.py'):
+        generator = load_module(
+            os.path.join(PROCESSING_DIR, 'topogridgenerator.py'))
+        result.append(
+            measure(
+                'topogridgenerator',
+                lambda: run_algorithm(
+                    generator.DomiNodeTopoMapGridGenerator,
+                    {
+                        'EXTENT': extent,
+                        'HSPACING': CELL_WIDTH,
+                        'VSPACING': CELL_HEIGHT,
+                        'CRS': GRID_CRS,
+                        'DEPTH': args.depth,
+                        'OUTPUT': 'memory:',
+                    }
+                ),
+                args.repeat,
+                **parameters
+            )
+        )
+    else:
+        skip('topogridgenerator')
+    if has_scripts('topogridlookup.py', 'gridcodes.py'):
+        lookup = load_module(
+            os.path.join(PROCESSING_DIR, 'topogridlookup.py'))
+        gridcodes = load_module(os.path.join(PROCESSING_DIR, 'gridcodes.py'))
+        codes = [
+            ''.join(
+                gridcodes.find_coord_ids(cell, num_rows, num_cols, args.depth)
+            ).upper() for cell in random.sample(
+                range(1, num_rows * num_cols + 1), min(1000, args.cells))
+        ]
+        result.append(
+            measure(
+                'topogridlookup',
+                lambda: run_algorithm(
+                    lookup.DomiNodeTopoMapGridLookup,
+                    {
+                        'CODES': '\n'.join(codes),
+                        'EXTENT': extent,
+                        'HSPACING': CELL_WIDTH,
+                        'VSPACING': CELL_HEIGHT,
+                        'CRS': GRID_CRS,
+                        'DEPTH': args.depth,
+                        'OUTPUT': 'memory:',
+                    }
+                ),
+                args.repeat,
+                codes=len(codes),
+                **parameters
+            )
+        )
+    else:
+        skip('topogridlookup')
+    return result
+
+
+def benchmark_expressions(args) -> typing.List[BenchmarkResult]:
+    from qgis.core import (
+        QgsExpression,
+        QgsExpressionContext,
+        QgsExpressionContextUtils,
+    )
+    topomapgrids = load_module(
+        os.path.join(EXPRESSIONS_DIR, 'topomapgrids.py'))
+    layer = create_grid_layer(args.cells)
+    expression = QgsExpression(
+        f'get_coord_row_id({args.depth}) || get_coord_col_id({args.depth})')
+    context = QgsExpressionContext()
+    context.appendScopes(
+        QgsExpressionContextUtils.globalProjectLayerScopes(layer))
+    expression.prepare(context)
+
+    def evaluate():
+        for feature in layer.getFeatures():
+            context.setFeature(feature)
+            expression.evaluate(context)
+        if expression.hasEvalError():
+            raise RuntimeError(expression.evalErrorString())
+
+    parameters = {'cells': layer.featureCount(), 'depth': args.depth}
+    if not hasattr(topomapgrids, 'invalidate_grid_cache'):
+        # nothing is cached, so all runs are cold
+        return [
+            measure(
+                'topomapgrids_expressions_cold',
+                evaluate,
+                args.repeat,
+                **parameters
+            ),
+        ]
+    return [
+        measure(
+            'topomapgrids_expressions_cold',
+            evaluate,
+            args.repeat,
+            setup=lambda: topomapgrids.invalidate_grid_cache(layer.id()),
+            **parameters
+        ),
+        measure(
+            'topomapgrids_expressions_warm',
+            evaluate,
+            args.repeat,
+            **parameters
+        ),
+    ]
+
+
+def benchmark_names(args) -> typing.List[BenchmarkResult]:
+    validator = load_module(
+        os.path.join(PROCESSING_DIR, 'resourcenamevalidator.py'))
+    names = create_name_corpus(args.names)
+    valid_names = create_name_corpus(args.single_names, invalid_ratio=0)
+
+    def validate_one_by_one():
+        for name in valid_names:
+            run_algorithm(
+                validator.DomiNodeResourceNameValidator, {'INPUT_NAME': name})
+
+    result = [
+        measure(
+            'resourcenamevalidator',
+            validate_one_by_one,
+            args.repeat,
+            names=len(valid_names)
+        ),
+    ]
+    if has_scripts('resourcenamebatchvalidator.py'):
+        batch_validator = load_module(
+            os.path.join(PROCESSING_DIR, 'resourcenamebatchvalidator.py'))
+        result.append(
+            measure(
+                'resourcenamebatchvalidator',
+                lambda: run_algorithm(
+                    batch_validator.DomiNodeResourceNameBatchValidator,
+                    {
+                        'INPUT_NAMES': '\n'.join(names),
+                        'OUTPUT': 'memory:',
+                    }
+                ),
+                args.repeat,
+                names=len(names)
+            )
+        )
+    else:
+        skip('resourcenamebatchvalidator')
+    return result
+
+
+def benchmark_rasters(args) -> typing.List[BenchmarkResult]:
+    if not has_scripts('cloudoptimizedgeotiff.py'):
+        skip('cloudoptimizedgeotiff')
+        return []
+    cog = load_module(
+        os.path.join(PROCESSING_DIR, 'cloudoptimizedgeotiff.py'))
+    with tempfile.TemporaryDirectory() as temporary_folder:
+        rasters = []
+        for index in range(args.rasters):
+            path = os.path.join(temporary_folder, f'raster{index}.tif')
+            create_raster(path, args.raster_size)
+            rasters.append(path)
+        output_folder = os.path.join(temporary_folder, 'cog')
+        return [
+            measure(
+                'cloudoptimizedgeotiff',
+                lambda: run_algorithm(
+                    cog.DomiNodeCloudOptimizedGeoTiff,
+                    {
+                        'INPUT': rasters,
+                        'WORKERS': args.workers,
+                        'OUTPUT': output_folder,
+                    }
+                ),
+                args.repeat,
+                rasters=len(rasters),
+                raster_size=args.raster_size,
+                workers=args.workers
+            ),
+        ]
+
+
+def benchmark_imports(args) -> typing.List[BenchmarkResult]:
+    if args.pg_service is None:
+        print('Skipping import benchmarks, no pg service was given')
+        return []
+    layer = create_grid_layer(args.cells)
+    parameters = {'features': layer.featureCount()}
+    importer = load_module(os.path.join(PROCESSING_DIR, 'import_lyr.py'))
+
+    def import_with_ogr2ogr():
+        # the default import engine, which is ogr2ogr in all commits
+        run_algorithm(
+            importer.ImportVectorLayer,
+            {
+                'dbconnectionnameexpression': '@dominode_db_connection_name',
+                'inputlayer': layer,
+                'layername': BENCHMARK_RESOURCE_NAME,
+            }
+        )
+
+    with scripts_registered(), \
+            global_variable('dominode_db_connection_name', args.pg_service):
+        result = [
+            measure(
+                'import_vector_layer_ogr2ogr',
+                import_with_ogr2ogr,
+                args.repeat,
+                **parameters
+            ),
+        ]
+    if not has_scripts('dbpool.py', 'pgcopy.py'):
+        skip('pgcopy')
+        return result
+    if PROCESSING_DIR not in sys.path:
+        sys.path.append(PROCESSING_DIR)
+    import dbpool
+    import pgcopy
+    with dbpool.pooled_connection(args.pg_service) as connection:
+        with connection.cursor() as cursor:
+            cursor.execute(f'CREATE SCHEMA IF NOT EXISTS {BENCHMARK_SCHEMA}')
+
+    def import_grid():
+        with dbpool.pooled_connection(args.pg_service) as connection:
+            pgcopy.import_layer(connection, layer, BENCHMARK_SCHEMA, 'grid')
+
+    def sync_grid():
+        with dbpool.pooled_connection(args.pg_service) as connection:
+            pgcopy.sync_layer(connection, layer, BENCHMARK_SCHEMA, 'grid')
+
+    return result + [
+        measure('pgcopy_import_layer', import_grid, args.repeat, **parameters),
+        measure('pgcopy_sync_unchanged_layer', sync_grid, args.repeat, **parameters),
+    ]
+
+
+def get_commit() -> typing.Dict:
+    def git(*arguments):
+        return subprocess.run(
+            ['git', *arguments],
+            cwd=REPO_DIR,
+            capture_output=True,
+            text=True
+        ).stdout.strip()
+
+    return {
+        'commit': git('rev-parse', 'HEAD'),
+        'dirty': git('status', '--porcelain') != '',
+    }
+
+
+def run(args) -> typing.Dict:
+    from qgis.core import Qgis
+    random.seed(args.seed)
+    application = start_qgis()
+    benchmarks = {
+        'grids': benchmark_grids,
+        'expressions': benchmark_expressions,
+        'names': benchmark_names,
+        'rasters': benchmark_rasters,
+        'imports': benchmark_imports,
+    }
+    results = []
+    for group in args.only:
+        results.extend(benchmarks[group](args))
+    application.exitQgis()
+    return {
+        'git': get_commit(),
+        'generated': datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        'qgis_version': Qgis.QGIS_VERSION,
+        'python_version': platform.python_version(),
+        'platform': platform.platform(),
+        'options': {
+            key: value for key, value in vars(args).items()
+            if key not in ('output', 'compare')
+        },
+        'results': [result.to_dict() for result in results],
+    }
+
+
+def compare(before_path: str, after_path: str):
+    with open(before_path) as fh:
+        before = json.load(fh)
+    with open(after_path) as fh:
+        after = json.load(fh)
+    before_results = {result['name']: result for result in before['results']}
+    print(f'before: {before["git"]["commit"]}')
+    print(f'after:  {after["git"]["commit"]}')
+    for result in after['results']:
+        previous = before_results.get(result['name'])
+        if previous is None:
+            print(f'{result["name"]}: {result["median"]:.4f}s (new)')
+        else:
+            speedup = previous['median'] / result['median']
+            print(
+                f'{result["name"]}: {previous["median"]:.4f}s -> '
+                f'{result["median"]:.4f}s ({speedup:.2f}x)'
+            )
+
+
+def parse_arguments(arguments=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--cells', type=int, default=10000,
+                        help='Number of cells of the synthetic grids')
+    parser.add_argument('--depth', type=int, default=3,
+                        help='Depth of the grid identifiers')
+    parser.add_argument('--names', type=int, default=10000,
+                        help='Number of names in the resource name corpus')
+    parser.add_argument('--single-names', type=int, default=200,
+                        help='Number of names to validate one by one')
+    parser.add_argument('--rasters', type=int, default=2,
+                        help='Number of synthetic rasters')
+    parser.add_argument('--raster-size', type=int, default=2048,
+                        help='Width and height of the synthetic rasters')
+    parser.add_argument('--workers', type=int, default=1,
+                        help='Number of workers for the scripts that use them')
+    parser.add_argument('--repeat', type=int, default=3,
+                        help='Number of times to run each benchmark')
+    parser.add_argument('--seed', type=int, default=0,
+                        help='Seed for generating the synthetic data')
+    parser.add_argument('--pg-service',
+                        help='pg service of the DB for the import benchmarks')
+    parser.add_argument('--only', type=lambda value: value.split(','),
+                        default=list(BENCHMARK_GROUPS),
+                        help=f'Comma-separated benchmark groups to run, out '
+                             f'of: {", ".join(BENCHMARK_GROUPS)}')
+    parser.add_argument('--output', help='Path of the JSON results file')
+    parser.add_argument('--compare', nargs=2, metavar=('BEFORE', 'AFTER'),
+                        help='Compare two results files instead of running')
+    return parser.parse_args(arguments)
+
+
+def main():
+    args = parse_arguments()
+    if args.compare is not None:
+        compare(*args.compare)
+    else:
+        invalid_groups = set(args.only) - set(BENCHMARK_GROUPS)
+        if len(invalid_groups) > 0:
+            raise SystemExit(f'Invalid benchmark groups: {invalid_groups}')
+        results = run(args)
+        if args.output is not None:
+            with open(args.output, 'w') as fh:
+                json.dump(results, fh, indent=2)
+        else:
+            print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
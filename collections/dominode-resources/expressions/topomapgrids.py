@@ -1,8 +1,16 @@
+import functools
+import re
 import string
+import threading
 
 from qgis.core import *
 from qgis.gui import *
 
+CACHE_SIZE = 2 ** 16
+MAX_CACHED_CELLS = 2 ** 20
+
+SHEET_CODE_PATTERN = re.compile(r'^(?P<row_id>[A-Za-z]+)(?P<col_id>[0-9]+)$')
+
 
 @qgsfunction(args='auto', group='grid_stuff')
 def get_coord_row_id(depth, feature, parent, context):
@@ -28,51 +36,174 @@ def get_coord_col_id(depth, feature, parent, context):
     return col_id
 
 
-def _get_grid_coord_identifiers(feature, layer, depth):
-    num_rows, num_cols = _get_grid_params(feature, layer)
-    return find_coord_ids(feature['id'], num_rows, num_cols, depth)
+@qgsfunction(args='auto', group='grid_stuff')
+def get_grid_cell_geometry(
+        code, depth, origin_x, origin_y, cell_width, cell_height,
+        feature, parent, context
+):
+    """
+    Returns the geometry of the grid cell identified by a map sheet code,
+    without scanning the grid layer. The grid origin is its top left corner
+
+    <h2>Example usage:</h2>
+    <ul>
+      <li>get_grid_cell_geometry('AB12', 2, 0, 100, 10, 5) -> cell polygon</li>
+    </ul>
+    """
+
+    match = SHEET_CODE_PATTERN.match(code.strip())
+    if match is None:
+        raise ValueError(f'Invalid sheet code {code!r}')
+    row = decode_row_id(match.group('row_id'), int(depth))
+    col = decode_col_id(match.group('col_id'), int(depth))
+    left = origin_x + col * cell_width
+    top = origin_y - row * cell_height
+    return QgsGeometry.fromRect(
+        QgsRectangle(left, top - cell_height, left + cell_width, top))
 
 
-def _get_grid_params(feature, layer):
-    layer_extent = layer.extent()
-    layer_width = layer_extent.width()
-    layer_height = layer_extent.height()
+def _get_grid_coord_identifiers(feature, layer, depth):
     cell_width = feature['right'] - feature['left']
     cell_height = feature['top'] - feature['bottom']
-    num_cols = layer_width // cell_width
-    num_rows = layer_height // cell_height
-    return num_rows, num_cols
+    cell_key = (feature['id'], cell_width, cell_height)
+    with _grid_caches_lock:
+        grid_cache = _get_grid_cache(layer, depth)
+        result = grid_cache.codes.get(cell_key)
+        if result is None:
+            num_rows, num_cols = grid_cache.get_dimensions(
+                cell_width, cell_height)
+    if result is None:
+        result = find_coord_ids(feature['id'], num_rows, num_cols, depth)
+        with _grid_caches_lock:
+            if len(grid_cache.codes) >= MAX_CACHED_CELLS:
+                grid_cache.codes.clear()
+            grid_cache.codes[cell_key] = result
+    return result
+
+
+class _GridCache:
+    """Grid dimensions and identifiers that have been computed for a layer"""
+
+    def __init__(self, layer):
+        layer_extent = layer.extent()
+        self.layer_width = layer_extent.width()
+        self.layer_height = layer_extent.height()
+        self.dimensions = {}
+        self.codes = {}
+
+    def get_dimensions(self, cell_width, cell_height):
+        cell_size = (cell_width, cell_height)
+        try:
+            result = self.dimensions[cell_size]
+        except KeyError:
+            num_cols = self.layer_width // cell_width
+            num_rows = self.layer_height // cell_height
+            result = num_rows, num_cols
+            self.dimensions[cell_size] = result
+        return result
+
+
+_grid_caches = {}
+_watched_layers = set()
+# expressions are evaluated concurrently by rendering and Processing threads.
+# Reentrant, since invalidation may be triggered by a signal of the layer
+# while the cache is being filled
+_grid_caches_lock = threading.RLock()
+
+
+def _get_grid_cache(layer, depth) -> _GridCache:
+    """Return the cached grid parameters for the input layer and depth
+
+    Cached entries of a layer are discarded whenever its data or its data
+    source changes, which also covers changes in the layer's extent.
+
+    """
+
+    key = (layer.id(), depth)
+    with _grid_caches_lock:
+        try:
+            result = _grid_caches[key]
+        except KeyError:
+            if layer.id() not in _watched_layers:
+                _watched_layers.add(layer.id())
+                invalidate = functools.partial(
+                    invalidate_grid_cache, layer.id())
+                layer.dataChanged.connect(invalidate)
+                layer.dataSourceChanged.connect(invalidate)
+                layer.willBeDeleted.connect(
+                    functools.partial(_forget_layer, layer.id()))
+            result = _GridCache(layer)
+            _grid_caches[key] = result
+    return result
+
+
+def invalidate_grid_cache(layer_id: str, *args):
+    with _grid_caches_lock:
+        for key in [k for k in _grid_caches if k[0] == layer_id]:
+            del _grid_caches[key]
+
+
+def _forget_layer(layer_id: str):
+    with _grid_caches_lock:
+        invalidate_grid_cache(layer_id)
+        _watched_layers.discard(layer_id)
 
 
 def get_coords(cell: int, num_rows: int, num_cols: int):
     row = ((cell - 1) % num_rows) + 1
     col = (cell - row) / num_rows + 1
-    return row, int(col)
+    return int(row), int(col)
 
 
-def find_levels(coord: int, depth: int, result=None):
-    levels = result or []
-    if depth == 1:
-        levels.append(coord + 1)
-        return levels
-    else:
-        depth_treshold = 2 ** (depth - 1)
-        level = coord // depth_treshold + 1
-        levels.append(level)
-        new_coord = coord - depth_treshold * (level - 1)
-        return find_levels(new_coord, depth - 1, levels)
+def find_levels(coord: int, depth: int):
+    # the first level is the quotient of dividing by 2 ** (depth - 1), the
+    # remaining ones are the bits of the coordinate, offset by one. This is
+    # the same encoding used by the DomiNode processing scripts' gridcodes
+    # module
+    coord = int(coord)
+    shift = depth - 1
+    levels = [(coord >> shift) + 1]
+    for bit in range(shift - 1, -1, -1):
+        levels.append(((coord >> bit) & 1) + 1)
+    return levels
 
 
 def find_alphabetic_levels(coord, depth):
-    levels = find_levels(coord, depth)
-    result = []
-    for i in levels:
-        result.append(string.ascii_letters[i - 1])
-    return result
+    return [string.ascii_letters[i - 1] for i in find_levels(coord, depth)]
+
+
+@functools.lru_cache(maxsize=CACHE_SIZE)
+def encode_row_id(coord: int, depth: int) -> str:
+    return ''.join(find_alphabetic_levels(coord, depth))
+
+
+@functools.lru_cache(maxsize=CACHE_SIZE)
+def encode_col_id(coord: int, depth: int) -> str:
+    return ''.join(str(i) for i in find_levels(coord, depth))
 
 
 def find_coord_ids(cell, num_rows, num_cols, depth):
     row, col = get_coords(cell, num_rows, num_cols)
-    col_levels = find_levels(col - 1, depth)
-    row_levels = find_alphabetic_levels(row - 1, depth)
-    return ''.join(str(i) for i in row_levels), ''.join(str(i) for i in col_levels)
+    return encode_row_id(row - 1, depth), encode_col_id(col - 1, depth)
+
+
+def decode_row_id(row_id: str, depth: int) -> int:
+    code = row_id.lower()
+    if len(code) != depth:
+        raise ValueError(f'Invalid row code {row_id!r} for depth {depth}')
+    coord = string.ascii_lowercase.index(code[0])
+    for char in code[1:]:
+        coord = (coord << 1) | 'ab'.index(char)
+    return coord
+
+
+def decode_col_id(col_id: str, depth: int) -> int:
+    split_index = len(col_id) - (depth - 1)
+    if split_index < 1:
+        raise ValueError(f'Invalid column code {col_id!r} for depth {depth}')
+    coord = int(col_id[:split_index]) - 1
+    if coord < 0:
+        raise ValueError(f'Invalid column code {col_id!r} for depth {depth}')
+    for char in col_id[split_index:]:
+        coord = (coord << 1) | '12'.index(char)
+    return coord
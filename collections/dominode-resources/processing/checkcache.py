@@ -0,0 +1,187 @@
+"""Cache of checklist automation results
+
+Results are keyed on a fingerprint of the dataset, the algorithm that
+checked it and the check parameters, and are stored in an SQLite database
+in the QGIS profile directory. The least recently used results are evicted
+when the cache grows beyond its maximum number of entries.
+
+Fingerprints are cheap to compute: datasets are identified by the size
+and modification time of their files, including sidecar files like the .dbf
+of a shapefile or the write-ahead log of a GeoPackage, in addition to their
+source, feature count and extent.
+
+Only the results of file-based datasets without unsaved edits are cached.
+Other datasets, like database tables or in-memory layers, can change without
+any cheap way of noticing it, so their checks are always run.
+
+"""
+
+import contextlib
+import hashlib
+import json
+import os
+import sqlite3
+import time
+import typing
+
+from qgis.core import (
+    QgsApplication,
+    QgsMapLayer,
+)
+
+CACHE_FILE_NAME = 'dominode-check-results.sqlite'
+MAX_ENTRIES = 10000
+# files that hold part of a dataset, next to its main file
+SIDECAR_EXTENSIONS = {
+    '.shp': ('.shx', '.dbf', '.prj', '.cpg'),
+    '.mif': ('.mid',),
+    '.tab': ('.dat', '.map', '.id'),
+}
+# SQLite-based formats keep recent changes in a write-ahead log
+SQLITE_EXTENSIONS = ('.gpkg', '.sqlite', '.db')
+SQLITE_SIDECAR_SUFFIXES = ('-wal',)
+
+
+class CheckCache:
+
+    def __init__(
+            self,
+            path: typing.Optional[str] = None,
+            max_entries: int = MAX_ENTRIES
+    ):
+        self.path = path or get_cache_path()
+        self.max_entries = max_entries
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        with self._connect() as connection:
+            connection.execute(
+                'CREATE TABLE IF NOT EXISTS results ('
+                'key TEXT PRIMARY KEY, '
+                'value TEXT NOT NULL, '
+                'last_used REAL NOT NULL)'
+            )
+            connection.execute(
+                'CREATE INDEX IF NOT EXISTS results_last_used_idx '
+                'ON results (last_used)'
+            )
+
+    def get(self, key: str) -> typing.Tuple[bool, typing.Any]:
+        """Return whether the key was found and its cached value"""
+        with self._connect() as connection:
+            row = connection.execute(
+                'SELECT value FROM results WHERE key = ?', (key,)).fetchone()
+            if row is not None:
+                connection.execute(
+                    'UPDATE results SET last_used = ? WHERE key = ?',
+                    (time.time(), key)
+                )
+        if row is None:
+            return False, None
+        return True, json.loads(row[0])
+
+    def put(self, key: str, value: typing.Any):
+        with self._connect() as connection:
+            connection.execute(
+                'INSERT OR REPLACE INTO results (key, value, last_used) '
+                'VALUES (?, ?, ?)',
+                (key, json.dumps(value, default=str), time.time())
+            )
+            connection.execute(
+                'DELETE FROM results WHERE key IN ('
+                'SELECT key FROM results ORDER BY last_used DESC '
+                'LIMIT -1 OFFSET ?)',
+                (self.max_entries,)
+            )
+
+    def clear(self):
+        with self._connect() as connection:
+            connection.execute('DELETE FROM results')
+
+    @contextlib.contextmanager
+    def _connect(self) -> typing.Iterator[sqlite3.Connection]:
+        # a new connection each time, as checks run in worker threads
+        connection = sqlite3.connect(self.path, timeout=10)
+        try:
+            with connection:
+                yield connection
+        finally:
+            connection.close()
+
+
+def get_check_key(
+        layer: QgsMapLayer,
+        algorithm_id: str,
+        parameters: typing.Dict
+) -> str:
+    """Return the cache key of running a check on a layer"""
+    contents = json.dumps(
+        [get_layer_fingerprint(layer), algorithm_id, parameters],
+        sort_keys=True,
+        default=str
+    )
+    return hashlib.sha256(contents.encode('utf-8')).hexdigest()
+
+
+def get_layer_fingerprint(layer: QgsMapLayer) -> typing.Dict:
+    extent = layer.extent()
+    result = {
+        'provider': layer.providerType(),
+        'source': layer.source(),
+        'extent': [
+            extent.xMinimum(),
+            extent.yMinimum(),
+            extent.xMaximum(),
+            extent.yMaximum(),
+        ],
+    }
+    if layer.type() == QgsMapLayer.VectorLayer:
+        result['feature_count'] = layer.featureCount()
+    else:
+        result['size'] = [layer.width(), layer.height()]
+    result['files'] = []
+    for path in get_source_paths(layer.source()):
+        stat = os.stat(path)
+        result['files'].append(
+            [os.path.basename(path), stat.st_size, stat.st_mtime_ns])
+    return result
+
+
+def is_cacheable(layer: QgsMapLayer) -> bool:
+    """Return whether the check results of a layer can be cached
+
+    Only file-based layers can be fingerprinted reliably, and only while
+    they have no unsaved edits.
+
+    """
+
+    if layer.type() == QgsMapLayer.VectorLayer and layer.isModified():
+        return False
+    return len(get_source_paths(layer.source())) > 0
+
+
+def get_source_paths(source: str) -> typing.List[str]:
+    """Return the paths of the files behind a layer source, if any
+
+    The main file comes first, followed by its existing sidecar files.
+
+    """
+
+    path = source.split('|')[0]
+    if not os.path.isfile(path):
+        return []
+    base, extension = os.path.splitext(path)
+    candidates = [
+        base + (
+            sidecar_extension.upper() if extension.isupper()
+            else sidecar_extension
+        ) for sidecar_extension in SIDECAR_EXTENSIONS.get(
+            extension.lower(), ())
+    ]
+    if extension.lower() in SQLITE_EXTENSIONS:
+        candidates.extend(path + suffix for suffix in SQLITE_SIDECAR_SUFFIXES)
+    return [path] + [
+        candidate for candidate in candidates if os.path.isfile(candidate)]
+
+
+def get_cache_path() -> str:
+    return os.path.join(
+        QgsApplication.qgisSettingsDirPath(), 'dominode', CACHE_FILE_NAME)
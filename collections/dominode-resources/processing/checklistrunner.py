@@ -0,0 +1,475 @@
+import concurrent.futures
+import datetime
+import json
+import os
+import re
+import sys
+import typing
+
+from qgis.core import (
+    QgsApplication,
+    QgsMapLayer,
+    QgsProcessing,
+    QgsProcessingAlgorithm,
+    QgsProcessingContext,
+    QgsProcessingException,
+    QgsProcessingFeedback,
+    QgsProcessingOutputNumber,
+    QgsProcessingOutputString,
+    QgsProcessingParameterBoolean,
+    QgsProcessingParameterDefinition,
+    QgsProcessingParameterFile,
+    QgsProcessingParameterFolderDestination,
+    QgsProcessingParameterMultipleLayers,
+    QgsProcessingParameterNumber,
+    QgsRasterLayer,
+    QgsVectorLayer,
+)
+from qgis.PyQt.QtCore import (
+    QCoreApplication,
+    Qt,
+)
+
+_SCRIPTS_DIR = os.path.dirname(os.path.abspath(__file__))
+if _SCRIPTS_DIR not in sys.path:
+    sys.path.append(_SCRIPTS_DIR)
+
+from checkcache import (  # noqa: E402
+    CheckCache,
+    get_check_key,
+    is_cacheable,
+)
+from instrumentation import instrumented  # noqa: E402
+from staticvalidators import get_static_output  # noqa: E402
+
+IN_MEMORY_PROVIDERS = ('memory',)
+
+
+class Dataset(typing.NamedTuple):
+    name: str
+    source: str
+    provider: str
+    layer_type: str
+    in_memory_layer: typing.Optional[QgsMapLayer] = None
+    cacheable: bool = False
+
+
+class CheckJob(typing.NamedTuple):
+    dataset_index: int
+    check_index: int
+    dataset: Dataset
+    automation: typing.Optional[typing.Dict]
+
+
+class CheckResult(typing.NamedTuple):
+    validated: bool
+    notes: str = ''
+
+
+@instrumented
+class DomiNodeChecklistRunner(QgsProcessingAlgorithm):
+    INPUT_CHECKLIST = 'INPUT_CHECKLIST'
+    INPUT_LAYERS = 'INPUT_LAYERS'
+    INPUT_WORKERS = 'INPUT_WORKERS'
+    INPUT_USE_CACHE = 'INPUT_USE_CACHE'
+    OUTPUT_FOLDER = 'OUTPUT_FOLDER'
+    OUTPUT_REPORTS = 'OUTPUT_REPORTS'
+    OUTPUT_NUM_VALID = 'OUTPUT_NUM_VALID'
+    OUTPUT_NUM_INVALID = 'OUTPUT_NUM_INVALID'
+
+    def tr(self, string):
+        return QCoreApplication.translate('Processing', string)
+
+    def createInstance(self):
+        return self.__class__()
+
+    def name(self):
+        return 'dominodechecklistrunner'
+
+    def displayName(self):
+        return self.tr('Run checklist on many datasets')
+
+    def group(self):
+        return self.tr('DomiNode')
+
+    def groupId(self):
+        return 'dominode'
+
+    def shortHelpString(self):
+        return self.tr(
+            'Runs the automated checks of a checklist on each input dataset '
+            'and produces one validation report per dataset.\n\n'
+            'Each dataset and check pair is an independent job. Jobs run '
+            'concurrently, each with its own processing context and its own '
+            'copy of the dataset, loaded from its source. In-memory datasets, '
+            'which cannot be reloaded, and algorithms that do not support '
+            'threads are checked one at a time instead, on the calling '
+            'thread. Checks without automation cannot be run and are '
+            'reported as not validated.\n\n'
+            'Check results of file-based datasets are cached locally and '
+            'reused while the dataset files do not change, unless the cache '
+            'is disabled. Datasets that are not files, like database tables '
+            'and in-memory layers, or that have unsaved edits, are always '
+            'checked.\n\n'
+            'Reports are returned as a JSON list, in the same format that '
+            'the DomiNode report uploaders consume, and are optionally '
+            'written to a folder, one JSON file per dataset. Files are named '
+            'after their dataset, with characters that are not allowed in '
+            'file names replaced and a numeric suffix added when datasets '
+            'share a name.'
+        )
+
+    def initAlgorithm(self, config=None):
+        self.addParameter(
+            QgsProcessingParameterFile(
+                self.INPUT_CHECKLIST,
+                self.tr('Checklist'),
+                extension='json'
+            )
+        )
+        self.addParameter(
+            QgsProcessingParameterMultipleLayers(
+                self.INPUT_LAYERS,
+                self.tr('Datasets to validate'),
+                QgsProcessing.TypeMapLayer
+            )
+        )
+        self.addParameter(
+            QgsProcessingParameterNumber(
+                self.INPUT_WORKERS,
+                self.tr('Number of checks to run in parallel'),
+                defaultValue=os.cpu_count() or 1,
+                minValue=1
+            )
+        )
+        self.addParameter(
+            QgsProcessingParameterBoolean(
+                self.INPUT_USE_CACHE,
+                self.tr('Reuse the results of unchanged datasets'),
+                defaultValue=True
+            )
+        )
+        self.addParameter(
+            QgsProcessingParameterFolderDestination(
+                self.OUTPUT_FOLDER,
+                self.tr('Folder for the validation reports'),
+                optional=True,
+                createByDefault=False
+            )
+        )
+        self.addOutput(
+            QgsProcessingOutputString(
+                self.OUTPUT_REPORTS,
+                self.tr('Validation reports (JSON)')
+            )
+        )
+        self.addOutput(
+            QgsProcessingOutputNumber(
+                self.OUTPUT_NUM_VALID,
+                self.tr('Number of valid datasets')
+            )
+        )
+        self.addOutput(
+            QgsProcessingOutputNumber(
+                self.OUTPUT_NUM_INVALID,
+                self.tr('Number of invalid datasets')
+            )
+        )
+
+    def processAlgorithm(self, parameters, context, feedback):
+        checklist = load_checklist(
+            self.parameterAsFile(parameters, self.INPUT_CHECKLIST, context))
+        datasets = [
+            Dataset(
+                layer.name(),
+                layer.source(),
+                layer.providerType(),
+                get_layer_type(layer),
+                layer if layer.providerType() in IN_MEMORY_PROVIDERS else None,
+                is_cacheable(layer)
+            ) for layer in self.parameterAsLayerList(
+                parameters, self.INPUT_LAYERS, context)
+        ]
+        workers = self.parameterAsInt(parameters, self.INPUT_WORKERS, context)
+        use_cache = self.parameterAsBool(
+            parameters, self.INPUT_USE_CACHE, context)
+        cache = CheckCache() if use_cache else None
+        output_folder = self.parameterAsString(
+            parameters, self.OUTPUT_FOLDER, context)
+        jobs = build_jobs(datasets, checklist)
+        feedback.pushInfo(
+            f'Running {len(jobs)} checks on {len(datasets)} datasets...')
+        results = {}
+        job_feedbacks = [QgsProcessingFeedback() for _ in jobs]
+        for job_feedback in job_feedbacks:
+            # a direct connection, since this thread is busy while it runs
+            # its own checks and could not handle queued signals
+            feedback.canceled.connect(
+                job_feedback.cancel, Qt.DirectConnection)
+        with concurrent.futures.ThreadPoolExecutor(workers) as executor:
+            futures = {
+                executor.submit(
+                    run_check, job.dataset, job.automation, job_feedback, cache
+                ): job for job, job_feedback in zip(jobs, job_feedbacks)
+                if not must_run_on_calling_thread(job)
+            }
+            # the other jobs run one at a time on this thread, while the
+            # workers run the rest
+            for job, job_feedback in zip(jobs, job_feedbacks):
+                if (not must_run_on_calling_thread(job) or
+                        feedback.isCanceled()):
+                    continue
+                future = concurrent.futures.Future()
+                try:
+                    future.set_result(
+                        run_check(
+                            job.dataset, job.automation, job_feedback, cache)
+                    )
+                except Exception as exc:
+                    future.set_exception(exc)
+                futures[future] = job
+            pending = set(futures)
+            while len(pending) > 0:
+                done, pending = concurrent.futures.wait(
+                    pending,
+                    timeout=0.5,
+                    return_when=concurrent.futures.FIRST_COMPLETED
+                )
+                if feedback.isCanceled():
+                    for job_feedback in job_feedbacks:
+                        job_feedback.cancel()
+                for future in done:
+                    job = futures[future]
+                    try:
+                        result = future.result()
+                    except Exception as exc:
+                        result = CheckResult(False, str(exc))
+                    results[(job.dataset_index, job.check_index)] = result
+                feedback.setProgress(int(len(results) * 100 / len(jobs)))
+        if feedback.isCanceled():
+            return {}
+
+        reports = []
+        for dataset_index, dataset in enumerate(datasets):
+            report = build_report(
+                dataset,
+                checklist,
+                [
+                    results[(dataset_index, check_index)]
+                    for check_index in range(len(checklist['checks']))
+                ]
+            )
+            feedback.pushInfo(
+                f'{dataset.name!r} is '
+                f'{"valid" if report["dataset_is_valid"] else "invalid"}'
+            )
+            reports.append(report)
+        if output_folder:
+            write_reports(reports, output_folder)
+        num_valid = sum(1 for report in reports if report['dataset_is_valid'])
+        self.metrics.add_features(len(jobs))
+        return {
+            self.OUTPUT_FOLDER: output_folder or None,
+            self.OUTPUT_REPORTS: json.dumps(reports),
+            self.OUTPUT_NUM_VALID: num_valid,
+            self.OUTPUT_NUM_INVALID: len(reports) - num_valid,
+        }
+
+
+def load_checklist(path: str) -> typing.Dict:
+    with open(path, encoding='utf-8') as fh:
+        result = json.load(fh)
+    if len(result.get('checks', [])) == 0:
+        raise QgsProcessingException(f'Checklist {path!r} has no checks')
+    return result
+
+
+def get_layer_type(layer: QgsMapLayer) -> str:
+    return 'raster' if layer.type() == QgsMapLayer.RasterLayer else 'vector'
+
+
+def build_jobs(
+        datasets: typing.List[Dataset],
+        checklist: typing.Dict
+) -> typing.List[CheckJob]:
+    """Return a job for each pair of dataset and check"""
+    return [
+        CheckJob(dataset_index, check_index, dataset, check.get('automation'))
+        for dataset_index, dataset in enumerate(datasets)
+        for check_index, check in enumerate(checklist['checks'])
+    ]
+
+
+def must_run_on_calling_thread(job: CheckJob) -> bool:
+    """Return whether a job cannot run in a worker thread
+
+    In-memory datasets cannot be reloaded from their source, so their
+    checks use the layer itself, which belongs to the calling thread. Some
+    algorithms declare that they do not support running in threads.
+
+    """
+
+    if job.automation is None:
+        return False
+    if job.dataset.in_memory_layer is not None:
+        return True
+    algorithm = QgsApplication.processingRegistry().algorithmById(
+        job.automation['algorithm_id'])
+    return (
+        algorithm is not None and
+        bool(algorithm.flags() & QgsProcessingAlgorithm.FlagNoThreading)
+    )
+
+
+def run_check(
+        dataset: Dataset,
+        automation: typing.Optional[typing.Dict],
+        feedback: QgsProcessingFeedback,
+        cache: typing.Optional[CheckCache] = None
+) -> CheckResult:
+    """Run the automation of a check on a dataset
+
+    This usually runs in a worker thread, so the algorithm and the dataset
+    layer are created here, rather than sharing the objects of the main
+    thread. In-memory datasets cannot be reloaded, so their own layer is
+    used instead, which requires running on the thread that owns it.
+
+    Checks of static validators, whose outputs are known in advance, are
+    resolved without creating the algorithm or loading the dataset.
+
+    When a cache is given and the dataset is cacheable, the result of a
+    previous run on the same, unchanged, dataset is reused.
+
+    """
+
+    if automation is None:
+        return CheckResult(False, 'This check has no automation')
+    negate = automation.get('negate_output', False)
+    is_static, value = get_static_output(
+        automation['algorithm_id'], automation['output_name'])
+    if is_static:
+        return CheckResult(evaluate_output(value, negate))
+    algorithm = QgsApplication.processingRegistry().createAlgorithmById(
+        automation['algorithm_id'])
+    if algorithm is None:
+        raise QgsProcessingException(
+            f'Unknown algorithm {automation["algorithm_id"]!r}')
+    context = QgsProcessingContext()
+    if dataset.in_memory_layer is not None:
+        layer = dataset.in_memory_layer
+    else:
+        layer = load_dataset_layer(dataset)
+        context.temporaryLayerStore().addMapLayer(layer)
+    if not dataset.cacheable:
+        cache = None
+    key = None
+    found = False
+    if cache is not None:
+        key = get_check_key(
+            layer,
+            automation['algorithm_id'],
+            {
+                'artifact_parameter_name':
+                    automation['artifact_parameter_name'],
+                'output_name': automation['output_name'],
+            }
+        )
+        found, value = cache.get(key)
+    if not found:
+        parameters = {automation['artifact_parameter_name']: layer}
+        for definition in algorithm.destinationParameterDefinitions():
+            # optional outputs are not needed for evaluating the check
+            if not definition.flags() & (
+                    QgsProcessingParameterDefinition.FlagOptional):
+                parameters[definition.name()] = (
+                    QgsProcessing.TEMPORARY_OUTPUT)
+        outputs, ok = algorithm.run(parameters, context, feedback)
+        if not ok:
+            raise QgsProcessingException(
+                f'Could not run {automation["algorithm_id"]!r}')
+        value = outputs[automation['output_name']]
+        if cache is not None:
+            cache.put(key, value)
+    return CheckResult(
+        evaluate_output(value, negate),
+        'Reused the result of a previous run' if found else ''
+    )
+
+
+def load_dataset_layer(dataset: Dataset) -> QgsMapLayer:
+    if dataset.provider in IN_MEMORY_PROVIDERS:
+        # reloading the source would give an empty layer
+        raise QgsProcessingException(
+            f'In-memory dataset {dataset.name!r} cannot be reloaded')
+    if dataset.layer_type == 'raster':
+        result = QgsRasterLayer(dataset.source, dataset.name, dataset.provider)
+    else:
+        result = QgsVectorLayer(dataset.source, dataset.name, dataset.provider)
+    if not result.isValid():
+        raise QgsProcessingException(f'Invalid dataset {dataset.source!r}')
+    return result
+
+
+def evaluate_output(value: typing.Any, negate: bool = False) -> bool:
+    result = bool(value)
+    return not result if negate else result
+
+
+def build_report(
+        dataset: Dataset,
+        checklist: typing.Dict,
+        results: typing.List[CheckResult]
+) -> typing.Dict:
+    """Return the validation report of a dataset"""
+    return {
+        'dataset': dataset.name,
+        'dataset_type': checklist['dataset_type'],
+        'artifact_type': checklist['validation_artifact_type'],
+        'dataset_is_valid': all(result.validated for result in results),
+        'generated': datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        'checklist': checklist['name'],
+        'description': checklist['description'],
+        'checks': [
+            {
+                'name': check['name'],
+                'description': check['description'],
+                'validated': result.validated,
+                'notes': result.notes,
+            } for check, result in zip(checklist['checks'], results)
+        ],
+    }
+
+
+def write_reports(reports: typing.List[typing.Dict], folder: str):
+    os.makedirs(folder, exist_ok=True)
+    for report, file_name in zip(
+            reports, get_report_file_names(reports)):
+        path = os.path.join(folder, file_name)
+        with open(path, 'w', encoding='utf-8') as fh:
+            json.dump(report, fh, indent=2)
+
+
+def get_report_file_names(
+        reports: typing.List[typing.Dict]
+) -> typing.List[str]:
+    """Return a distinct, safe file name for each report
+
+    Names are based on the dataset name, with path separators and other
+    characters that are not allowed in file names replaced. Datasets that
+    share a name get a numeric suffix.
+
+    """
+
+    result = []
+    used = set()
+    for report in reports:
+        stem = re.sub(
+            r'[^\w.-]', '_', str(report['dataset'])).strip('.') or 'dataset'
+        file_name = f'{stem}.json'
+        suffix = 1
+        while file_name.lower() in used:
+            suffix += 1
+            file_name = f'{stem}_{suffix}.json'
+        used.add(file_name.lower())
+        result.append(file_name)
+    return result
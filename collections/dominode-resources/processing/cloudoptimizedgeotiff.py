@@ -0,0 +1,339 @@
+import concurrent.futures
+import os
+import sys
+import tempfile
+import typing
+
+from osgeo import gdal
+from qgis.core import (
+    QgsProcessing,
+    QgsProcessingAlgorithm,
+    QgsProcessingException,
+    QgsProcessingOutputString,
+    QgsProcessingParameterEnum,
+    QgsProcessingParameterFolderDestination,
+    QgsProcessingParameterMultipleLayers,
+    QgsProcessingParameterNumber,
+)
+from qgis.PyQt.QtCore import QCoreApplication
+
+_SCRIPTS_DIR = os.path.dirname(os.path.abspath(__file__))
+if _SCRIPTS_DIR not in sys.path:
+    sys.path.append(_SCRIPTS_DIR)
+
+from instrumentation import instrumented  # noqa: E402
+
+
+@instrumented
+class DomiNodeCloudOptimizedGeoTiff(QgsProcessingAlgorithm):
+    INPUT = 'INPUT'
+    INPUT_COMPRESSION = 'COMPRESSION'
+    INPUT_COMPRESSION_LEVEL = 'COMPRESSION_LEVEL'
+    INPUT_PREDICTOR = 'PREDICTOR'
+    INPUT_RESAMPLING = 'RESAMPLING'
+    INPUT_WORKERS = 'WORKERS'
+    OUTPUT = 'OUTPUT'
+    OUTPUT_FILES = 'OUTPUT_FILES'
+
+    COMPRESSIONS = ['DEFLATE', 'LZW', 'ZSTD', 'JPEG', 'NONE']
+    PREDICTORS = ['NO', 'STANDARD', 'FLOATING_POINT']
+    RESAMPLING_METHODS = [
+        'NEAREST', 'AVERAGE', 'BILINEAR', 'CUBIC', 'LANCZOS', 'MODE']
+    # range of the compression level of each codec that has one
+    COMPRESSION_LEVELS = {'DEFLATE': (1, 9), 'ZSTD': (1, 22)}
+
+    def tr(self, string):
+        return QCoreApplication.translate('Processing', string)
+
+    def createInstance(self):
+        return self.__class__()
+
+    def name(self):
+        """
+        Returns the unique algorithm name.
+        """
+        return 'cloudoptimizedgeotiff'
+
+    def displayName(self):
+        """
+        Returns the translated algorithm name.
+        """
+        return self.tr('Generate Cloud Optimized GeoTIFFs')
+
+    def group(self):
+        """
+        Returns the name of the group this algorithm belongs to.
+        """
+        return self.tr('DomiNode')
+
+    def groupId(self):
+        """
+        Returns the unique ID of the group this algorithm belongs
+        to.
+        """
+        return 'dominode'
+
+    def shortHelpString(self):
+        """
+        Returns a localised short help string for the algorithm.
+        """
+        return self.tr(
+            'Convert rasters to tiled Cloud Optimized GeoTIFFs, with '
+            'overviews, in a single pass. Source rasters are never '
+            'modified. Multiple rasters can be converted concurrently, with '
+            'the CPU cores divided between the conversions. Outputs are '
+            'written to the output folder, with the same name as their '
+            'source.\n\n'
+            'The compression level is only supported by DEFLATE (1 to 9) '
+            'and ZSTD (1 to 22). JPEG compression cannot be combined with a '
+            'predictor'
+        )
+
+    def initAlgorithm(self, config=None):
+        self.addParameter(
+            QgsProcessingParameterMultipleLayers(
+                self.INPUT,
+                self.tr('Input rasters'),
+                QgsProcessing.TypeRaster
+            )
+        )
+        self.addParameter(
+            QgsProcessingParameterEnum(
+                self.INPUT_COMPRESSION,
+                self.tr('Compression'),
+                options=self.COMPRESSIONS,
+                defaultValue=0
+            )
+        )
+        self.addParameter(
+            QgsProcessingParameterNumber(
+                self.INPUT_COMPRESSION_LEVEL,
+                self.tr('Compression level (DEFLATE 1-9, ZSTD 1-22)'),
+                minValue=1,
+                maxValue=22,
+                optional=True
+            )
+        )
+        self.addParameter(
+            QgsProcessingParameterEnum(
+                self.INPUT_PREDICTOR,
+                self.tr('Predictor'),
+                options=self.PREDICTORS,
+                defaultValue=0
+            )
+        )
+        self.addParameter(
+            QgsProcessingParameterEnum(
+                self.INPUT_RESAMPLING,
+                self.tr('Overview resampling method'),
+                options=self.RESAMPLING_METHODS,
+                defaultValue=0
+            )
+        )
+        self.addParameter(
+            QgsProcessingParameterNumber(
+                self.INPUT_WORKERS,
+                self.tr('Number of rasters to convert concurrently'),
+                defaultValue=1,
+                minValue=1
+            )
+        )
+        self.addParameter(
+            QgsProcessingParameterFolderDestination(
+                self.OUTPUT,
+                self.tr('Output folder')
+            )
+        )
+        self.addOutput(
+            QgsProcessingOutputString(
+                self.OUTPUT_FILES,
+                self.tr('Generated files')
+            )
+        )
+
+    def processAlgorithm(self, parameters, context, feedback):
+        sources = [
+            layer.source() for layer in self.parameterAsLayerList(
+                parameters, self.INPUT, context)
+        ]
+        output_folder = self.parameterAsString(
+            parameters, self.OUTPUT, context)
+        os.makedirs(output_folder, exist_ok=True)
+        level = None
+        if parameters.get(self.INPUT_COMPRESSION_LEVEL) is not None:
+            level = self.parameterAsInt(
+                parameters, self.INPUT_COMPRESSION_LEVEL, context)
+        compression = self.COMPRESSIONS[
+            self.parameterAsEnum(parameters, self.INPUT_COMPRESSION, context)]
+        predictor = self.PREDICTORS[
+            self.parameterAsEnum(parameters, self.INPUT_PREDICTOR, context)]
+        if level is not None:
+            if compression not in self.COMPRESSION_LEVELS:
+                raise QgsProcessingException(
+                    self.tr(
+                        '{} compression does not support a compression level'
+                    ).format(compression)
+                )
+            min_level, max_level = self.COMPRESSION_LEVELS[compression]
+            if not min_level <= level <= max_level:
+                raise QgsProcessingException(
+                    self.tr(
+                        'The {} compression level must be between {} and {}'
+                    ).format(compression, min_level, max_level)
+                )
+        if compression == 'JPEG' and predictor != 'NO':
+            raise QgsProcessingException(
+                self.tr('JPEG compression cannot be used with a predictor'))
+        workers = self.parameterAsInt(parameters, self.INPUT_WORKERS, context)
+        options = CogOptions(
+            compression=compression,
+            level=level,
+            predictor=predictor,
+            resampling=self.RESAMPLING_METHODS[
+                self.parameterAsEnum(parameters, self.INPUT_RESAMPLING, context)],
+            # concurrent conversions share the CPU cores
+            num_threads=max(1, (os.cpu_count() or 1) // workers),
+        )
+        jobs = {
+            source: os.path.join(
+                output_folder,
+                f'{os.path.splitext(os.path.basename(source))[0]}.tif'
+            ) for source in sources
+        }
+        if len(set(jobs.values())) != len(jobs):
+            raise QgsProcessingException(
+                self.tr('Input rasters must have different file names'))
+        generated = []
+        num_done = 0
+        with concurrent.futures.ThreadPoolExecutor(workers) as executor:
+            futures = {
+                executor.submit(
+                    generate_cog, source, destination, options): source
+                for source, destination in jobs.items()
+            }
+            for future in concurrent.futures.as_completed(futures):
+                if feedback.isCanceled():
+                    for pending in futures:
+                        pending.cancel()
+                    break
+                source = futures[future]
+                try:
+                    generated.append(future.result())
+                except RuntimeError as exc:
+                    feedback.reportError(
+                        f'Could not convert {source!r}: {exc}')
+                else:
+                    feedback.pushInfo(f'Generated {jobs[source]!r}')
+                num_done += 1
+                feedback.setProgress(int(num_done * 100 / len(jobs)))
+        return {
+            self.OUTPUT: output_folder,
+            self.OUTPUT_FILES: ','.join(generated),
+        }
+
+
+class CogOptions(typing.NamedTuple):
+    compression: str
+    level: typing.Optional[int]
+    predictor: str
+    resampling: str
+    num_threads: int = 1
+
+
+def generate_cog(source: str, destination: str, options: CogOptions) -> str:
+    """Convert a raster to a Cloud Optimized GeoTIFF
+
+    GDAL's COG driver is used when available (GDAL >= 3.1). It builds the
+    overviews itself, without modifying the source. With older GDAL versions
+    the overviews are built for a VRT of the source, in a temporary folder,
+    and are then copied into a tiled GeoTIFF.
+
+    Each conversion uses ``options.num_threads`` threads.
+
+    This runs in worker threads, so GDAL's process-wide settings, like its
+    exception mode, are left untouched. Errors are read from the error state
+    of the current thread instead and raised as RuntimeError.
+
+    Returns the path of the generated file.
+
+    """
+
+    gdal.PushErrorHandler('CPLQuietErrorHandler')
+    try:
+        gdal.ErrorReset()
+        if gdal.GetDriverByName('COG') is not None:
+            creation_options = [
+                f'NUM_THREADS={options.num_threads}',
+                f'COMPRESS={options.compression}',
+                f'PREDICTOR={options.predictor}',
+                f'OVERVIEW_RESAMPLING={options.resampling}',
+            ]
+            if options.level is not None:
+                creation_options.append(f'LEVEL={options.level}')
+            dataset = gdal.Translate(
+                destination,
+                source,
+                format='COG',
+                creationOptions=creation_options
+            )
+            _check_gdal_result(dataset is not None, 'Could not create COG')
+            dataset = None
+        else:
+            _generate_tiled_geotiff(source, destination, options)
+    finally:
+        gdal.PopErrorHandler()
+    return destination
+
+
+def _generate_tiled_geotiff(
+        source: str,
+        destination: str,
+        options: CogOptions
+):
+    predictors = {'NO': 1, 'STANDARD': 2, 'FLOATING_POINT': 3}
+    creation_options = [
+        'TILED=YES',
+        'COPY_SRC_OVERVIEWS=YES',
+        f'NUM_THREADS={options.num_threads}',
+        f'COMPRESS={options.compression}',
+        f'PREDICTOR={predictors[options.predictor]}',
+    ]
+    if options.level is not None:
+        if options.compression == 'ZSTD':
+            creation_options.append(f'ZSTD_LEVEL={options.level}')
+        else:
+            creation_options.append(f'ZLEVEL={options.level}')
+    with tempfile.TemporaryDirectory() as temporary_folder:
+        vrt_path = os.path.join(temporary_folder, 'source.vrt')
+        vrt = gdal.Translate(vrt_path, source, format='VRT')
+        _check_gdal_result(vrt is not None, 'Could not read source')
+        overview_levels = []
+        factor = 2
+        while min(vrt.RasterXSize, vrt.RasterYSize) // factor >= 256:
+            overview_levels.append(factor)
+            factor *= 2
+        # only for this thread, restoring any previous value afterwards
+        previous_num_threads = gdal.GetThreadLocalConfigOption(
+            'GDAL_NUM_THREADS', None)
+        gdal.SetThreadLocalConfigOption(
+            'GDAL_NUM_THREADS', str(options.num_threads))
+        try:
+            error = vrt.BuildOverviews(options.resampling, overview_levels)
+        finally:
+            gdal.SetThreadLocalConfigOption(
+                'GDAL_NUM_THREADS', previous_num_threads)
+        _check_gdal_result(error == 0, 'Could not build overviews')
+        dataset = gdal.Translate(
+            destination,
+            vrt,
+            format='GTiff',
+            creationOptions=creation_options
+        )
+        _check_gdal_result(dataset is not None, 'Could not create GeoTIFF')
+        dataset = None
+        vrt = None
+
+
+def _check_gdal_result(succeeded: bool, message: str):
+    if not succeeded:
+        raise RuntimeError(f'{message}: {gdal.GetLastErrorMsg()}')
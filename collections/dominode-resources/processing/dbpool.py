@@ -0,0 +1,207 @@
+"""Pooled PostgreSQL connections for the DomiNode processing scripts
+
+Connections are pooled per pg service name and shared by all scripts that
+run in the same QGIS process. Idle connections are checked for health
+before being reused and are closed after being idle for too long.
+
+"""
+
+import contextlib
+import threading
+import time
+import typing
+
+import psycopg2
+import psycopg2.extensions
+
+MAX_CONNECTIONS = 4
+CHECKOUT_TIMEOUT = 30
+MAX_IDLE_SECONDS = 300
+HEALTH_CHECK_INTERVAL = 30
+
+
+class ConnectionPool:
+    """A bounded pool of connections to a single pg service"""
+
+    def __init__(
+            self,
+            service: str,
+            max_connections: int = MAX_CONNECTIONS,
+            max_idle_seconds: float = MAX_IDLE_SECONDS,
+            health_check_interval: float = HEALTH_CHECK_INTERVAL,
+    ):
+        self.service = service
+        self.max_connections = max_connections
+        self.max_idle_seconds = max_idle_seconds
+        self.health_check_interval = health_check_interval
+        self._idle = []
+        self._num_checked_out = 0
+        self._condition = threading.Condition()
+
+    def checkout(
+            self,
+            timeout: float = CHECKOUT_TIMEOUT
+    ) -> psycopg2.extensions.connection:
+        """Get a connection from the pool
+
+        Waits for up to ``timeout`` seconds for a connection to be returned
+        to the pool when all connections are already checked out, and then
+        raises TimeoutError.
+
+        """
+
+        deadline = time.monotonic() + timeout
+        with self._condition:
+            while True:
+                self._evict_idle()
+                if len(self._idle) > 0:
+                    connection, last_used = self._idle.pop()
+                    break
+                elif self._num_checked_out < self.max_connections:
+                    connection, last_used = None, None
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise TimeoutError(
+                        f'Timed out waiting for a connection to the '
+                        f'{self.service!r} service'
+                    )
+                self._condition.wait(remaining)
+            self._num_checked_out += 1
+        try:
+            if connection is not None:
+                idle_time = time.monotonic() - last_used
+                if idle_time > self.health_check_interval and \
+                        not is_healthy(connection):
+                    _close_quietly(connection)
+                    connection = None
+            if connection is None:
+                connection = psycopg2.connect(service=self.service)
+        except Exception:
+            self._release()
+            raise
+        return connection
+
+    def checkin(
+            self,
+            connection: psycopg2.extensions.connection,
+            discard: bool = False
+    ):
+        """Return a connection to the pool
+
+        Connections that are closed, broken or explicitly discarded are
+        closed instead of being kept for reuse.
+
+        """
+
+        if not discard and not connection.closed:
+            try:
+                if connection.status != psycopg2.extensions.STATUS_READY:
+                    connection.rollback()
+            except psycopg2.Error:
+                discard = True
+        if discard or connection.closed:
+            _close_quietly(connection)
+        else:
+            with self._condition:
+                self._idle.append((connection, time.monotonic()))
+        self._release()
+
+    @contextlib.contextmanager
+    def connection(
+            self,
+            timeout: float = CHECKOUT_TIMEOUT
+    ) -> typing.Iterator[psycopg2.extensions.connection]:
+        """Check out a connection for the duration of a transaction
+
+        The transaction is committed if the block finishes successfully and
+        rolled back otherwise.
+
+        """
+
+        connection = self.checkout(timeout)
+        discard = False
+        try:
+            yield connection
+            connection.commit()
+        except Exception:
+            try:
+                connection.rollback()
+            except psycopg2.Error:
+                discard = True
+            raise
+        finally:
+            self.checkin(connection, discard=discard)
+
+    def close(self):
+        with self._condition:
+            for connection, _ in self._idle:
+                _close_quietly(connection)
+            self._idle = []
+
+    def _release(self):
+        with self._condition:
+            self._num_checked_out -= 1
+            self._condition.notify()
+
+    def _evict_idle(self):
+        now = time.monotonic()
+        keep = []
+        for connection, last_used in self._idle:
+            if now - last_used > self.max_idle_seconds:
+                _close_quietly(connection)
+            else:
+                keep.append((connection, last_used))
+        self._idle = keep
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def get_pool(
+        service: str,
+        max_connections: int = MAX_CONNECTIONS
+) -> ConnectionPool:
+    """Return the pool of connections to the input pg service
+
+    The pool is enlarged when more connections are requested than its
+    current maximum.
+
+    """
+
+    with _pools_lock:
+        try:
+            result = _pools[service]
+        except KeyError:
+            result = ConnectionPool(service, max_connections=max_connections)
+            _pools[service] = result
+        result.max_connections = max(result.max_connections, max_connections)
+    return result
+
+
+def pooled_connection(
+        service: str,
+        timeout: float = CHECKOUT_TIMEOUT
+) -> typing.ContextManager[psycopg2.extensions.connection]:
+    """Check out a connection to the input pg service from its pool"""
+    return get_pool(service).connection(timeout)
+
+
+def is_healthy(connection: psycopg2.extensions.connection) -> bool:
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT 1')
+        connection.rollback()
+    except psycopg2.Error:
+        result = False
+    else:
+        result = not connection.closed
+    return result
+
+
+def _close_quietly(connection: psycopg2.extensions.connection):
+    try:
+        connection.close()
+    except psycopg2.Error:
+        pass
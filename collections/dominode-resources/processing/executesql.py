@@ -0,0 +1,94 @@
+import os
+import sys
+
+import psycopg2
+from qgis.core import (
+    QgsProcessingAlgorithm,
+    QgsProcessingException,
+    QgsProcessingParameterString,
+)
+from qgis.PyQt.QtCore import QCoreApplication
+
+_SCRIPTS_DIR = os.path.dirname(os.path.abspath(__file__))
+if _SCRIPTS_DIR not in sys.path:
+    sys.path.append(_SCRIPTS_DIR)
+
+from dbpool import pooled_connection  # noqa: E402
+from instrumentation import instrumented  # noqa: E402
+
+
+@instrumented
+class DomiNodeExecuteSql(QgsProcessingAlgorithm):
+
+    INPUT_DATABASE = 'DATABASE'
+    INPUT_SQL = 'SQL'
+
+    def tr(self, string):
+        return QCoreApplication.translate('Processing', string)
+
+    def createInstance(self):
+        return self.__class__()
+
+    def name(self):
+        """
+        Returns the unique algorithm name.
+        """
+        return 'dominodeexecutesql'
+
+    def displayName(self):
+        """
+        Returns the translated algorithm name.
+        """
+        return self.tr('Execute SQL on the DomiNode DB')
+
+    def group(self):
+        """
+        Returns the name of the group this algorithm belongs to.
+        """
+        return self.tr('DomiNode')
+
+    def groupId(self):
+        """
+        Returns the unique ID of the group this algorithm belongs
+        to.
+        """
+        return 'dominode'
+
+    def shortHelpString(self):
+        """
+        Returns a localised short help string for the algorithm.
+        """
+        return self.tr(
+            'Execute an SQL command in a single transaction, using a '
+            'connection from the pool of connections to the pg service '
+            'with the same name as the DB connection'
+        )
+
+    def initAlgorithm(self, config=None):
+        self.addParameter(
+            QgsProcessingParameterString(
+                self.INPUT_DATABASE,
+                self.tr('DB connection name'),
+            )
+        )
+        self.addParameter(
+            QgsProcessingParameterString(
+                self.INPUT_SQL,
+                self.tr('SQL query'),
+                multiLine=True
+            )
+        )
+
+    def processAlgorithm(self, parameters, context, feedback):
+        pg_service = self.parameterAsString(
+            parameters, self.INPUT_DATABASE, context)
+        sql = self.parameterAsString(parameters, self.INPUT_SQL, context)
+        feedback.pushInfo(f'sql: {sql}')
+        try:
+            with pooled_connection(pg_service) as connection:
+                with connection.cursor() as cursor:
+                    cursor.execute(sql)
+        except (psycopg2.Error, TimeoutError) as exc:
+            raise QgsProcessingException(
+                f'Encountered error while executing SQL: {exc}')
+        return {}
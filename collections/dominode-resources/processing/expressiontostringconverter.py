@@ -1,7 +1,12 @@
+import collections
+import os
+import sys
+import threading
 import typing
 
 from qgis import processing
 from qgis.core import (
+    QgsApplication,
     QgsExpression,
     QgsExpressionContext,
     QgsExpressionContextUtils,
@@ -13,7 +18,21 @@ from qgis.core import (
 )
 from qgis.PyQt.QtCore import QCoreApplication
 
+_SCRIPTS_DIR = os.path.dirname(os.path.abspath(__file__))
+if _SCRIPTS_DIR not in sys.path:
+    sys.path.append(_SCRIPTS_DIR)
 
+from instrumentation import instrumented  # noqa: E402
+
+EXPRESSION_CACHE_SIZE = 256
+
+_thread_state = threading.local()
+_global_context_generation = 0
+_global_context_lock = threading.Lock()
+_watching_global_variables = False
+
+
+@instrumented
 class ExpressionToStringConverter(QgsProcessingAlgorithm):
 
     INPUT = 'INPUT'
@@ -89,23 +108,130 @@ def parse_as_expression(
         context: typing.Optional[QgsExpressionContext] = None,
         default: typing.Optional[typing.Any] = None
 ):
+    return parse_as_expressions([raw_expression], context, default)[0]
+
+
+def parse_as_expressions(
+        raw_expressions: typing.Iterable[str],
+        context: typing.Optional[QgsExpressionContext] = None,
+        default: typing.Optional[typing.Any] = None
+) -> typing.List[typing.Any]:
+    """Evaluate many expressions against the same context
+
+    When no context is given, expressions are evaluated against a snapshot of
+    the global scope, using expressions that have already been prepared for
+    it.
+
+    """
+
+    use_snapshot = context is None and _watch_global_variables()
+    if use_snapshot:
+        ctx = get_global_context()
+    elif context is None:
+        ctx = _create_global_context()
+    else:
+        ctx = context
+    result = []
+    for raw_expression in raw_expressions:
+        expression = get_cached_expression(raw_expression)
+        if not use_snapshot:
+            # a copy, so that the cached expression stays prepared for the
+            # global snapshot
+            expression = QgsExpression(expression)
+            expression.prepare(ctx)
+        value = expression.evaluate(ctx)
+        if expression.hasEvalError():
+            raise ValueError(
+                f'Encountered error while evaluating {raw_expression!r}: '
+                f'{expression.evalErrorString()}'
+            )
+        result.append(value if value is not None else default)
+    return result
+
+
+def get_cached_expression(raw_expression: str) -> QgsExpression:
+    """Return an expression, parsed only once per thread
+
+    Cached expressions are prepared for the global snapshot of the calling
+    thread and are discarded when QGIS global variables change.
+
+    """
+
+    state = _get_thread_state()
+    expression = state.expressions.get(raw_expression)
+    if expression is not None:
+        state.expressions.move_to_end(raw_expression)
+        return expression
     expression = QgsExpression(raw_expression)
     if expression.hasParserError():
         raise RuntimeError(
             f'Encountered error while parsing {raw_expression!r}: '
             f'{expression.parserErrorString()}'
         )
-    if context is None:
-        ctx = QgsExpressionContext()
-        ctx.appendScope(QgsExpressionContextUtils.globalScope())
-    else:
-        ctx = context
-    result = expression.evaluate(ctx)
-    if expression.hasEvalError():
-        raise ValueError(
-            f'Encountered error while evaluating {raw_expression!r}: '
-            f'{expression.evalErrorString()}'
-        )
-    return result if result is not None else default
+    if state.context is None:
+        state.context = _create_global_context()
+    expression.prepare(state.context)
+    state.expressions[raw_expression] = expression
+    if len(state.expressions) > EXPRESSION_CACHE_SIZE:
+        state.expressions.popitem(last=False)
+    return expression
+
+
+def get_global_context() -> QgsExpressionContext:
+    """Return a snapshot of the global expression context
+
+    Each thread gets its own snapshot, which is reused until QGIS global
+    variables change.
+
+    """
+
+    if not _watch_global_variables():
+        return _create_global_context()
+    state = _get_thread_state()
+    if state.context is None:
+        state.context = _create_global_context()
+    return state.context
+
+
+def invalidate_global_context():
+    global _global_context_generation
+    with _global_context_lock:
+        _global_context_generation += 1
+
+
+def _create_global_context() -> QgsExpressionContext:
+    result = QgsExpressionContext()
+    result.appendScope(QgsExpressionContextUtils.globalScope())
+    return result
+
+
+def _get_thread_state() -> threading.local:
+    state = _thread_state
+    generation = _global_context_generation
+    if getattr(state, 'generation', None) != generation:
+        state.generation = generation
+        state.context = None
+        state.expressions = collections.OrderedDict()
+    return state
+
+
+def _watch_global_variables() -> bool:
+    """Invalidate the global snapshots whenever global variables change
+
+    Returns whether global variables are being watched, which is not possible
+    before the QGIS application has been created. Snapshots are not used
+    until then.
 
+    """
 
+    global _global_context_generation
+    global _watching_global_variables
+    with _global_context_lock:
+        if not _watching_global_variables:
+            app = QgsApplication.instance()
+            if app is not None:
+                app.customVariablesChanged.connect(invalidate_global_context)
+                _watching_global_variables = True
+                # variables may have changed before they were being watched
+                _global_context_generation += 1
+        return _watching_global_variables
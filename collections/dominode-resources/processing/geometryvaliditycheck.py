@@ -0,0 +1,276 @@
+import concurrent.futures
+import os
+import queue
+import sys
+import threading
+import typing
+
+from qgis.core import (
+    QgsFeature,
+    QgsFeatureRequest,
+    QgsFeatureSink,
+    QgsField,
+    QgsFields,
+    QgsGeometry,
+    QgsProcessing,
+    QgsProcessingAlgorithm,
+    QgsProcessingException,
+    QgsProcessingFeedback,
+    QgsProcessingOutputBoolean,
+    QgsProcessingOutputNumber,
+    QgsProcessingParameterBoolean,
+    QgsProcessingParameterFeatureSink,
+    QgsProcessingParameterNumber,
+    QgsProcessingParameterVectorLayer,
+    QgsVectorLayerFeatureSource,
+)
+from qgis.PyQt.QtCore import (
+    QCoreApplication,
+    QVariant,
+)
+
+_SCRIPTS_DIR = os.path.dirname(os.path.abspath(__file__))
+if _SCRIPTS_DIR not in sys.path:
+    sys.path.append(_SCRIPTS_DIR)
+
+from instrumentation import instrumented  # noqa: E402
+
+
+@instrumented
+class DomiNodeGeometryValidityCheck(QgsProcessingAlgorithm):
+    INPUT_LAYER = 'INPUT_LAYER'
+    INPUT_STOP_AT_FIRST_INVALID = 'INPUT_STOP_AT_FIRST_INVALID'
+    INPUT_WORKERS = 'INPUT_WORKERS'
+    INVALID_OUTPUT = 'INVALID_OUTPUT'
+    INVALID_COUNT = 'INVALID_COUNT'
+    IS_VALID = 'IS_VALID'
+
+    CHUNK_SIZE = 5000
+
+    def tr(self, string):
+        return QCoreApplication.translate('Processing', string)
+
+    def createInstance(self):
+        return self.__class__()
+
+    def name(self):
+        """
+        Returns the unique algorithm name.
+        """
+        return 'dominodegeometryvaliditycheck'
+
+    def displayName(self):
+        """
+        Returns the translated algorithm name.
+        """
+        return self.tr('Check geometry validity')
+
+    def group(self):
+        """
+        Returns the name of the group this algorithm belongs to.
+        """
+        return self.tr('DomiNode')
+
+    def groupId(self):
+        """
+        Returns the unique ID of the group this algorithm belongs
+        to.
+        """
+        return 'dominode'
+
+    def shortHelpString(self):
+        """
+        Returns a localised short help string for the algorithm.
+        """
+        return self.tr(
+            'Checks whether the geometries of a layer are valid, according '
+            'to GEOS.\n\n'
+            'Features are validated in chunks, in parallel. By default the '
+            'check stops at the first invalid geometry, in which case the '
+            'invalid count is only 0 or 1. Disable this in order to count '
+            'all invalid geometries.\n\n'
+            'Invalid features are only written to an output layer when one '
+            'is requested, in which case all geometries are checked, so that '
+            'the output holds every invalid feature. Features without '
+            'geometry are considered valid.'
+        )
+
+    def initAlgorithm(self, config=None):
+        self.addParameter(
+            QgsProcessingParameterVectorLayer(
+                self.INPUT_LAYER,
+                self.tr('Input layer'),
+                [QgsProcessing.TypeVectorAnyGeometry]
+            )
+        )
+        self.addParameter(
+            QgsProcessingParameterBoolean(
+                self.INPUT_STOP_AT_FIRST_INVALID,
+                self.tr('Stop at the first invalid geometry'),
+                defaultValue=True
+            )
+        )
+        self.addParameter(
+            QgsProcessingParameterNumber(
+                self.INPUT_WORKERS,
+                self.tr('Number of chunks to validate in parallel'),
+                defaultValue=os.cpu_count() or 1,
+                minValue=1
+            )
+        )
+        self.addParameter(
+            QgsProcessingParameterFeatureSink(
+                self.INVALID_OUTPUT,
+                self.tr('Invalid output'),
+                QgsProcessing.TypeVectorAnyGeometry,
+                optional=True,
+                createByDefault=False
+            )
+        )
+        self.addOutput(
+            QgsProcessingOutputNumber(
+                self.INVALID_COUNT,
+                self.tr('Count of invalid features')
+            )
+        )
+        self.addOutput(
+            QgsProcessingOutputBoolean(
+                self.IS_VALID,
+                self.tr('Whether all geometries are valid')
+            )
+        )
+
+    def processAlgorithm(self, parameters, context, feedback):
+        layer = self.parameterAsVectorLayer(
+            parameters, self.INPUT_LAYER, context)
+        if layer is None:
+            raise QgsProcessingException(
+                self.invalidSourceError(parameters, self.INPUT_LAYER))
+        stop_at_first = self.parameterAsBool(
+            parameters, self.INPUT_STOP_AT_FIRST_INVALID, context)
+        workers = self.parameterAsInt(parameters, self.INPUT_WORKERS, context)
+        output_fields = QgsFields(layer.fields())
+        output_fields.append(QgsField('_errors', QVariant.String))
+        sink, destination_id = self.parameterAsSink(
+            parameters,
+            self.INVALID_OUTPUT,
+            context,
+            output_fields,
+            layer.wkbType(),
+            layer.crs()
+        )
+        collect_invalid = sink is not None
+        if collect_invalid and stop_at_first:
+            feedback.pushInfo(
+                'Checking all geometries, as the invalid features are to be '
+                'written to the output layer'
+            )
+            stop_at_first = False
+
+        chunks = get_fid_chunks(layer.allFeatureIds(), self.CHUNK_SIZE)
+        # the workers must not access the layer, so its feature sources are
+        # created here, on the thread running the algorithm, and each one
+        # is then used by one worker at a time
+        feature_sources = queue.Queue()
+        for _ in range(workers):
+            feature_sources.put(QgsVectorLayerFeatureSource(layer))
+        stop_event = threading.Event()
+        invalid_count = 0
+        with concurrent.futures.ThreadPoolExecutor(workers) as executor:
+            futures = [
+                executor.submit(
+                    check_chunk,
+                    feature_sources,
+                    chunk,
+                    stop_event,
+                    stop_at_first,
+                    collect_invalid,
+                    feedback
+                ) for chunk in chunks
+            ]
+            total = 100 / len(futures) if len(futures) > 0 else 0
+            for current, future in enumerate(
+                    concurrent.futures.as_completed(futures)):
+                chunk_invalid_count, invalid_features = future.result()
+                invalid_count += chunk_invalid_count
+                if collect_invalid and len(invalid_features) > 0:
+                    sink.addFeatures(
+                        invalid_features, QgsFeatureSink.FastInsert)
+                feedback.setProgress(int((current + 1) * total))
+        if feedback.isCanceled():
+            return {}
+        if stop_at_first:
+            # chunks running concurrently may each have found one before
+            # stopping
+            invalid_count = min(invalid_count, 1)
+        self.metrics.add_features(layer.featureCount())
+        feedback.pushInfo(f'Found {invalid_count} invalid geometries')
+        return {
+            self.INVALID_OUTPUT: destination_id,
+            self.INVALID_COUNT: invalid_count,
+            self.IS_VALID: invalid_count == 0,
+        }
+
+
+def get_fid_chunks(
+        feature_ids: typing.Iterable[int],
+        chunk_size: int
+) -> typing.List[typing.Set[int]]:
+    sorted_ids = sorted(feature_ids)
+    return [
+        set(sorted_ids[i:i + chunk_size])
+        for i in range(0, len(sorted_ids), chunk_size)
+    ]
+
+
+def check_chunk(
+        feature_sources: queue.Queue,
+        feature_ids: typing.Set[int],
+        stop_event: threading.Event,
+        stop_at_first: bool = True,
+        collect_invalid: bool = False,
+        feedback: typing.Optional[QgsProcessingFeedback] = None
+) -> typing.Tuple[int, typing.List[QgsFeature]]:
+    """Validate the geometries of a chunk of features
+
+    This runs in a worker thread, using one of the feature sources of the
+    ``feature_sources`` queue. Setting ``stop_event`` stops all chunks,
+    which is done as soon as an invalid geometry is found, when
+    ``stop_at_first`` is set.
+
+    Returns the number of invalid geometries and, when ``collect_invalid``
+    is set, the invalid features with their validation errors appended.
+
+    """
+
+    request = QgsFeatureRequest()
+    request.setFilterFids(feature_ids)
+    if not collect_invalid:
+        request.setNoAttributes()
+    invalid_count = 0
+    invalid_features = []
+    if stop_event.is_set():
+        return invalid_count, invalid_features
+    feature_source = feature_sources.get()
+    try:
+        for feature in feature_source.getFeatures(request):
+            if stop_event.is_set() or (feedback and feedback.isCanceled()):
+                break
+            geometry = feature.geometry()
+            if (geometry.isNull() or geometry.isEmpty() or
+                    geometry.isGeosValid()):
+                continue
+            invalid_count += 1
+            if collect_invalid:
+                errors = geometry.validateGeometry(QgsGeometry.ValidatorGeos)
+                feature.setAttributes(
+                    feature.attributes() +
+                    ['; '.join(error.what() for error in errors)]
+                )
+                invalid_features.append(feature)
+            if stop_at_first:
+                stop_event.set()
+                break
+    finally:
+        feature_sources.put(feature_source)
+    return invalid_count, invalid_features
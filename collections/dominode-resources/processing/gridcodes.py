@@ -0,0 +1,185 @@
+"""Encoding of DomiNode topo map grid coordinates into row and column codes
+
+Codes depend only on the coordinate being encoded and on the grid depth,
+which means that a grid with ``num_rows * num_cols`` cells only needs
+``num_rows + num_cols`` distinct encodings. The encoders are memoized in
+order to take advantage of this.
+
+"""
+
+import functools
+import re
+import string
+import typing
+
+CACHE_SIZE = 2 ** 16
+
+SHEET_CODE_PATTERN = re.compile(r'^(?P<row_id>[A-Za-z]+)(?P<col_id>[0-9]+)$')
+
+
+def get_coords(cell: int, num_rows: int, num_cols: int):
+    row = ((cell - 1) % num_rows) + 1
+    col = (cell - row) / num_rows + 1
+    return int(row), int(col)
+
+
+def find_levels(coord: int, depth: int) -> typing.List[int]:
+    """Return the levels of a zero-based grid coordinate
+
+    The first level is the quotient of dividing the coordinate by
+    ``2 ** (depth - 1)``. Each remaining level is the corresponding bit of
+    the coordinate, offset by one.
+
+    """
+
+    coord = int(coord)
+    shift = depth - 1
+    levels = [(coord >> shift) + 1]
+    for bit in range(shift - 1, -1, -1):
+        levels.append(((coord >> bit) & 1) + 1)
+    return levels
+
+
+def find_alphabetic_levels(coord: int, depth: int) -> typing.List[str]:
+    return [string.ascii_letters[i - 1] for i in find_levels(coord, depth)]
+
+
+@functools.lru_cache(maxsize=CACHE_SIZE)
+def encode_row_id(coord: int, depth: int) -> str:
+    """Return the alphabetic code for a zero-based grid row"""
+    return ''.join(find_alphabetic_levels(coord, depth))
+
+
+@functools.lru_cache(maxsize=CACHE_SIZE)
+def encode_col_id(coord: int, depth: int) -> str:
+    """Return the numeric code for a zero-based grid column"""
+    return ''.join(str(i) for i in find_levels(coord, depth))
+
+
+def find_coord_ids(
+        cell: int,
+        num_rows: int,
+        num_cols: int,
+        depth: int
+) -> typing.Tuple[str, str]:
+    row, col = get_coords(cell, num_rows, num_cols)
+    return encode_row_id(row - 1, depth), encode_col_id(col - 1, depth)
+
+
+def decode_row_id(row_id: str, depth: int) -> int:
+    """Return the zero-based grid row that corresponds to a row code
+
+    This is the inverse of ``encode_row_id``. Decoding is case-insensitive,
+    as codes are stored in upper case, and thus only supports up to 26
+    top-level rows.
+
+    """
+
+    code = row_id.lower()
+    if len(code) != depth:
+        raise ValueError(f'Invalid row code {row_id!r} for depth {depth}')
+    coord = string.ascii_lowercase.index(code[0])
+    for char in code[1:]:
+        coord = (coord << 1) | 'ab'.index(char)
+    return coord
+
+
+def decode_col_id(col_id: str, depth: int) -> int:
+    """Return the zero-based grid column that corresponds to a column code
+
+    This is the inverse of ``encode_col_id``. The last ``depth - 1``
+    characters of the code are the column bits and the remaining prefix is
+    the top level, which may have more than one digit.
+
+    """
+
+    split_index = len(col_id) - (depth - 1)
+    if split_index < 1:
+        raise ValueError(f'Invalid column code {col_id!r} for depth {depth}')
+    coord = int(col_id[:split_index]) - 1
+    if coord < 0:
+        raise ValueError(f'Invalid column code {col_id!r} for depth {depth}')
+    for char in col_id[split_index:]:
+        coord = (coord << 1) | '12'.index(char)
+    return coord
+
+
+def decode_coord_ids(
+        row_id: str,
+        col_id: str,
+        depth: int
+) -> typing.Tuple[int, int]:
+    return decode_row_id(row_id, depth), decode_col_id(col_id, depth)
+
+
+def split_sheet_code(code: str) -> typing.Tuple[str, str]:
+    """Split a map sheet code, like ``AB12``, into its row and column codes"""
+    match = SHEET_CODE_PATTERN.match(code.strip())
+    if match is None:
+        raise ValueError(f'Invalid sheet code {code!r}')
+    return match.group('row_id'), match.group('col_id')
+
+
+def get_cell_extent(
+        row_id: str,
+        col_id: str,
+        depth: int,
+        origin_x: float,
+        origin_y: float,
+        cell_width: float,
+        cell_height: float
+) -> typing.Tuple[float, float, float, float]:
+    """Return the extent of the grid cell identified by its codes
+
+    The grid origin is its top left corner, as with Processing's
+    'native:creategrid'.
+
+    Returns a ``(left, top, right, bottom)`` tuple.
+
+    """
+
+    row, col = decode_coord_ids(row_id, col_id, depth)
+    left = origin_x + col * cell_width
+    top = origin_y - row * cell_height
+    return left, top, left + cell_width, top - cell_height
+
+
+def generate_grid_chunk(
+        first_col: int,
+        last_col: int,
+        num_rows: int,
+        origin_x: float,
+        origin_y: float,
+        cell_width: float,
+        cell_height: float,
+        depth: int
+) -> typing.List[typing.Tuple]:
+    """Generate the cells of a range of grid columns
+
+    Cells are numbered and laid out in the same way as Processing's
+    'native:creategrid' rectangle grids, that is, column by column starting
+    at the top left corner of the grid.
+
+    Returns a list of ``(id, left, top, right, bottom, row_id, col_id)``
+    tuples.
+
+    """
+
+    result = []
+    row_ids = [encode_row_id(row, depth).upper() for row in range(num_rows)]
+    for col in range(first_col, last_col):
+        col_id = encode_col_id(col, depth)
+        left = origin_x + col * cell_width
+        right = left + cell_width
+        for row, row_id in enumerate(row_ids):
+            top = origin_y - row * cell_height
+            result.append((
+                col * num_rows + row + 1,
+                left,
+                top,
+                right,
+                top - cell_height,
+                row_id,
+                col_id
+            ))
+    return result
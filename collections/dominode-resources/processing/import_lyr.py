@@ -12,18 +12,35 @@ from qgis.core import QgsProcessingParameterExpression
 from qgis.core import QgsProcessingParameterVectorLayer
 from qgis.core import QgsProcessingParameterString
 from qgis.core import QgsProcessingParameterBoolean
+from qgis.core import QgsProcessingParameterEnum
 from qgis.core import QgsExpression
 from qgis.core import QgsExpressionContextUtils, QgsProject
+import os
+import sys
 import processing
-import psycopg2
 
+_SCRIPTS_DIR = os.path.dirname(os.path.abspath(__file__))
+if _SCRIPTS_DIR not in sys.path:
+    sys.path.append(_SCRIPTS_DIR)
+
+from dbpool import pooled_connection  # noqa: E402
+from instrumentation import instrumented  # noqa: E402
+from pgcopy import (  # noqa: E402
+    import_layer,
+    sync_layer,
+)
+
+@instrumented
 class ImportVectorLayer(QgsProcessingAlgorithm):
 
+    IMPORT_ENGINES = ['ogr2ogr', 'PostGIS COPY', 'PostGIS COPY, only changed features']
+
     def initAlgorithm(self, config=None):
         self.addParameter(QgsProcessingParameterExpression('dbconnectionnameexpression', 'DB connection name', parentLayerParameterName='', defaultValue=' @dominode_db_connection_name '))
         self.addParameter(QgsProcessingParameterVectorLayer('inputlayer', 'Input layer', types=[QgsProcessing.TypeVectorAnyGeometry], defaultValue=None))
         self.addParameter(QgsProcessingParameterString('layername', 'output table name', multiLine=False, defaultValue=''))
         self.addParameter(QgsProcessingParameterBoolean('VERBOSE_LOG', 'Verbose logging', optional=True, defaultValue=False))
+        self.addParameter(QgsProcessingParameterEnum('importengine', 'Import engine', options=self.IMPORT_ENGINES, defaultValue=0))
 
     def processAlgorithm(self, parameters, context, model_feedback):
         # Use a multi-step feedback, so that individual child algorithm progress reports are adjusted for the
@@ -33,13 +50,13 @@ class ImportVectorLayer(QgsProcessingAlgorithm):
         outputs = {}
         #config connection to db
         pg_service = QgsExpressionContextUtils.globalScope().variable("dominode_db_connection_name")
-        connection = psycopg2.connect(service=pg_service)
 
         # Convert expression to string
         alg_params = {
             'INPUT': parameters['dbconnectionnameexpression']
         }
-        outputs['ConvertExpressionToString'] = processing.run('script:expressiontostringconverter', alg_params, context=context, feedback=feedback, is_child_algorithm=True)
+        with self.metrics.step('script:expressiontostringconverter'):
+            outputs['ConvertExpressionToString'] = processing.run('script:expressiontostringconverter', alg_params, context=context, feedback=feedback, is_child_algorithm=True)
 
         feedback.setCurrentStep(1)
         if feedback.isCanceled():
@@ -50,56 +67,74 @@ class ImportVectorLayer(QgsProcessingAlgorithm):
             'INPUT_LAYER': '',
             'INPUT_NAME': parameters['layername']
         }
-        outputs['ValidateResourceName'] = processing.run('script:resourcenamevalidator', alg_params, context=context, feedback=feedback, is_child_algorithm=True)
+        with self.metrics.step('script:resourcenamevalidator'):
+            outputs['ValidateResourceName'] = processing.run('script:resourcenamevalidator', alg_params, context=context, feedback=feedback, is_child_algorithm=True)
 
         feedback.setCurrentStep(2)
         if feedback.isCanceled():
             return {}
 
-        # Export to PostgreSQL (available connections)
-        alg_params = {
-            'ADDFIELDS': False,
-            'APPEND': False,
-            'A_SRS': None,
-            'CLIP': False,
-            'DATABASE': pg_service,
-            'DIM': 0,
-            'GEOCOLUMN': 'geom',
-            'GT': '',
-            'GTYPE': 0,
-            'INDEX': False,
-            'INPUT': parameters['inputlayer'],
-            'LAUNDER': True,
-            'OPTIONS': '',
-            'OVERWRITE': True,
-            'PK': 'id',
-            'PRECISION': True,
-            'PRIMARY_KEY': '',
-            'PROMOTETOMULTI': False,
-            'SCHEMA': outputs['ValidateResourceName']['OUTPUT_DB_STAGING_SCHEMA_NAME'],
-            'SEGMENTIZE': '',
-            'SHAPE_ENCODING': '',
-            'SIMPLIFY': '',
-            'SKIPFAILURES': False,
-            'SPAT': None,
-            'S_SRS': None,
-            'TABLE': outputs['ValidateResourceName']['OUTPUT_DATASET_NAME'],
-            'T_SRS': None,
-            'WHERE': ''
-        }
-        outputs['ExportToPostgresqlAvailableConnections'] = processing.run('gdal:importvectorintopostgisdatabaseavailableconnections', alg_params, context=context, feedback=feedback, is_child_algorithm=True)
+        schema_out = outputs['ValidateResourceName']['OUTPUT_DB_STAGING_SCHEMA_NAME']
+        table_out = outputs['ValidateResourceName']['OUTPUT_DATASET_NAME']
+        import_engine = self.parameterAsEnum(parameters, 'importengine', context)
+        if import_engine == 1:
+            # Stream features to PostgreSQL with binary COPY
+            input_layer = self.parameterAsVectorLayer(parameters, 'inputlayer', context)
+            with self.metrics.step('pgcopy:import_layer'), pooled_connection(pg_service) as connection:
+                num_imported = import_layer(connection, input_layer, schema_out, table_out, feedback=feedback)
+            self.metrics.add_features(num_imported)
+            feedback.pushInfo('Imported {} features'.format(num_imported))
+        elif import_engine == 2:
+            # Apply only the changed features to the existing table
+            input_layer = self.parameterAsVectorLayer(parameters, 'inputlayer', context)
+            with self.metrics.step('pgcopy:sync_layer'), pooled_connection(pg_service) as connection:
+                sync_result = sync_layer(connection, input_layer, schema_out, table_out, feedback=feedback)
+            self.metrics.add_features(input_layer.featureCount())
+            feedback.pushInfo('Inserted {} features, updated {} and deleted {}'.format(*sync_result))
+        else:
+            # Export to PostgreSQL (available connections)
+            alg_params = {
+                'ADDFIELDS': False,
+                'APPEND': False,
+                'A_SRS': None,
+                'CLIP': False,
+                'DATABASE': pg_service,
+                'DIM': 0,
+                'GEOCOLUMN': 'geom',
+                'GT': '',
+                'GTYPE': 0,
+                'INDEX': False,
+                'INPUT': parameters['inputlayer'],
+                'LAUNDER': True,
+                'OPTIONS': '',
+                'OVERWRITE': True,
+                'PK': 'id',
+                'PRECISION': True,
+                'PRIMARY_KEY': '',
+                'PROMOTETOMULTI': False,
+                'SCHEMA': outputs['ValidateResourceName']['OUTPUT_DB_STAGING_SCHEMA_NAME'],
+                'SEGMENTIZE': '',
+                'SHAPE_ENCODING': '',
+                'SIMPLIFY': '',
+                'SKIPFAILURES': False,
+                'SPAT': None,
+                'S_SRS': None,
+                'TABLE': outputs['ValidateResourceName']['OUTPUT_DATASET_NAME'],
+                'T_SRS': None,
+                'WHERE': ''
+            }
+            with self.metrics.step('gdal:importvectorintopostgisdatabaseavailableconnections'):
+                outputs['ExportToPostgresqlAvailableConnections'] = processing.run('gdal:importvectorintopostgisdatabaseavailableconnections', alg_params, context=context, feedback=feedback, is_child_algorithm=True)
 
         feedback.setCurrentStep(3)
         if feedback.isCanceled():
             return {}
 
         # set staging permissions
-        schema_out = outputs['ValidateResourceName']['OUTPUT_DB_STAGING_SCHEMA_NAME']
-        table_out = outputs['ValidateResourceName']['OUTPUT_DATASET_NAME']
-        cursor = connection.cursor()
-        cursor.execute("SELECT DomiNodeSetStagingPermissions('{}.{}');".format(schema_out,table_out))
-        record = cursor.fetchone()
-        cursor.close()
+        with self.metrics.step('DomiNodeSetStagingPermissions'), pooled_connection(pg_service) as connection:
+            with connection.cursor() as cursor:
+                cursor.execute("SELECT DomiNodeSetStagingPermissions(%s);", ('{}.{}'.format(schema_out, table_out),))
+                record = cursor.fetchone()
         return results
 
     def name(self):
@@ -114,5 +149,15 @@ class ImportVectorLayer(QgsProcessingAlgorithm):
     def groupId(self):
         return 'DomiNode'
 
+    def shortHelpString(self):
+        return (
+            'Import a vector layer into its department\'s staging schema, with ogr2ogr or with PostGIS binary COPY.\n\n'
+            'The "only changed features" engine updates an existing table in place, matching features by their '
+            'feature id. Shapefiles and GeoJSON files number their features by position, so deleting one rewrites all '
+            'the following ones. Tables first imported with ogr2ogr do not keep the source feature ids, so the first '
+            'such import rewrites every feature whose id differs. Tables whose columns do not match the layer are '
+            'fully reimported'
+        )
+
     def createInstance(self):
         return ImportVectorLayer()
@@ -0,0 +1,372 @@
+import concurrent.futures
+import contextlib
+import os
+import sys
+import typing
+
+from qgis.core import (
+    QgsExpressionContextUtils,
+    QgsProcessing,
+    QgsProcessingAlgorithm,
+    QgsProcessingException,
+    QgsProcessingFeedback,
+    QgsProcessingOutputNumber,
+    QgsProcessingOutputString,
+    QgsProcessingParameterBoolean,
+    QgsProcessingParameterExpression,
+    QgsProcessingParameterFile,
+    QgsProcessingParameterMultipleLayers,
+    QgsProcessingParameterNumber,
+    QgsVectorLayer,
+)
+from qgis.PyQt.QtCore import (
+    QCoreApplication,
+    Qt,
+)
+
+_SCRIPTS_DIR = os.path.dirname(os.path.abspath(__file__))
+if _SCRIPTS_DIR not in sys.path:
+    sys.path.append(_SCRIPTS_DIR)
+
+from dbpool import (  # noqa: E402
+    get_pool,
+    pooled_connection,
+)
+from expressiontostringconverter import parse_as_expression  # noqa: E402
+from instrumentation import (  # noqa: E402
+    Metrics,
+    instrumented,
+)
+from pgcopy import (  # noqa: E402
+    import_layer,
+    sync_layer,
+)
+from resourcenames import check_resource_names  # noqa: E402
+
+VECTOR_FILE_EXTENSIONS = (
+    '.geojson',
+    '.gml',
+    '.gpkg',
+    '.json',
+    '.kml',
+    '.shp',
+    '.tab',
+)
+
+IN_MEMORY_PROVIDERS = ('memory',)
+
+
+class LayerToImport(typing.NamedTuple):
+    name: str
+    source: str
+    provider: str
+    in_memory_layer: typing.Optional[QgsVectorLayer] = None
+
+
+@instrumented
+class BatchImportVectorLayers(QgsProcessingAlgorithm):
+    INPUT_LAYERS = 'INPUT_LAYERS'
+    INPUT_FOLDER = 'INPUT_FOLDER'
+    INPUT_DB_CONNECTION_NAME = 'INPUT_DB_CONNECTION_NAME'
+    INPUT_WORKERS = 'INPUT_WORKERS'
+    INPUT_ONLY_CHANGES = 'INPUT_ONLY_CHANGES'
+    OUTPUT_IMPORTED_TABLES = 'OUTPUT_IMPORTED_TABLES'
+    OUTPUT_NUM_IMPORTED = 'OUTPUT_NUM_IMPORTED'
+    OUTPUT_NUM_FAILED = 'OUTPUT_NUM_FAILED'
+
+    RULES_PATH_VARIABLE = 'dominode_resource_name_rules'
+
+    def tr(self, string):
+        return QCoreApplication.translate('Processing', string)
+
+    def createInstance(self):
+        return self.__class__()
+
+    def name(self):
+        """
+        Returns the unique algorithm name.
+        """
+        return 'batchimportvectorlayers'
+
+    def displayName(self):
+        """
+        Returns the translated algorithm name.
+        """
+        return self.tr('Import vector layers in batch')
+
+    def group(self):
+        """
+        Returns the name of the group this algorithm belongs to.
+        """
+        return self.tr('DomiNode')
+
+    def groupId(self):
+        """
+        Returns the unique ID of the group this algorithm belongs
+        to.
+        """
+        return 'dominode'
+
+    def shortHelpString(self):
+        """
+        Returns a localised short help string for the algorithm.
+        """
+        return self.tr(
+            'Import multiple vector layers and/or the vector files of a '
+            'folder into their department\'s staging schema. The name of '
+            'each layer is validated first and invalid ones are skipped. '
+            'Layers are imported concurrently, each worker using its own '
+            'DB connection, and staging permissions are set for all '
+            'imported tables in a single transaction at the end. In-memory '
+            'layers, such as temporary outputs of other algorithms, cannot '
+            'be reloaded by the workers and are imported one at a time '
+            'instead.\n\n'
+            'When only changed features are written, features are matched '
+            'by their feature id. Shapefiles and GeoJSON files number their '
+            'features by position, so deleting one rewrites all the '
+            'following ones. Tables first imported with ogr2ogr do not keep '
+            'the source feature ids, so the first such import rewrites '
+            'every feature whose id differs'
+        )
+
+    def initAlgorithm(self, config=None):
+        self.addParameter(
+            QgsProcessingParameterMultipleLayers(
+                self.INPUT_LAYERS,
+                self.tr('Input layers'),
+                QgsProcessing.TypeVectorAnyGeometry,
+                optional=True
+            )
+        )
+        self.addParameter(
+            QgsProcessingParameterFile(
+                self.INPUT_FOLDER,
+                self.tr('Folder with vector files'),
+                behavior=QgsProcessingParameterFile.Folder,
+                optional=True
+            )
+        )
+        self.addParameter(
+            QgsProcessingParameterExpression(
+                self.INPUT_DB_CONNECTION_NAME,
+                self.tr('DB connection name'),
+                defaultValue='@dominode_db_connection_name'
+            )
+        )
+        self.addParameter(
+            QgsProcessingParameterNumber(
+                self.INPUT_WORKERS,
+                self.tr('Number of concurrent imports'),
+                defaultValue=4,
+                minValue=1
+            )
+        )
+        self.addParameter(
+            QgsProcessingParameterBoolean(
+                self.INPUT_ONLY_CHANGES,
+                self.tr(
+                    'Only write changed features to existing tables'),
+                defaultValue=False
+            )
+        )
+        self.addOutput(
+            QgsProcessingOutputString(
+                self.OUTPUT_IMPORTED_TABLES,
+                self.tr('Imported tables')
+            )
+        )
+        self.addOutput(
+            QgsProcessingOutputNumber(
+                self.OUTPUT_NUM_IMPORTED,
+                self.tr('Number of imported layers')
+            )
+        )
+        self.addOutput(
+            QgsProcessingOutputNumber(
+                self.OUTPUT_NUM_FAILED,
+                self.tr('Number of layers that could not be imported')
+            )
+        )
+
+    def processAlgorithm(self, parameters, context, feedback):
+        to_import = [
+            LayerToImport(
+                layer.name(),
+                layer.source(),
+                layer.providerType(),
+                layer if layer.providerType() in IN_MEMORY_PROVIDERS else None
+            ) for layer in self.parameterAsLayerList(
+                parameters, self.INPUT_LAYERS, context)
+        ]
+        folder = self.parameterAsFile(parameters, self.INPUT_FOLDER, context)
+        if folder:
+            to_import.extend(get_folder_layers(folder))
+        pg_service = parse_as_expression(
+            self.parameterAsExpression(
+                parameters, self.INPUT_DB_CONNECTION_NAME, context)
+        )
+        workers = self.parameterAsInt(parameters, self.INPUT_WORKERS, context)
+        only_changes = self.parameterAsBool(
+            parameters, self.INPUT_ONLY_CHANGES, context)
+        rules_path = QgsExpressionContextUtils.globalScope().variable(
+            self.RULES_PATH_VARIABLE)
+        checked = check_resource_names(
+            [layer.name for layer in to_import], rules_path)
+        jobs = []
+        num_failed = 0
+        for layer, (name, parsed, error) in zip(to_import, checked):
+            if error is not None:
+                feedback.reportError(f'Skipping {name!r}: {error}')
+                num_failed += 1
+            else:
+                jobs.append(
+                    (layer, parsed.staging_schema, parsed.dataset_name))
+        feedback.pushInfo(f'Importing {len(jobs)} layers...')
+
+        # one more connection for importing in-memory layers on this thread
+        get_pool(pg_service, max_connections=workers + 1)
+        job_feedbacks = [QgsProcessingFeedback() for _ in jobs]
+        for job_feedback in job_feedbacks:
+            # a direct connection, since this thread is busy while it
+            # imports in-memory layers and could not handle queued signals
+            feedback.canceled.connect(
+                job_feedback.cancel, Qt.DirectConnection)
+        imported = []
+        with concurrent.futures.ThreadPoolExecutor(workers) as executor:
+            futures = {
+                executor.submit(
+                    import_vector_layer,
+                    pg_service,
+                    layer,
+                    schema,
+                    table,
+                    job_feedback,
+                    only_changes,
+                    self.metrics
+                ): (layer, schema, table)
+                for (layer, schema, table), job_feedback in zip(
+                    jobs, job_feedbacks)
+                if layer.in_memory_layer is None
+            }
+            # in-memory layers are imported on this thread, which owns them,
+            # while the workers import the other layers
+            for (layer, schema, table), job_feedback in zip(
+                    jobs, job_feedbacks):
+                if layer.in_memory_layer is None or feedback.isCanceled():
+                    continue
+                future = concurrent.futures.Future()
+                try:
+                    future.set_result(
+                        import_vector_layer(
+                            pg_service,
+                            layer,
+                            schema,
+                            table,
+                            job_feedback,
+                            only_changes,
+                            self.metrics
+                        )
+                    )
+                except Exception as exc:
+                    future.set_exception(exc)
+                futures[future] = (layer, schema, table)
+            pending = set(futures)
+            while len(pending) > 0:
+                done, pending = concurrent.futures.wait(
+                    pending,
+                    timeout=0.5,
+                    return_when=concurrent.futures.FIRST_COMPLETED
+                )
+                if feedback.isCanceled():
+                    for job_feedback in job_feedbacks:
+                        job_feedback.cancel()
+                for future in done:
+                    layer, schema, table = futures[future]
+                    try:
+                        summary = future.result()
+                    except Exception as exc:
+                        feedback.reportError(
+                            f'Could not import {layer.name!r}: {exc}')
+                        num_failed += 1
+                    else:
+                        feedback.pushInfo(
+                            f'{layer.name!r} -> {schema}.{table}: {summary}')
+                        imported.append(f'{schema}.{table}')
+                feedback.setProgress(
+                    int((len(imported) + num_failed) * 100 / len(to_import)))
+        if feedback.isCanceled():
+            return {}
+
+        feedback.pushInfo('Setting staging permissions...')
+        with self.metrics.step('DomiNodeSetStagingPermissions'), \
+                pooled_connection(pg_service) as connection:
+            with connection.cursor() as cursor:
+                for table_name in imported:
+                    cursor.execute(
+                        'SELECT DomiNodeSetStagingPermissions(%s);',
+                        (table_name,)
+                    )
+        return {
+            self.OUTPUT_IMPORTED_TABLES: ','.join(imported),
+            self.OUTPUT_NUM_IMPORTED: len(imported),
+            self.OUTPUT_NUM_FAILED: num_failed,
+        }
+
+
+def get_folder_layers(folder: str) -> typing.List[LayerToImport]:
+    result = []
+    for file_name in sorted(os.listdir(folder)):
+        name, extension = os.path.splitext(file_name)
+        if extension.lower() in VECTOR_FILE_EXTENSIONS:
+            result.append(
+                LayerToImport(name, os.path.join(folder, file_name), 'ogr'))
+    return result
+
+
+def import_vector_layer(
+        pg_service: str,
+        layer: LayerToImport,
+        schema: str,
+        table: str,
+        feedback: QgsProcessingFeedback,
+        only_changes: bool = False,
+        metrics: typing.Optional[Metrics] = None
+) -> str:
+    """Import a layer using a connection of its own
+
+    This runs in a worker thread, so the layer is loaded from its source
+    rather than sharing the layer object owned by the main thread. In-memory
+    layers cannot be reloaded, so they must be imported on the thread that
+    owns them, which uses the layer itself.
+
+    Returns a summary of the import. The import is recorded as a step of
+    ``metrics``, if given.
+
+    """
+
+    if layer.in_memory_layer is not None:
+        vector_layer = layer.in_memory_layer
+    else:
+        vector_layer = QgsVectorLayer(
+            layer.source, layer.name, layer.provider)
+    if not vector_layer.isValid():
+        raise QgsProcessingException(f'Invalid layer {layer.source!r}')
+    step = (
+        metrics.step(f'{schema}.{table}') if metrics is not None
+        else contextlib.nullcontext()
+    )
+    with step, pooled_connection(pg_service) as connection:
+        if only_changes:
+            inserted, updated, deleted = sync_layer(
+                connection, vector_layer, schema, table, feedback=feedback)
+            result = (
+                f'inserted {inserted} features, updated {updated} and '
+                f'deleted {deleted}'
+            )
+        else:
+            num_imported = import_layer(
+                connection, vector_layer, schema, table, feedback=feedback)
+            result = f'imported {num_imported} features'
+    if metrics is not None:
+        metrics.add_features(vector_layer.featureCount())
+    return result
@@ -0,0 +1,192 @@
+"""Timing instrumentation for the DomiNode processing scripts
+
+Decorate an algorithm class with ``instrumented`` in order to have its runs
+measured. The measurements are returned in the ``METRICS`` output of the
+algorithm, as JSON, and are also appended to the JSON lines file at the path
+set in the ``dominode_metrics_log`` QGIS global variable, if any.
+
+Algorithms may report the number of features they processed with
+``self.metrics.add_features()`` and time individual steps, such as calls to
+child algorithms, with ``self.metrics.step()``.
+
+CPU time is measured both for the thread running the algorithm and for the
+whole QGIS process. The process-wide values include the worker threads of
+the algorithm, but also any other algorithm or task running at the same
+time, so they are only meaningful for runs that had the process to
+themselves. The peak resident memory is also process-wide, over the whole
+lifetime of the process.
+
+"""
+
+import contextlib
+import datetime
+import functools
+import json
+import sys
+import threading
+import time
+import typing
+
+from qgis.core import (
+    QgsExpressionContextUtils,
+    QgsProcessingOutputString,
+)
+from qgis.PyQt.QtCore import QCoreApplication
+
+try:
+    import resource
+except ImportError:  # not available on windows
+    resource = None
+
+METRICS_OUTPUT = 'METRICS'
+METRICS_LOG_VARIABLE = 'dominode_metrics_log'
+
+_log_lock = threading.Lock()
+
+
+class Metrics:
+    """Measurements of a single algorithm run"""
+
+    def __init__(self, algorithm_id: str):
+        self.algorithm_id = algorithm_id
+        self.started = None
+        self.wall_time = None
+        self.thread_cpu_time = None
+        self.process_cpu_time = None
+        self.process_peak_rss = None
+        self.features = 0
+        self.steps = []
+        self.error = None
+        self._start_wall = None
+        self._start_thread_cpu = None
+        self._start_process_cpu = None
+        self._lock = threading.Lock()
+
+    def start(self):
+        self.started = datetime.datetime.now(datetime.timezone.utc)
+        self._start_wall = time.perf_counter()
+        self._start_thread_cpu = time.thread_time()
+        self._start_process_cpu = time.process_time()
+
+    def stop(self):
+        self.wall_time = time.perf_counter() - self._start_wall
+        self.thread_cpu_time = time.thread_time() - self._start_thread_cpu
+        self.process_cpu_time = (
+            time.process_time() - self._start_process_cpu)
+        self.process_peak_rss = get_peak_rss()
+
+    def add_features(self, count: int):
+        """Add to the number of features processed by the algorithm"""
+        with self._lock:
+            self.features += count
+
+    @contextlib.contextmanager
+    def step(self, name: str):
+        """Time the enclosed block as a named step of the algorithm"""
+        start_wall = time.perf_counter()
+        start_thread_cpu = time.thread_time()
+        start_process_cpu = time.process_time()
+        try:
+            yield
+        finally:
+            with self._lock:
+                self.steps.append({
+                    'name': name,
+                    'wall_time': time.perf_counter() - start_wall,
+                    'thread_cpu_time': time.thread_time() - start_thread_cpu,
+                    'process_cpu_time': (
+                        time.process_time() - start_process_cpu),
+                })
+
+    @property
+    def features_per_second(self) -> typing.Optional[float]:
+        if self.features > 0 and self.wall_time:
+            return self.features / self.wall_time
+        return None
+
+    def to_dict(self) -> typing.Dict:
+        return {
+            'algorithm': self.algorithm_id,
+            'started': self.started.isoformat() if self.started else None,
+            'wall_time': self.wall_time,
+            'thread_cpu_time': self.thread_cpu_time,
+            'process_cpu_time': self.process_cpu_time,
+            'process_peak_rss': self.process_peak_rss,
+            'features': self.features,
+            'features_per_second': self.features_per_second,
+            'steps': list(self.steps),
+            'error': self.error,
+        }
+
+    def to_json(self) -> str:
+        return json.dumps(self.to_dict())
+
+
+def get_peak_rss() -> typing.Optional[int]:
+    """Return the peak resident memory of the QGIS process, in bytes
+
+    This is the peak over the whole lifetime of the process, not just of the
+    current algorithm run.
+
+    """
+
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # linux reports kilobytes, macOS reports bytes
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+def write_metrics(metrics: Metrics, path: typing.Optional[str] = None):
+    """Append the metrics as a line of JSON to the metrics log, if any"""
+    if path is None:
+        path = QgsExpressionContextUtils.globalScope().variable(
+            METRICS_LOG_VARIABLE)
+    if path:
+        with _log_lock:
+            with open(path, 'a', encoding='utf-8') as fh:
+                fh.write(metrics.to_json() + '\n')
+
+
+def instrumented(algorithm_class):
+    """Class decorator that measures the runs of a processing algorithm"""
+    init_algorithm = algorithm_class.initAlgorithm
+    process_algorithm = algorithm_class.processAlgorithm
+
+    @functools.wraps(init_algorithm)
+    def initAlgorithm(self, config=None):
+        init_algorithm(self, config)
+        self.addOutput(
+            QgsProcessingOutputString(
+                METRICS_OUTPUT,
+                QCoreApplication.translate('Processing', 'Run metrics (JSON)')
+            )
+        )
+
+    @functools.wraps(process_algorithm)
+    def processAlgorithm(self, parameters, context, feedback):
+        self.metrics = Metrics(self.id())
+        self.metrics.start()
+        try:
+            result = process_algorithm(self, parameters, context, feedback)
+        except Exception as exc:
+            self.metrics.error = str(exc)
+            raise
+        finally:
+            self.metrics.stop()
+            try:
+                write_metrics(self.metrics)
+            except OSError as exc:
+                feedback.reportError(f'Could not write metrics: {exc}')
+        feedback.pushDebugInfo(
+            f'Finished in {self.metrics.wall_time:.3f}s '
+            f'(CPU {self.metrics.thread_cpu_time:.3f}s in this thread, '
+            f'{self.metrics.process_cpu_time:.3f}s process-wide)'
+        )
+        result = dict(result or {})
+        result[METRICS_OUTPUT] = self.metrics.to_json()
+        return result
+
+    algorithm_class.initAlgorithm = initAlgorithm
+    algorithm_class.processAlgorithm = processAlgorithm
+    return algorithm_class
@@ -1,3 +1,5 @@
+import os
+import sys
 import typing
 
 from qgis.core import (
@@ -7,7 +9,15 @@ from qgis.core import (
 )
 from qgis.PyQt.QtCore import QCoreApplication
 
+_SCRIPTS_DIR = os.path.dirname(os.path.abspath(__file__))
+if _SCRIPTS_DIR not in sys.path:
+    sys.path.append(_SCRIPTS_DIR)
 
+from instrumentation import instrumented  # noqa: E402
+from staticvalidators import get_static_outputs  # noqa: E402
+
+
+@instrumented
 class NoopValidator(QgsProcessingAlgorithm):
 
     INPUT = 'INPUT'
@@ -51,7 +61,10 @@ class NoopValidator(QgsProcessingAlgorithm):
         return self.tr(
             'Algorithm that always returns true,'
             'It is intended to be used in validation '
-            'of DomiNode legacy datasets.'
+            'of DomiNode legacy datasets.\n\n'
+            'The DomiNode checklist runner resolves this algorithm without '
+            'running it, since its output is always the same. Other '
+            'checklist tools, like the Dataset QA Workbench, still run it.'
         )
 
     def initAlgorithm(self, config=None):
@@ -70,6 +83,4 @@ class NoopValidator(QgsProcessingAlgorithm):
         )
 
     def processAlgorithm(self, parameters, context, feedback):
-        return {
-            self.OUTPUT: True
-        }
+        return get_static_outputs(f'script:{self.name()}')
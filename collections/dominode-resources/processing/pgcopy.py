@@ -0,0 +1,562 @@
+"""Streaming of vector features into PostGIS with binary COPY
+
+Features are encoded in PostgreSQL's binary COPY format and sent in batches
+of fixed size, which is much faster than inserting them row by row.
+
+Tables can also be synchronized incrementally. Features are matched by their
+id and compared by a hash of their geometry WKB and attributes, so that only
+the inserted, updated and deleted features are written.
+
+"""
+
+import datetime
+import hashlib
+import io
+import json
+import re
+import struct
+import typing
+
+from psycopg2 import sql
+from qgis.core import (
+    QgsFeatureRequest,
+    QgsProcessingException,
+    QgsWkbTypes,
+)
+from qgis.PyQt.QtCore import QVariant
+
+BATCH_SIZE = 10000
+PRIMARY_KEY = 'id'
+GEOMETRY_COLUMN = 'geom'
+
+COPY_SIGNATURE = b'PGCOPY\n\xff\r\n\x00'
+COPY_HEADER = COPY_SIGNATURE + struct.pack('>ii', 0, 0)
+COPY_TRAILER = struct.pack('>h', -1)
+NULL_VALUE = struct.pack('>i', -1)
+EWKB_SRID_FLAG = 0x20000000
+POSTGRES_EPOCH = datetime.datetime(2000, 1, 1)
+TEXT_OID = 25
+JSONB_VERSION = b'\x01'
+
+
+class Column(typing.NamedTuple):
+    name: str
+    pg_type: str
+    encode: typing.Callable[[typing.Any], bytes]
+
+
+def _encode_text(value) -> bytes:
+    return str(value).encode('utf-8')
+
+
+def _encode_date(value) -> bytes:
+    if hasattr(value, 'toPyDate'):
+        value = value.toPyDate()
+    return struct.pack('>i', (value - POSTGRES_EPOCH.date()).days)
+
+
+def _encode_timestamp(value) -> bytes:
+    if hasattr(value, 'toPyDateTime'):
+        value = value.toPyDateTime()
+    delta = value.replace(tzinfo=None) - POSTGRES_EPOCH
+    return struct.pack('>q', delta // datetime.timedelta(microseconds=1))
+
+
+def _encode_time(value) -> bytes:
+    if hasattr(value, 'toPyTime'):
+        value = value.toPyTime()
+    seconds = value.hour * 3600 + value.minute * 60 + value.second
+    return struct.pack('>q', seconds * 1000000 + value.microsecond)
+
+
+def _encode_bytes(value) -> bytes:
+    if hasattr(value, 'data'):
+        value = value.data()
+    return bytes(value)
+
+
+def _encode_text_array(value) -> bytes:
+    """Encode a list of strings as a one-dimensional text array"""
+    if len(value) == 0:
+        return struct.pack('>iii', 0, 0, TEXT_OID)
+    has_nulls = any(is_null(item) for item in value)
+    result = [struct.pack('>iiiii', 1, has_nulls, TEXT_OID, len(value), 1)]
+    for item in value:
+        if is_null(item):
+            result.append(NULL_VALUE)
+        else:
+            encoded = _encode_text(item)
+            result.append(struct.pack('>i', len(encoded)))
+            result.append(encoded)
+    return b''.join(result)
+
+
+def _encode_jsonb(value) -> bytes:
+    return JSONB_VERSION + json.dumps(value, default=str).encode('utf-8')
+
+
+COLUMN_TYPES = {
+    QVariant.String: ('text', _encode_text),
+    QVariant.Char: ('text', _encode_text),
+    QVariant.Int: ('integer', lambda value: struct.pack('>i', value)),
+    QVariant.UInt: ('bigint', lambda value: struct.pack('>q', value)),
+    QVariant.LongLong: ('bigint', lambda value: struct.pack('>q', value)),
+    QVariant.Double: (
+        'double precision', lambda value: struct.pack('>d', value)),
+    QVariant.Bool: ('boolean', lambda value: struct.pack('>?', value)),
+    QVariant.Date: ('date', _encode_date),
+    QVariant.Time: ('time', _encode_time),
+    QVariant.DateTime: ('timestamp', _encode_timestamp),
+    QVariant.ByteArray: ('bytea', _encode_bytes),
+    QVariant.StringList: ('text[]', _encode_text_array),
+    QVariant.Map: ('jsonb', _encode_jsonb),
+}
+
+
+def launder_name(name: str) -> str:
+    """Make a field name safe to use as a column name, like ogr2ogr does"""
+    return re.sub(r'[^a-z0-9_]', '_', name.lower())
+
+
+def get_columns(fields) -> typing.List[Column]:
+    """Return the table columns for the input fields
+
+    Raises QgsProcessingException for field types that cannot be copied.
+
+    """
+
+    result = []
+    used_names = {PRIMARY_KEY, GEOMETRY_COLUMN}
+    for field in fields:
+        name = launder_name(field.name())
+        while name in used_names:
+            name = f'{name}_'
+        used_names.add(name)
+        try:
+            pg_type, encode = COLUMN_TYPES[field.type()]
+        except KeyError:
+            raise QgsProcessingException(
+                f'Field {field.name()!r} has type {field.typeName()!r}, '
+                f'which cannot be imported with COPY'
+            )
+        result.append(Column(name, pg_type, encode))
+    return result
+
+
+def to_ewkb(geometry, srid: int) -> bytes:
+    """Return the geometry as WKB, tagged with its SRID as PostGIS expects"""
+    wkb = bytes(geometry.asWkb())
+    byte_order = '<' if wkb[0] == 1 else '>'
+    wkb_type, = struct.unpack(f'{byte_order}I', wkb[1:5])
+    return b''.join((
+        wkb[:1],
+        struct.pack(f'{byte_order}II', wkb_type | EWKB_SRID_FLAG, srid),
+        wkb[5:]
+    ))
+
+
+def encode_row(
+        feature_id: int,
+        attributes: typing.List,
+        columns: typing.List[Column],
+        geometry=None,
+        srid: typing.Optional[int] = None
+) -> bytes:
+    num_values = len(columns) + (2 if srid is not None else 1)
+    values = [struct.pack('>hiq', num_values, 8, feature_id)]
+    for column, value in zip(columns, attributes):
+        if is_null(value):
+            values.append(NULL_VALUE)
+        else:
+            encoded = column.encode(value)
+            values.append(struct.pack('>i', len(encoded)))
+            values.append(encoded)
+    if srid is not None:
+        if geometry is None or geometry.isNull():
+            values.append(NULL_VALUE)
+        else:
+            encoded = to_ewkb(geometry, srid)
+            values.append(struct.pack('>i', len(encoded)))
+            values.append(encoded)
+    return b''.join(values)
+
+
+def is_null(value) -> bool:
+    return value is None or (isinstance(value, QVariant) and value.isNull())
+
+
+def get_geometry_type(wkb_type) -> typing.Optional[str]:
+    """Return the PostGIS type modifier for the input QGIS geometry type"""
+    if wkb_type == QgsWkbTypes.NoGeometry:
+        result = None
+    elif wkb_type == QgsWkbTypes.Unknown:
+        result = 'geometry'
+    else:
+        # 25D types are not valid PostGIS type modifiers, so always use the
+        # Z/M suffixes
+        result = QgsWkbTypes.displayString(QgsWkbTypes.flatType(wkb_type))
+        if QgsWkbTypes.hasZ(wkb_type):
+            result += 'Z'
+        if QgsWkbTypes.hasM(wkb_type):
+            result += 'M'
+    return result
+
+
+def create_table(
+        cursor,
+        schema: str,
+        table: str,
+        columns: typing.List[Column],
+        geometry_type: typing.Optional[str],
+        srid: int
+):
+    table_identifier = sql.Identifier(schema, table)
+    column_definitions = [
+        sql.SQL('{} bigint PRIMARY KEY').format(sql.Identifier(PRIMARY_KEY))]
+    for column in columns:
+        column_definitions.append(
+            sql.SQL('{} {}').format(
+                sql.Identifier(column.name), sql.SQL(column.pg_type))
+        )
+    if geometry_type == 'geometry':
+        column_definitions.append(
+            sql.SQL('{} geometry').format(sql.Identifier(GEOMETRY_COLUMN)))
+    elif geometry_type is not None:
+        column_definitions.append(
+            sql.SQL('{} geometry({}, {})').format(
+                sql.Identifier(GEOMETRY_COLUMN),
+                sql.SQL(geometry_type),
+                sql.Literal(srid)
+            )
+        )
+    cursor.execute(
+        sql.SQL('DROP TABLE IF EXISTS {}').format(table_identifier))
+    cursor.execute(
+        sql.SQL('CREATE TABLE {} ({})').format(
+            table_identifier, sql.SQL(', ').join(column_definitions))
+    )
+
+
+def copy_rows(
+        cursor,
+        schema: str,
+        table: str,
+        columns: typing.List[Column],
+        rows: typing.List[bytes],
+        with_geometry: bool
+):
+    """Send already encoded rows to the DB with a single binary COPY"""
+    column_names = _get_column_names(columns, with_geometry)
+    statement = sql.SQL('COPY {} ({}) FROM STDIN WITH (FORMAT binary)').format(
+        sql.Identifier(schema, table),
+        sql.SQL(', ').join(sql.Identifier(name) for name in column_names)
+    )
+    stream = io.BytesIO(b''.join([COPY_HEADER] + rows + [COPY_TRAILER]))
+    cursor.copy_expert(statement.as_string(cursor), stream)
+
+
+def copy_features(
+        cursor,
+        source,
+        schema: str,
+        table: str,
+        columns: typing.List[Column],
+        feedback=None,
+        request: typing.Optional[QgsFeatureRequest] = None,
+        batch_size: int = BATCH_SIZE
+) -> int:
+    """Stream the features of the source into an existing table
+
+    Returns the number of copied features.
+
+    """
+
+    with_geometry = get_geometry_type(source.wkbType()) is not None
+    srid = source.sourceCrs().postgisSrid() if with_geometry else None
+    num_features = source.featureCount()
+    total = 100 / num_features if num_features > 0 else 0
+    num_copied = 0
+    batch = []
+    features = source.getFeatures(request or QgsFeatureRequest())
+    for feature in features:
+        if feedback is not None and feedback.isCanceled():
+            raise QgsProcessingException('Import canceled')
+        batch.append(
+            encode_row(
+                feature.id(),
+                feature.attributes(),
+                columns,
+                feature.geometry() if with_geometry else None,
+                srid
+            )
+        )
+        if len(batch) >= batch_size:
+            copy_rows(cursor, schema, table, columns, batch, with_geometry)
+            num_copied += len(batch)
+            batch = []
+            if feedback is not None:
+                feedback.setProgress(int(num_copied * total))
+                feedback.pushInfo(f'Copied {num_copied} rows')
+    if len(batch) > 0:
+        copy_rows(cursor, schema, table, columns, batch, with_geometry)
+        num_copied += len(batch)
+    return num_copied
+
+
+def import_layer(
+        connection,
+        source,
+        schema: str,
+        table: str,
+        feedback=None,
+        batch_size: int = BATCH_SIZE
+) -> int:
+    """Replace a PostGIS table with the features of the input source
+
+    The table is created, loaded with binary COPY, spatially indexed and
+    analyzed inside the current transaction of the connection.
+
+    Returns the number of imported features.
+
+    """
+
+    columns = get_columns(source.fields())
+    geometry_type = get_geometry_type(source.wkbType())
+    srid = source.sourceCrs().postgisSrid()
+    with connection.cursor() as cursor:
+        create_table(cursor, schema, table, columns, geometry_type, srid)
+        num_copied = copy_features(
+            cursor,
+            source,
+            schema,
+            table,
+            columns,
+            feedback=feedback,
+            batch_size=batch_size
+        )
+        if geometry_type is not None:
+            if feedback is not None:
+                feedback.pushInfo('Creating spatial index...')
+            cursor.execute(
+                sql.SQL('CREATE INDEX {} ON {} USING GIST ({})').format(
+                    sql.Identifier(f'{table}_{GEOMETRY_COLUMN}_idx'),
+                    sql.Identifier(schema, table),
+                    sql.Identifier(GEOMETRY_COLUMN)
+                )
+            )
+        cursor.execute(
+            sql.SQL('ANALYZE {}').format(sql.Identifier(schema, table)))
+    return num_copied
+
+
+class SyncResult(typing.NamedTuple):
+    inserted: int
+    updated: int
+    deleted: int
+
+
+def sync_layer(
+        connection,
+        source,
+        schema: str,
+        table: str,
+        feedback=None,
+        batch_size: int = BATCH_SIZE
+) -> SyncResult:
+    """Apply only the changes between the source and an existing table
+
+    Features keep their id, which is also the table's primary key. Changed
+    features are deleted and copied again, in the current transaction of the
+    connection.
+
+    When the table does not exist, or its columns do not match those of the
+    source, it is fully reimported instead. Columns are compared regardless
+    of their order, since ogr2ogr puts the geometry column second.
+
+    Features are matched by their QGIS feature id. Some providers, like
+    those of shapefiles and GeoJSON files, number features by their position
+    in the file, so deleting a feature shifts the id of all the following
+    ones, which are then rewritten as well. Tables imported with ogr2ogr do
+    not keep the source feature ids, so their first sync rewrites every
+    feature whose id differs.
+
+    """
+
+    columns = get_columns(source.fields())
+    with_geometry = get_geometry_type(source.wkbType()) is not None
+    with connection.cursor() as cursor:
+        if set(get_table_columns(cursor, schema, table)) != set(
+                _get_column_names(columns, with_geometry)):
+            if feedback is not None:
+                feedback.pushInfo(
+                    f'Table {schema}.{table} does not match the source '
+                    f'columns, reimporting it'
+                )
+            num_imported = import_layer(
+                connection, source, schema, table, feedback, batch_size)
+            return SyncResult(num_imported, 0, 0)
+        if feedback is not None:
+            feedback.pushInfo('Comparing features...')
+        source_hashes = get_source_hashes(source, columns, feedback)
+        table_hashes = get_table_hashes(
+            cursor, schema, table, columns, with_geometry)
+        inserted = source_hashes.keys() - table_hashes.keys()
+        deleted = table_hashes.keys() - source_hashes.keys()
+        updated = {
+            feature_id for feature_id in
+            source_hashes.keys() & table_hashes.keys()
+            if source_hashes[feature_id] != table_hashes[feature_id]
+        }
+        if feedback is not None:
+            feedback.pushInfo(
+                f'Found {len(inserted)} new, {len(updated)} changed and '
+                f'{len(deleted)} deleted features'
+            )
+        to_remove = list(deleted | updated)
+        if len(to_remove) > 0:
+            cursor.execute(
+                sql.SQL('DELETE FROM {} WHERE {} = ANY(%s)').format(
+                    sql.Identifier(schema, table),
+                    sql.Identifier(PRIMARY_KEY)
+                ),
+                (to_remove,)
+            )
+        to_copy = inserted | updated
+        if len(to_copy) > 0:
+            request = QgsFeatureRequest()
+            request.setFilterFids(list(to_copy))
+            copy_features(
+                cursor,
+                source,
+                schema,
+                table,
+                columns,
+                feedback=feedback,
+                request=request,
+                batch_size=batch_size
+            )
+        if len(to_remove) > 0 or len(to_copy) > 0:
+            cursor.execute(
+                sql.SQL('ANALYZE {}').format(sql.Identifier(schema, table)))
+    return SyncResult(len(inserted), len(updated), len(deleted))
+
+
+def get_table_columns(
+        cursor,
+        schema: str,
+        table: str
+) -> typing.List[str]:
+    cursor.execute(
+        'SELECT column_name FROM information_schema.columns '
+        'WHERE table_schema = %s AND table_name = %s '
+        'ORDER BY ordinal_position',
+        (schema, table)
+    )
+    return [row[0] for row in cursor.fetchall()]
+
+
+def get_source_hashes(
+        source,
+        columns: typing.List[Column],
+        feedback=None
+) -> typing.Dict[int, bytes]:
+    with_geometry = get_geometry_type(source.wkbType()) is not None
+    result = {}
+    for feature in source.getFeatures():
+        if feedback is not None and feedback.isCanceled():
+            raise QgsProcessingException('Import canceled')
+        geometry_hash = None
+        if with_geometry:
+            geometry = feature.geometry()
+            if geometry is not None and not geometry.isNull():
+                geometry_hash = hashlib.md5(
+                    bytes(geometry.asWkb())).hexdigest()
+        result[feature.id()] = hash_row(
+            geometry_hash, feature.attributes(), columns)
+    return result
+
+
+def get_table_hashes(
+        cursor,
+        schema: str,
+        table: str,
+        columns: typing.List[Column],
+        with_geometry: bool
+) -> typing.Dict[int, bytes]:
+    """Return the hashes of the rows of a table
+
+    Geometries are hashed by the DB, so that only their digest is
+    transferred.
+
+    """
+
+    if with_geometry:
+        geometry_hash = sql.SQL('md5(ST_AsBinary({}))').format(
+            sql.Identifier(GEOMETRY_COLUMN))
+    else:
+        geometry_hash = sql.SQL('NULL')
+    cursor.execute(
+        sql.SQL('SELECT {}, {} FROM {}').format(
+            sql.SQL(', ').join(
+                [sql.Identifier(PRIMARY_KEY), geometry_hash] +
+                [sql.Identifier(column.name) for column in columns]
+            ),
+            sql.Identifier(schema, table)
+        )
+    )
+    result = {}
+    for row in cursor:
+        result[row[0]] = hash_row(row[1], row[2:], columns)
+    return result
+
+
+def hash_row(
+        geometry_hash: typing.Optional[str],
+        attributes: typing.Sequence,
+        columns: typing.List[Column]
+) -> bytes:
+    values = [geometry_hash]
+    for column, value in zip(columns, attributes):
+        values.append(_normalize(value, column.pg_type))
+    return hashlib.md5(repr(values).encode('utf-8')).digest()
+
+
+def _normalize(value, pg_type: str):
+    """Convert values read from QGIS or the DB to the same Python types"""
+    if is_null(value):
+        result = None
+    elif hasattr(value, 'toPyDateTime'):
+        result = value.toPyDateTime().replace(tzinfo=None)
+    elif hasattr(value, 'toPyDate'):
+        result = value.toPyDate()
+    elif hasattr(value, 'toPyTime'):
+        result = value.toPyTime()
+    elif pg_type == 'bytea':
+        result = _encode_bytes(value)
+    elif pg_type == 'text[]':
+        result = [None if is_null(item) else str(item) for item in value]
+    elif pg_type == 'jsonb':
+        result = json.dumps(value, sort_keys=True, default=str)
+    elif pg_type in ('integer', 'bigint'):
+        result = int(value)
+    elif pg_type == 'double precision':
+        result = float(value)
+    elif pg_type == 'boolean':
+        result = bool(value)
+    elif pg_type == 'text':
+        result = str(value)
+    elif isinstance(value, datetime.datetime):
+        result = value.replace(tzinfo=None)
+    else:
+        result = value
+    return result
+
+
+def _get_column_names(
+        columns: typing.List[Column],
+        with_geometry: bool
+) -> typing.List[str]:
+    result = [PRIMARY_KEY] + [column.name for column in columns]
+    if with_geometry:
+        result.append(GEOMETRY_COLUMN)
+    return result
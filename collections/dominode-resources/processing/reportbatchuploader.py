@@ -0,0 +1,580 @@
+import collections
+import functools
+import glob
+import json
+import os
+import sys
+import traceback
+import typing
+
+from PyQt5.QtNetwork import (
+    QNetworkReply,
+    QNetworkRequest,
+)
+from PyQt5.QtCore import (
+    QCoreApplication,
+    QEventLoop,
+    QUrl,
+)
+from qgis.core import (
+    QgsApplication,
+    QgsFeedback,
+    QgsNetworkAccessManager,
+    QgsProcessingAlgorithm,
+    QgsProcessingException,
+    QgsProcessingOutputNumber,
+    QgsProcessingOutputString,
+    QgsProcessingParameterBoolean,
+    QgsProcessingParameterExpression,
+    QgsProcessingParameterFile,
+    QgsProcessingParameterNumber,
+    QgsProcessingParameterString,
+)
+
+_SCRIPTS_DIR = os.path.dirname(os.path.abspath(__file__))
+if _SCRIPTS_DIR not in sys.path:
+    sys.path.append(_SCRIPTS_DIR)
+
+import reportuploader  # noqa: E402
+from expressiontostringconverter import parse_as_expression  # noqa: E402
+from instrumentation import instrumented  # noqa: E402
+from reportspool import (  # noqa: E402
+    get_idempotency_key,
+    is_permanent_failure,
+)
+from resourcecache import (  # noqa: E402
+    CachedResource,
+    ResourceCache,
+)
+
+
+@instrumented
+class DomiNodeReportBatchUploader(QgsProcessingAlgorithm):
+    INPUT_REPORTS = 'INPUT_REPORTS'
+    INPUT_REPORTS_FOLDER = 'INPUT_REPORTS_FOLDER'
+    INPUT_AUTH_CONFIG = 'INPUT_AUTH_CONFIG'
+    INPUT_DOMINODE_BASE_URL = 'INPUT_DOMINODE_BASE_URL'
+    INPUT_MAX_CONCURRENT_REQUESTS = 'INPUT_MAX_CONCURRENT_REQUESTS'
+    INPUT_BYPASS_CACHE = 'INPUT_BYPASS_CACHE'
+    INPUT_SPOOL_ON_FAILURE = 'INPUT_SPOOL_ON_FAILURE'
+    INPUT_COMPRESS = 'INPUT_COMPRESS'
+    OUTPUT_NUM_UPLOADED = 'OUTPUT_NUM_UPLOADED'
+    OUTPUT_NUM_FAILED = 'OUTPUT_NUM_FAILED'
+    OUTPUT_NUM_SPOOLED = 'OUTPUT_NUM_SPOOLED'
+    OUTPUT_VALIDATION_REPORT_URLS = 'OUTPUT_VALIDATION_REPORT_URLS'
+
+    QGIS_VARIABLE_PREFIX = 'dominode_report_uploader'
+
+    def tr(self, string):
+        return QCoreApplication.translate('Processing', string)
+
+    def group(self):
+        return self.tr('DomiNode')
+
+    def groupId(self):
+        return 'dominode'
+
+    def name(self):
+        return 'dominodereportbatchuploader'
+
+    def displayName(self):
+        return self.tr('Upload many validation reports to DomiNode')
+
+    def createInstance(self):
+        return self.__class__()
+
+    def shortHelpString(self):
+        return self.tr(
+            f"This algorithm uploads many validation reports to DomiNode "
+            f"at once.\n\n"
+            f"Reports can be given as a JSON list, as one JSON report per "
+            f"line, or as a folder of JSON files. The DomiNode resources of "
+            f"all reports are looked up concurrently, missing resources are "
+            f"created and then reports are uploaded concurrently, without "
+            f"blocking on each request.\n\n"
+            f"Reports that cannot be uploaded are spooled locally and "
+            f"retried in the background, unless spooling is disabled. "
+            f"Reports that DomiNode rejects are not spooled.\n\n"
+            f"As with the single report uploader, the algorithm can be "
+            f"configured with the "
+            f"{self.QGIS_VARIABLE_PREFIX}_auth_config_id and "
+            f"{self.QGIS_VARIABLE_PREFIX}_base_url QGIS global variables"
+        )
+
+    def initAlgorithm(self, config=None):
+        self.addParameter(
+            QgsProcessingParameterString(
+                self.INPUT_REPORTS,
+                self.tr('Input validation reports'),
+                defaultValue='',
+                multiLine=True,
+                optional=True
+            )
+        )
+        self.addParameter(
+            QgsProcessingParameterFile(
+                self.INPUT_REPORTS_FOLDER,
+                self.tr('Folder with validation reports (*.json)'),
+                behavior=QgsProcessingParameterFile.Folder,
+                optional=True
+            )
+        )
+        self.addParameter(
+            QgsProcessingParameterExpression(
+                self.INPUT_AUTH_CONFIG,
+                self.tr('DomiNode Authentication configuration ID'),
+                defaultValue=f'@{self.QGIS_VARIABLE_PREFIX}_auth_config_id',
+                optional=True
+            )
+        )
+        self.addParameter(
+            QgsProcessingParameterExpression(
+                self.INPUT_DOMINODE_BASE_URL,
+                self.tr('DomiNode base URL'),
+                defaultValue=f'@{self.QGIS_VARIABLE_PREFIX}_base_url'
+            )
+        )
+        self.addParameter(
+            QgsProcessingParameterNumber(
+                self.INPUT_MAX_CONCURRENT_REQUESTS,
+                self.tr('Maximum number of concurrent requests'),
+                defaultValue=6,
+                minValue=1
+            )
+        )
+        self.addParameter(
+            QgsProcessingParameterBoolean(
+                self.INPUT_BYPASS_CACHE,
+                self.tr('Bypass the local cache of DomiNode resources'),
+                defaultValue=False
+            )
+        )
+        self.addParameter(
+            QgsProcessingParameterBoolean(
+                self.INPUT_SPOOL_ON_FAILURE,
+                self.tr('Spool reports for later upload if they fail'),
+                defaultValue=True
+            )
+        )
+        self.addParameter(
+            QgsProcessingParameterBoolean(
+                self.INPUT_COMPRESS,
+                self.tr('Compress reports with gzip when uploading them'),
+                defaultValue=False
+            )
+        )
+        self.addOutput(
+            QgsProcessingOutputNumber(
+                self.OUTPUT_NUM_UPLOADED,
+                'Number of uploaded reports'
+            )
+        )
+        self.addOutput(
+            QgsProcessingOutputNumber(
+                self.OUTPUT_NUM_FAILED,
+                'Number of reports that could not be uploaded'
+            )
+        )
+        self.addOutput(
+            QgsProcessingOutputNumber(
+                self.OUTPUT_NUM_SPOOLED,
+                'Number of failed reports that were spooled for later upload'
+            )
+        )
+        self.addOutput(
+            QgsProcessingOutputString(
+                self.OUTPUT_VALIDATION_REPORT_URLS,
+                'Comma-separated URLs of the uploaded validation reports'
+            )
+        )
+
+    def processAlgorithm(self, parameters, context, feedback):
+        reports = load_reports(
+            self.parameterAsString(parameters, self.INPUT_REPORTS, context),
+            self.parameterAsFile(
+                parameters, self.INPUT_REPORTS_FOLDER, context)
+        )
+        auth_config = parse_as_expression(
+            self.parameterAsExpression(
+                parameters, self.INPUT_AUTH_CONFIG, context)
+        )
+        base_url = parse_as_expression(
+            self.parameterAsExpression(
+                parameters, self.INPUT_DOMINODE_BASE_URL, context)
+        )
+        if not base_url:
+            raise QgsProcessingException(f'Invalid base_url: {base_url}')
+        else:
+            base_url = base_url if base_url.endswith('/') else f'{base_url}/'
+        max_concurrent = self.parameterAsInt(
+            parameters, self.INPUT_MAX_CONCURRENT_REQUESTS, context)
+        bypass_cache = self.parameterAsBool(
+            parameters, self.INPUT_BYPASS_CACHE, context)
+        spool_on_failure = self.parameterAsBool(
+            parameters, self.INPUT_SPOOL_ON_FAILURE, context)
+        compress = self.parameterAsBool(
+            parameters, self.INPUT_COMPRESS, context)
+        feedback.pushInfo(f'Uploading {len(reports)} reports...')
+        uploader = AsyncReportUploader(
+            base_url,
+            QgsNetworkAccessManager.instance(),
+            auth_config,
+            max_concurrent=max_concurrent,
+            cache=None if bypass_cache else ResourceCache(),
+            compress=compress,
+            feedback=feedback
+        )
+        results = uploader.upload(reports)
+        report_urls = []
+        num_failed = 0
+        num_spooled = 0
+        for report, result in zip(reports, results):
+            if result.error is None:
+                report_urls.append(result.report_url)
+            else:
+                feedback.reportError(
+                    f'Could not upload report of {result.dataset!r}: '
+                    f'{result.error}'
+                )
+                num_failed += 1
+                if (spool_on_failure and result.error != CANCELED_ERROR and
+                        not is_permanent_failure(result.status_code)):
+                    reportuploader.spool_report(
+                        report, base_url, auth_config, result.error)
+                    num_spooled += 1
+        if num_spooled > 0:
+            feedback.pushInfo(
+                f'{num_spooled} reports have been spooled and will be '
+                f'uploaded later'
+            )
+        self.metrics.add_features(len(reports))
+        return {
+            self.OUTPUT_NUM_UPLOADED: len(report_urls),
+            self.OUTPUT_NUM_FAILED: num_failed,
+            self.OUTPUT_NUM_SPOOLED: num_spooled,
+            self.OUTPUT_VALIDATION_REPORT_URLS: ','.join(report_urls),
+        }
+
+
+CANCELED_ERROR = 'Canceled'
+
+
+class UploadResult(typing.NamedTuple):
+    dataset: str
+    resource_url: typing.Optional[str] = None
+    report_url: typing.Optional[str] = None
+    error: typing.Optional[str] = None
+    status_code: typing.Optional[int] = None
+
+
+class _Reply(typing.NamedTuple):
+    status_code: typing.Optional[int]
+    contents: bytes
+    error_string: str
+    etag: typing.Optional[str]
+
+    @property
+    def error(self) -> str:
+        return (
+            f'status_code: {self.status_code} - '
+            f'error_string: {self.error_string} - '
+            f'reply_contents: '
+            f'{self.contents.decode("utf-8", errors="replace")}'
+        )
+
+
+class AsyncReportUploader:
+    """Upload validation reports with concurrent, non-blocking requests
+
+    Each distinct dataset is looked up only once and, if it does not exist,
+    its resource is created before its reports are uploaded. Requests are
+    issued as soon as their inputs are known, with at most
+    ``max_concurrent`` of them in flight. Qt keeps the connections to the
+    server alive, so that they are reused by subsequent requests.
+
+    Payloads are compressed with gzip when ``compress`` is set.
+
+    When a cache is given, fresh cached resources are used without looking
+    them up and stale ones are revalidated with their ETag.
+
+    """
+
+    def __init__(
+            self,
+            dominode_base_url: str,
+            network_manager: QgsNetworkAccessManager,
+            auth_config: typing.Optional[str] = None,
+            max_concurrent: int = 6,
+            cache: typing.Optional[ResourceCache] = None,
+            compress: bool = False,
+            feedback: typing.Optional[QgsFeedback] = None
+    ):
+        self.base_url = dominode_base_url
+        self.network_manager = network_manager
+        self.auth_config = auth_config
+        self.max_concurrent = max_concurrent
+        self.cache = cache
+        self.compress = compress
+        self.feedback = feedback
+        self._loop = None
+        self._queue = collections.deque()
+        self._active = set()
+        self._results = {}
+        self._reports_by_dataset = {}
+
+    def upload(self, reports: typing.List[typing.Dict]) -> typing.List[UploadResult]:
+        """Upload the reports and return their results, in the same order"""
+        self._results = {}
+        self._reports_by_dataset = {}
+        for index, report in enumerate(reports):
+            self._reports_by_dataset.setdefault(
+                report['dataset'], []).append((index, report))
+        for dataset in self._reports_by_dataset:
+            cached = (
+                self.cache.get(self.base_url, dataset) if self.cache
+                else None
+            )
+            if cached is not None and cached.is_fresh(self.cache.ttl):
+                self._upload_reports(dataset, cached.resource)
+                continue
+            request = reportuploader.get_resource_request(
+                dataset, self.base_url)
+            if cached is not None and cached.etag:
+                request.setRawHeader(
+                    b'If-None-Match', cached.etag.encode('utf-8'))
+            self._enqueue(
+                'GET',
+                request,
+                None,
+                functools.partial(self._on_resource_lookup, dataset, cached),
+                dataset
+            )
+        self._loop = QEventLoop()
+        if self.feedback is not None:
+            self.feedback.canceled.connect(self._cancel)
+        self._start_requests()
+        if len(self._active) > 0:
+            self._loop.exec_()
+        if self.feedback is not None:
+            self.feedback.canceled.disconnect(self._cancel)
+        return [
+            self._results.get(
+                index, UploadResult(report['dataset'], error=CANCELED_ERROR))
+            for index, report in enumerate(reports)
+        ]
+
+    def _enqueue(
+            self,
+            method: str,
+            request: QNetworkRequest,
+            data: typing.Optional[typing.Dict],
+            callback: typing.Callable[[_Reply], None],
+            dataset: str,
+            indexes: typing.Optional[typing.List[int]] = None
+    ):
+        """Queue a request
+
+        ``indexes`` are those of the reports that fail when the request
+        cannot be handled, which are all the reports of ``dataset`` by
+        default.
+
+        """
+
+        if indexes is None:
+            indexes = [
+                index for index, _ in self._reports_by_dataset[dataset]]
+        self._queue.append((method, request, data, callback, dataset, indexes))
+
+    def _start_requests(self):
+        while len(self._queue) > 0 and len(self._active) < self.max_concurrent:
+            method, request, data, callback, dataset, indexes = (
+                self._queue.popleft())
+            if method == 'GET':
+                reply = self.network_manager.get(request)
+            else:
+                if self.auth_config:
+                    QgsApplication.authManager().updateNetworkRequest(
+                        request, self.auth_config)
+                if self.compress:
+                    request.setRawHeader(b'Content-Encoding', b'gzip')
+                reply = self.network_manager.post(
+                    request,
+                    reportuploader.encode_payload(data, self.compress)
+                )
+            self._active.add(reply)
+            reply.finished.connect(
+                functools.partial(
+                    self._on_finished, reply, callback, dataset, indexes)
+            )
+        if len(self._active) == 0 and self._loop is not None:
+            self._loop.quit()
+
+    def _on_finished(
+            self,
+            reply: QNetworkReply,
+            callback,
+            dataset: str,
+            indexes: typing.List[int]
+    ):
+        self._active.discard(reply)
+        etag = bytes(reply.rawHeader(b'ETag')).decode('utf-8')
+        result = _Reply(
+            reply.attribute(QNetworkRequest.HttpStatusCodeAttribute),
+            bytes(reply.readAll()),
+            reply.errorString(),
+            etag or None
+        )
+        reply.deleteLater()
+        # replies are also aborted when they time out, which is an error
+        # rather than a cancelation
+        canceled = (
+            reply.error() == QNetworkReply.OperationCanceledError and
+            self.feedback is not None and self.feedback.isCanceled()
+        )
+        if not canceled:
+            try:
+                callback(result)
+            except Exception as exc:
+                error = f'{exc.__class__.__name__}: {exc}'
+                if self.feedback is not None:
+                    self.feedback.reportError(
+                        f'Could not handle reply for {dataset!r}: {error}')
+                    self.feedback.pushDebugInfo(traceback.format_exc())
+                self._fail(dataset, indexes, error)
+        self._start_requests()
+
+    def _fail(
+            self,
+            dataset: str,
+            indexes: typing.List[int],
+            error: str,
+            status_code: typing.Optional[int] = None
+    ):
+        for index in indexes:
+            if index not in self._results:
+                self._results[index] = UploadResult(
+                    dataset, error=error, status_code=status_code)
+
+    def _cancel(self):
+        self._queue.clear()
+        for reply in list(self._active):
+            reply.abort()
+
+    def _on_resource_lookup(
+            self,
+            dataset: str,
+            cached: typing.Optional[CachedResource],
+            reply: _Reply
+    ):
+        if reply.status_code is None:
+            self._fail(
+                dataset,
+                [index for index, _ in self._reports_by_dataset[dataset]],
+                reply.error
+            )
+            return
+        resource = None
+        if reply.status_code == 304 and cached is not None:
+            self.cache.touch(self.base_url, dataset)
+            resource = cached.resource
+        elif reply.status_code == 200:
+            resource = reportuploader.parse_resource_lookup(reply.contents)
+            if self.cache is not None and resource is not None:
+                self.cache.put(self.base_url, dataset, resource, reply.etag)
+        if resource is not None:
+            self._upload_reports(dataset, resource)
+        else:
+            first_report = self._reports_by_dataset[dataset][0][1]
+            self._enqueue(
+                'POST',
+                self._get_post_request(reportuploader.RESOURCES_ENDPOINT),
+                reportuploader.get_resource_payload(
+                    dataset,
+                    first_report['dataset_type'],
+                    first_report['artifact_type']
+                ),
+                functools.partial(self._on_resource_created, dataset),
+                dataset
+            )
+
+    def _on_resource_created(self, dataset: str, reply: _Reply):
+        if reply.status_code == 201:
+            resource = json.loads(reply.contents.decode('utf-8'))
+            if self.cache is not None:
+                self.cache.put(self.base_url, dataset, resource)
+            self._upload_reports(dataset, resource)
+        else:
+            self._fail(
+                dataset,
+                [index for index, _ in self._reports_by_dataset[dataset]],
+                reply.error,
+                reply.status_code
+            )
+
+    def _upload_reports(self, dataset: str, resource: typing.Dict):
+        for index, report in self._reports_by_dataset[dataset]:
+            request = self._get_post_request(
+                reportuploader.VALIDATION_REPORTS_ENDPOINT)
+            request.setRawHeader(
+                reportuploader.IDEMPOTENCY_KEY_HEADER.encode('utf-8'),
+                get_idempotency_key(report, self.base_url).encode('utf-8')
+            )
+            self._enqueue(
+                'POST',
+                request,
+                reportuploader.get_validation_report_payload(report),
+                functools.partial(
+                    self._on_report_uploaded, index, dataset, resource['url']),
+                dataset,
+                [index]
+            )
+
+    def _on_report_uploaded(
+            self,
+            index: int,
+            dataset: str,
+            resource_url: str,
+            reply: _Reply
+    ):
+        if reply.status_code == 201:
+            validation_report = json.loads(reply.contents.decode('utf-8'))
+            result = UploadResult(
+                dataset, resource_url, validation_report['url'])
+        else:
+            result = UploadResult(
+                dataset,
+                resource_url,
+                error=reply.error,
+                status_code=reply.status_code
+            )
+        self._results[index] = result
+
+    def _get_post_request(self, endpoint: str) -> QNetworkRequest:
+        request = QNetworkRequest(QUrl(f'{self.base_url}/{endpoint}'))
+        request.setHeader(QNetworkRequest.ContentTypeHeader, 'application/json')
+        return request
+
+
+def load_reports(
+        raw_reports: str,
+        folder: typing.Optional[str] = None
+) -> typing.List[typing.Dict]:
+    """Load reports from a JSON list, JSON lines and/or a folder of files"""
+    result = []
+    raw_reports = raw_reports.strip() if raw_reports else ''
+    if raw_reports:
+        try:
+            loaded = json.loads(raw_reports)
+        except json.JSONDecodeError:
+            result.extend(
+                json.loads(line) for line in raw_reports.splitlines()
+                if line.strip()
+            )
+        else:
+            result.extend(loaded if isinstance(loaded, list) else [loaded])
+    if folder:
+        for path in sorted(glob.glob(os.path.join(folder, '*.json'))):
+            with open(path, encoding='utf-8') as fh:
+                result.append(json.load(fh))
+    return result
+
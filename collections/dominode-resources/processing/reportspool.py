@@ -0,0 +1,344 @@
+"""Durable spool of validation reports waiting to be uploaded to DomiNode
+
+Reports that could not be uploaded are stored in an SQLite database in the
+QGIS profile directory, together with the DomiNode base URL and auth config
+id to use. A background thread retries them with exponential backoff and
+they can also be delivered on demand with the spool drainer algorithm.
+
+Each report has an idempotency key derived from its contents, which is
+sent along with the upload so that a retried upload is not stored twice.
+Spooling the same report again is a no-op.
+
+Reports are claimed before being delivered, in a single transaction, so
+that the background thread and the drainer never deliver the same report at
+the same time. Reports that are rejected by DomiNode, or that still fail
+after a maximum number of attempts, are dead-lettered: they are kept in the
+spool, for inspection, but are not retried any more.
+
+"""
+
+import contextlib
+import hashlib
+import json
+import os
+import random
+import sqlite3
+import threading
+import time
+import typing
+
+from qgis.core import (
+    QgsApplication,
+    QgsFeedback,
+)
+
+SPOOL_FILE_NAME = 'dominode-report-spool.sqlite'
+BASE_RETRY_DELAY = 30
+MAX_RETRY_DELAY = 60 * 60
+FLUSH_INTERVAL = 30
+BATCH_SIZE = 20
+MAX_ATTEMPTS = 10
+CLAIM_TIMEOUT = 10 * 60
+# client errors that may succeed when retried
+RETRYABLE_CLIENT_ERRORS = (408, 429)
+
+
+class SpooledReport(typing.NamedTuple):
+    id: int
+    idempotency_key: str
+    base_url: str
+    auth_config: typing.Optional[str]
+    report: typing.Dict
+    attempts: int
+
+
+class PermanentDeliveryError(Exception):
+    """A report was rejected and retrying its delivery would not help"""
+
+
+class ReportSpool:
+
+    def __init__(
+            self,
+            path: typing.Optional[str] = None,
+            max_attempts: int = MAX_ATTEMPTS
+    ):
+        self.path = path or get_spool_path()
+        self.max_attempts = max_attempts
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        with self._connect() as connection:
+            connection.execute(
+                'CREATE TABLE IF NOT EXISTS reports ('
+                'id INTEGER PRIMARY KEY, '
+                'idempotency_key TEXT NOT NULL UNIQUE, '
+                'base_url TEXT NOT NULL, '
+                'auth_config TEXT, '
+                'report TEXT NOT NULL, '
+                'attempts INTEGER NOT NULL DEFAULT 0, '
+                'next_attempt REAL NOT NULL, '
+                'last_error TEXT, '
+                'created REAL NOT NULL, '
+                'claimed_until REAL, '
+                'dead_lettered INTEGER NOT NULL DEFAULT 0)'
+            )
+            # spools created by earlier versions lack the newer columns
+            columns = {
+                row[1] for row in
+                connection.execute('PRAGMA table_info(reports)')
+            }
+            if 'claimed_until' not in columns:
+                connection.execute(
+                    'ALTER TABLE reports ADD COLUMN claimed_until REAL')
+            if 'dead_lettered' not in columns:
+                connection.execute(
+                    'ALTER TABLE reports ADD COLUMN '
+                    'dead_lettered INTEGER NOT NULL DEFAULT 0'
+                )
+
+    def add(
+            self,
+            report: typing.Dict,
+            base_url: str,
+            auth_config: typing.Optional[str] = None,
+            error: typing.Optional[str] = None
+    ) -> str:
+        """Spool a report and return its idempotency key"""
+        key = get_idempotency_key(report, base_url)
+        now = time.time()
+        with self._connect() as connection:
+            connection.execute(
+                'INSERT OR IGNORE INTO reports '
+                '(idempotency_key, base_url, auth_config, report, attempts, '
+                'next_attempt, last_error, created) '
+                'VALUES (?, ?, ?, ?, 1, ?, ?, ?)',
+                (
+                    key,
+                    base_url,
+                    auth_config,
+                    json.dumps(report),
+                    now + get_retry_delay(1),
+                    error,
+                    now
+                )
+            )
+        return key
+
+    def claim_due(
+            self,
+            after_id: int = 0,
+            limit: int = BATCH_SIZE,
+            ignore_backoff: bool = False,
+            claim_timeout: float = CLAIM_TIMEOUT
+    ) -> typing.List[SpooledReport]:
+        """Claim the reports whose next attempt is due, oldest first
+
+        Claimed reports are not returned again until they are marked as
+        delivered or failed, or until ``claim_timeout`` seconds have passed,
+        in case their delivery was interrupted.
+
+        """
+
+        now = time.time()
+        next_attempt = float('inf') if ignore_backoff else now
+        with self._connect() as connection:
+            # take the write lock before reading, so that no one else can
+            # claim the same reports
+            connection.execute('BEGIN IMMEDIATE')
+            rows = connection.execute(
+                'SELECT id, idempotency_key, base_url, auth_config, report, '
+                'attempts FROM reports '
+                'WHERE id > ? AND next_attempt <= ? AND dead_lettered = 0 '
+                'AND (claimed_until IS NULL OR claimed_until < ?) '
+                'ORDER BY id LIMIT ?',
+                (after_id, next_attempt, now, limit)
+            ).fetchall()
+            connection.executemany(
+                'UPDATE reports SET claimed_until = ? WHERE id = ?',
+                [(now + claim_timeout, row[0]) for row in rows]
+            )
+        return [
+            SpooledReport(
+                row[0], row[1], row[2], row[3], json.loads(row[4]), row[5])
+            for row in rows
+        ]
+
+    def mark_delivered(self, report_id: int):
+        with self._connect() as connection:
+            connection.execute('DELETE FROM reports WHERE id = ?', (report_id,))
+
+    def mark_failed(
+            self,
+            report_id: int,
+            error: str,
+            permanent: bool = False
+    ) -> bool:
+        """Record a failed delivery and return whether it was dead-lettered
+
+        Reports are dead-lettered when the failure is permanent or when they
+        have reached the maximum number of attempts.
+
+        """
+
+        with self._connect() as connection:
+            attempts = connection.execute(
+                'SELECT attempts FROM reports WHERE id = ?', (report_id,)
+            ).fetchone()[0] + 1
+            dead_lettered = permanent or attempts >= self.max_attempts
+            connection.execute(
+                'UPDATE reports '
+                'SET attempts = ?, next_attempt = ?, last_error = ?, '
+                'claimed_until = NULL, dead_lettered = ? '
+                'WHERE id = ?',
+                (
+                    attempts,
+                    time.time() + get_retry_delay(attempts),
+                    error,
+                    dead_lettered,
+                    report_id
+                )
+            )
+        return dead_lettered
+
+    def count(self) -> int:
+        """Return the number of reports that are still to be delivered"""
+        with self._connect() as connection:
+            return connection.execute(
+                'SELECT count(*) FROM reports WHERE dead_lettered = 0'
+            ).fetchone()[0]
+
+    def count_dead_lettered(self) -> int:
+        with self._connect() as connection:
+            return connection.execute(
+                'SELECT count(*) FROM reports WHERE dead_lettered = 1'
+            ).fetchone()[0]
+
+    @contextlib.contextmanager
+    def _connect(self) -> typing.Iterator[sqlite3.Connection]:
+        connection = sqlite3.connect(self.path, timeout=10)
+        try:
+            with connection:
+                yield connection
+        finally:
+            connection.close()
+
+
+def flush(
+        spool: ReportSpool,
+        deliver: typing.Callable[[SpooledReport], typing.Any],
+        ignore_backoff: bool = False,
+        feedback: typing.Optional[QgsFeedback] = None
+) -> typing.Tuple[int, int]:
+    """Try to deliver the due reports once, in batches
+
+    ``deliver`` is called with each report and must raise an exception when
+    the report could not be delivered, which should be a
+    PermanentDeliveryError when retrying it would not help.
+
+    Returns the number of delivered and failed reports.
+
+    """
+
+    num_delivered = 0
+    num_failed = 0
+    last_id = 0
+    while feedback is None or not feedback.isCanceled():
+        batch = spool.claim_due(last_id, ignore_backoff=ignore_backoff)
+        if len(batch) == 0:
+            break
+        for spooled in batch:
+            try:
+                deliver(spooled)
+            except Exception as exc:
+                dead_lettered = spool.mark_failed(
+                    spooled.id,
+                    str(exc),
+                    permanent=isinstance(exc, PermanentDeliveryError)
+                )
+                num_failed += 1
+                if feedback is not None:
+                    feedback.reportError(
+                        f'Could not deliver report of '
+                        f'{spooled.report.get("dataset")!r}: {exc}'
+                    )
+                    if dead_lettered:
+                        feedback.reportError(
+                            'The report has been dead-lettered and will not '
+                            'be retried'
+                        )
+            else:
+                spool.mark_delivered(spooled.id)
+                num_delivered += 1
+            last_id = spooled.id
+    return num_delivered, num_failed
+
+
+class SpoolFlusher(threading.Thread):
+    """Deliver spooled reports in the background until the spool is empty"""
+
+    def __init__(
+            self,
+            deliver: typing.Callable[[SpooledReport], typing.Any],
+            spool_path: typing.Optional[str] = None,
+            interval: float = FLUSH_INTERVAL
+    ):
+        super().__init__(name='dominode-report-spool-flusher', daemon=True)
+        self.deliver = deliver
+        self.spool_path = spool_path
+        self.interval = interval
+        self._stop_event = threading.Event()
+
+    def run(self):
+        spool = ReportSpool(self.spool_path)
+        while not self._stop_event.wait(self.interval):
+            flush(spool, self.deliver)
+            if spool.count() == 0:
+                break
+
+    def stop(self):
+        self._stop_event.set()
+
+
+_flusher = None
+_flusher_lock = threading.Lock()
+
+
+def start_flusher(
+        deliver: typing.Callable[[SpooledReport], typing.Any],
+        spool_path: typing.Optional[str] = None
+) -> SpoolFlusher:
+    """Start the background flusher, unless it is already running"""
+    global _flusher
+    with _flusher_lock:
+        if _flusher is None or not _flusher.is_alive():
+            _flusher = SpoolFlusher(deliver, spool_path)
+            _flusher.start()
+        return _flusher
+
+
+def get_idempotency_key(report: typing.Dict, base_url: str) -> str:
+    encoder = json.JSONEncoder(sort_keys=True, separators=(',', ':'))
+    key = hashlib.sha256(f'{base_url}\n'.encode('utf-8'))
+    # hash the report as it is encoded, rather than encoding it all at once
+    for chunk in encoder.iterencode(report):
+        key.update(chunk.encode('utf-8'))
+    return key.hexdigest()
+
+
+def is_permanent_failure(status_code: typing.Optional[int]) -> bool:
+    """Return whether a request failed in a way that retrying cannot fix"""
+    return (
+        status_code is not None and 400 <= status_code < 500 and
+        status_code not in RETRYABLE_CLIENT_ERRORS
+    )
+
+
+def get_retry_delay(attempts: int) -> float:
+    """Return the exponential backoff delay after a number of attempts"""
+    delay = min(BASE_RETRY_DELAY * 2 ** (attempts - 1), MAX_RETRY_DELAY)
+    # jitter avoids retrying many reports in lockstep
+    return delay * random.uniform(0.5, 1)
+
+
+def get_spool_path() -> str:
+    return os.path.join(
+        QgsApplication.qgisSettingsDirPath(), 'dominode', SPOOL_FILE_NAME)
@@ -0,0 +1,121 @@
+import os
+import sys
+
+from PyQt5.QtCore import QCoreApplication
+from qgis.core import (
+    QgsProcessingAlgorithm,
+    QgsProcessingOutputNumber,
+    QgsProcessingParameterBoolean,
+)
+
+_SCRIPTS_DIR = os.path.dirname(os.path.abspath(__file__))
+if _SCRIPTS_DIR not in sys.path:
+    sys.path.append(_SCRIPTS_DIR)
+
+import reportuploader  # noqa: E402
+from instrumentation import instrumented  # noqa: E402
+from reportspool import (  # noqa: E402
+    MAX_ATTEMPTS,
+    ReportSpool,
+    flush,
+)
+
+
+@instrumented
+class DomiNodeReportSpoolDrainer(QgsProcessingAlgorithm):
+    INPUT_IGNORE_BACKOFF = 'INPUT_IGNORE_BACKOFF'
+    OUTPUT_NUM_DELIVERED = 'OUTPUT_NUM_DELIVERED'
+    OUTPUT_NUM_FAILED = 'OUTPUT_NUM_FAILED'
+    OUTPUT_NUM_PENDING = 'OUTPUT_NUM_PENDING'
+    OUTPUT_NUM_DEAD_LETTERED = 'OUTPUT_NUM_DEAD_LETTERED'
+
+    def tr(self, string):
+        return QCoreApplication.translate('Processing', string)
+
+    def group(self):
+        return self.tr('DomiNode')
+
+    def groupId(self):
+        return 'dominode'
+
+    def name(self):
+        return 'dominodereportspooldrainer'
+
+    def displayName(self):
+        return self.tr('Upload spooled validation reports to DomiNode')
+
+    def createInstance(self):
+        return self.__class__()
+
+    def shortHelpString(self):
+        return self.tr(
+            "This algorithm uploads the validation reports that the report "
+            "uploaders could not upload and have spooled for later.\n\n"
+            "Reports are normally retried in the background with an "
+            "increasing delay between attempts. By default this algorithm "
+            "retries all spooled reports right away.\n\n"
+            "Reports that DomiNode rejects, or that still fail after "
+            "{} attempts, are dead-lettered: they are kept in the spool but "
+            "are not retried any more."
+        ).format(MAX_ATTEMPTS)
+
+    def initAlgorithm(self, config=None):
+        self.addParameter(
+            QgsProcessingParameterBoolean(
+                self.INPUT_IGNORE_BACKOFF,
+                self.tr(
+                    'Retry all reports, including those whose next attempt '
+                    'is not due yet'
+                ),
+                defaultValue=True
+            )
+        )
+        self.addOutput(
+            QgsProcessingOutputNumber(
+                self.OUTPUT_NUM_DELIVERED,
+                'Number of delivered reports'
+            )
+        )
+        self.addOutput(
+            QgsProcessingOutputNumber(
+                self.OUTPUT_NUM_FAILED,
+                'Number of reports that could not be delivered'
+            )
+        )
+        self.addOutput(
+            QgsProcessingOutputNumber(
+                self.OUTPUT_NUM_PENDING,
+                'Number of reports left in the spool'
+            )
+        )
+        self.addOutput(
+            QgsProcessingOutputNumber(
+                self.OUTPUT_NUM_DEAD_LETTERED,
+                'Number of dead-lettered reports, which are not retried'
+            )
+        )
+
+    def processAlgorithm(self, parameters, context, feedback):
+        ignore_backoff = self.parameterAsBool(
+            parameters, self.INPUT_IGNORE_BACKOFF, context)
+        spool = ReportSpool()
+        feedback.pushInfo(f'{spool.count()} reports are spooled')
+        num_delivered, num_failed = flush(
+            spool,
+            reportuploader.deliver_spooled_report,
+            ignore_backoff=ignore_backoff,
+            feedback=feedback
+        )
+        num_pending = spool.count()
+        num_dead_lettered = spool.count_dead_lettered()
+        feedback.pushInfo(
+            f'Delivered {num_delivered} reports, {num_pending} are left and '
+            f'{num_dead_lettered} are dead-lettered'
+        )
+        self.metrics.add_features(num_delivered + num_failed)
+        return {
+            self.OUTPUT_NUM_DELIVERED: num_delivered,
+            self.OUTPUT_NUM_FAILED: num_failed,
+            self.OUTPUT_NUM_PENDING: num_pending,
+            self.OUTPUT_NUM_DEAD_LETTERED: num_dead_lettered,
+        }
@@ -1,5 +1,8 @@
 import json
+import os
+import sys
 import typing
+import zlib
 
 from PyQt5.QtNetwork import (
     QNetworkRequest,
@@ -18,7 +21,9 @@ from qgis.core import (
     QgsProcessingOutputNumber,
     QgsProcessingOutputString,
     QgsProcessingParameterAuthConfig,
+    QgsProcessingParameterBoolean,
     QgsProcessingParameterExpression,
+    QgsProcessingParameterNumber,
     QgsProcessingParameterString,
 )
 
@@ -26,14 +31,38 @@ from qgis.core import (
 from dataset_qa_workbench.datasetqaworkbench.constants import (
     REPORT_HANDLER_INPUT_NAME,
 )
-from dataset_qa_workbench.processing_provider.algorithms.base import (
-    parse_as_expression,
+
+_SCRIPTS_DIR = os.path.dirname(os.path.abspath(__file__))
+if _SCRIPTS_DIR not in sys.path:
+    sys.path.append(_SCRIPTS_DIR)
+
+from expressiontostringconverter import parse_as_expression  # noqa: E402
+from instrumentation import instrumented  # noqa: E402
+from reportspool import (  # noqa: E402
+    PermanentDeliveryError,
+    ReportSpool,
+    SpooledReport,
+    get_idempotency_key,
+    is_permanent_failure,
+    start_flusher,
 )
+from resourcecache import ResourceCache  # noqa: E402
+
+RESOURCES_ENDPOINT = 'dominode-validation/api/dominode-resources/'
+VALIDATION_REPORTS_ENDPOINT = 'dominode-validation/api/validation-reports/'
+IDEMPOTENCY_KEY_HEADER = 'Idempotency-Key'
+MAX_LOG_LENGTH = 2000
+COMPRESSION_CHUNK_SIZE = 64 * 1024
 
 
+@instrumented
 class DomiNodeReportUploaderAlgorithm(QgsProcessingAlgorithm):
     INPUT_AUTH_CONFIG = 'INPUT_AUTH_CONFIG'
     INPUT_DOMINODE_BASE_URL = 'INPUT_DOMINODE_BASE_URL'
+    INPUT_BYPASS_CACHE = 'INPUT_BYPASS_CACHE'
+    INPUT_SPOOL_ON_FAILURE = 'INPUT_SPOOL_ON_FAILURE'
+    INPUT_COMPRESS = 'INPUT_COMPRESS'
+    INPUT_MAX_LOG_LENGTH = 'INPUT_MAX_LOG_LENGTH'
     OUTPUT_RESULT = 'OUTPUT_RESULT'
     OUTPUT_DOMINODE_RESOURCE_URL = 'OUTPUT_DOMINODE_RESOURCE_URL'
     OUTPUT_VALIDATION_REPORT_URL = 'OUTPUT_VALIDATION_REPORT_URL'
@@ -71,6 +100,15 @@ class DomiNodeReportUploaderAlgorithm(QgsProcessingAlgorithm):
             f"server\n"
             f"{self.QGIS_VARIABLE_PREFIX}_dominode_endpoint: Endpoint of "
             f"the DomiNode API"
+            f"\n\n"
+            f"DomiNode resources are cached locally in the QGIS profile "
+            f"directory. Enable the bypass option to always look them up "
+            f"on the server."
+            f"\n\n"
+            f"Reports that cannot be uploaded are spooled locally and "
+            f"retried in the background, unless spooling is disabled. Use "
+            f"the spool drainer algorithm to retry them on demand. Reports "
+            f"that DomiNode rejects are not spooled."
         )
 
     def initAlgorithm(
@@ -104,6 +142,35 @@ class DomiNodeReportUploaderAlgorithm(QgsProcessingAlgorithm):
                 defaultValue=f'@{self.QGIS_VARIABLE_PREFIX}_base_url'
             )
         )
+        self.addParameter(
+            QgsProcessingParameterBoolean(
+                self.INPUT_BYPASS_CACHE,
+                self.tr('Bypass the local cache of DomiNode resources'),
+                defaultValue=False
+            )
+        )
+        self.addParameter(
+            QgsProcessingParameterBoolean(
+                self.INPUT_SPOOL_ON_FAILURE,
+                self.tr('Spool the report for later upload if it fails'),
+                defaultValue=True
+            )
+        )
+        self.addParameter(
+            QgsProcessingParameterBoolean(
+                self.INPUT_COMPRESS,
+                self.tr('Compress the report with gzip when uploading it'),
+                defaultValue=False
+            )
+        )
+        self.addParameter(
+            QgsProcessingParameterNumber(
+                self.INPUT_MAX_LOG_LENGTH,
+                self.tr('Maximum number of characters of the report to log'),
+                defaultValue=MAX_LOG_LENGTH,
+                minValue=0
+            )
+        )
         self.addOutput(
             QgsProcessingOutputBoolean(
                 self.OUTPUT_RESULT,
@@ -139,26 +206,49 @@ class DomiNodeReportUploaderAlgorithm(QgsProcessingAlgorithm):
             raise QgsProcessingException(f'Invalid base_url: {base_url}')
         else:
             base_url = base_url if base_url.endswith('/') else f'{base_url}/'
-        feedback.pushInfo(f'report: {report}')
+        compress = self.parameterAsBool(
+            parameters, self.INPUT_COMPRESS, context)
+        max_log_length = self.parameterAsInt(
+            parameters, self.INPUT_MAX_LOG_LENGTH, context)
+        feedback.pushInfo(f'report: {summarize_json(report, max_log_length)}')
         feedback.pushInfo(f'auth_config: {auth_config}')
         feedback.pushInfo(f'base_url: {base_url}')
-        network_manager = QgsNetworkAccessManager.instance()
-        resource = get_resource(
-            report['dataset'], base_url, network_manager, feedback)
-        if resource is None:
-            resource = post_resource(
-                report['dataset'],
-                report['dataset_type'],
-                report['artifact_type'],
+        bypass_cache = self.parameterAsBool(
+            parameters, self.INPUT_BYPASS_CACHE, context)
+        cache = None if bypass_cache else ResourceCache()
+        spool_on_failure = self.parameterAsBool(
+            parameters, self.INPUT_SPOOL_ON_FAILURE, context)
+        try:
+            resource, validation_report = upload_report(
+                report,
                 base_url,
-                network_manager=network_manager,
-                auth_config=auth_config,
-                feedback=feedback
+                QgsNetworkAccessManager.instance(),
+                auth_config,
+                feedback=feedback,
+                cache=cache,
+                compress=compress
+            )
+        except QgsProcessingException as exc:
+            rejected = (
+                isinstance(exc, RequestError) and
+                is_permanent_failure(exc.status_code)
             )
+            if not spool_on_failure or rejected:
+                raise
+            feedback.reportError(str(exc))
+            spool_report(report, base_url, auth_config, str(exc))
+            feedback.pushInfo(
+                'The report has been spooled and will be uploaded later')
+            return {
+                self.OUTPUT_RESULT: False,
+                self.OUTPUT_DOMINODE_RESOURCE_URL: None,
+                self.OUTPUT_VALIDATION_REPORT_URL: None,
+            }
         feedback.pushInfo(f'resource: {resource}')
-        validation_report = post_validation_report(
-            report, base_url, network_manager, auth_config, feedback)
-        feedback.pushInfo(f'validation_report: {validation_report}')
+        feedback.pushInfo(
+            f'validation_report: '
+            f'{summarize_json(validation_report, max_log_length)}'
+        )
         return {
             self.OUTPUT_RESULT: True,
             self.OUTPUT_DOMINODE_RESOURCE_URL: resource['url'],
@@ -166,28 +256,131 @@ class DomiNodeReportUploaderAlgorithm(QgsProcessingAlgorithm):
         }
 
 
+class RequestError(QgsProcessingException):
+    """A request to DomiNode was answered with an unexpected status"""
+
+    def __init__(self, message: str, status_code: typing.Optional[int]):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+def upload_report(
+        report: typing.Dict,
+        dominode_base_url: str,
+        network_manager: QgsNetworkAccessManager,
+        auth_config: str,
+        feedback: typing.Optional[QgsFeedback] = None,
+        cache: typing.Optional[ResourceCache] = None,
+        compress: bool = False
+) -> typing.Tuple[typing.Dict, typing.Dict]:
+    """Upload a validation report, creating its resource if needed
+
+    Returns the resource and the validation report, as stored by DomiNode.
+
+    """
+
+    resource = get_resource(
+        report['dataset'], dominode_base_url, network_manager, feedback,
+        cache
+    )
+    if resource is None:
+        resource = post_resource(
+            report['dataset'],
+            report['dataset_type'],
+            report['artifact_type'],
+            dominode_base_url,
+            network_manager=network_manager,
+            auth_config=auth_config,
+            feedback=feedback,
+            cache=cache
+        )
+    validation_report = post_validation_report(
+        report, dominode_base_url, network_manager, auth_config, feedback,
+        compress
+    )
+    return resource, validation_report
+
+
+def spool_report(
+        report: typing.Dict,
+        dominode_base_url: str,
+        auth_config: typing.Optional[str] = None,
+        error: typing.Optional[str] = None
+) -> str:
+    """Spool a report that could not be uploaded and start the flusher"""
+    key = ReportSpool().add(report, dominode_base_url, auth_config, error)
+    start_flusher(deliver_spooled_report)
+    return key
+
+
+def deliver_spooled_report(spooled: SpooledReport):
+    try:
+        upload_report(
+            spooled.report,
+            spooled.base_url,
+            QgsNetworkAccessManager.instance(),
+            spooled.auth_config,
+            cache=ResourceCache()
+        )
+    except RequestError as exc:
+        if is_permanent_failure(exc.status_code):
+            raise PermanentDeliveryError(str(exc)) from exc
+        raise
+
+
 def get_resource(
         name: str,
         dominode_base_url: str,
         network_manager: QgsNetworkAccessManager,
         feedback: typing.Optional[QgsFeedback] = None,
+        cache: typing.Optional[ResourceCache] = None,
 ) -> typing.Optional[typing.Dict]:
+    """Look up a DomiNode resource by name
+
+    When a cache is given, fresh cached resources are returned without
+    querying the server and stale ones are revalidated with their ETag.
+
+    """
+
+    cached = cache.get(dominode_base_url, name) if cache else None
+    if cached is not None and cached.is_fresh(cache.ttl):
+        return cached.resource
+    request = get_resource_request(name, dominode_base_url)
+    if cached is not None and cached.etag:
+        request.setRawHeader(b'If-None-Match', cached.etag.encode('utf-8'))
+    reply = network_manager.blockingGet(request, '', True, feedback=feedback)
+    status_code = reply.attribute(QNetworkRequest.HttpStatusCodeAttribute)
+    result = None
+    if status_code == 304 and cached is not None:
+        cache.touch(dominode_base_url, name)
+        result = cached.resource
+    elif status_code == 200:
+        result = parse_resource_lookup(bytes(reply.content()))
+        if cache is not None and result is not None:
+            etag = bytes(reply.rawHeader(b'ETag')).decode('utf-8')
+            cache.put(dominode_base_url, name, result, etag or None)
+    return result
+
+
+def get_resource_request(
+        name: str,
+        dominode_base_url: str
+) -> QNetworkRequest:
     url_query = QUrlQuery()
     url_query.addQueryItem('name', name)
-    url = QUrl(
-        f'{dominode_base_url}/dominode-validation/api/dominode-resources/')
+    url = QUrl(f'{dominode_base_url}/{RESOURCES_ENDPOINT}')
     url.setQuery(url_query)
     request = QNetworkRequest(url)
     request.setHeader(QNetworkRequest.ContentTypeHeader, 'application/json')
-    reply = network_manager.blockingGet(request, '', True, feedback=feedback)
-    status_code = reply.attribute(QNetworkRequest.HttpStatusCodeAttribute)
+    return request
+
+
+def parse_resource_lookup(raw_contents: bytes) -> typing.Optional[typing.Dict]:
+    """Return the first resource found by a resource lookup, if any"""
+    contents = json.loads(raw_contents.decode('utf-8'))
     result = None
-    if status_code == 200:
-        raw_string_contents = bytes(reply.content()).decode('utf-8')
-        contents = json.loads(raw_string_contents)
-        exists = contents.get('count', 0) > 0
-        if exists:
-            result = contents['results'][0]
+    if contents.get('count', 0) > 0:
+        result = contents['results'][0]
     return result
 
 
@@ -199,18 +392,18 @@ def post_resource(
         network_manager: QgsNetworkAccessManager,
         auth_config: str,
         feedback: typing.Optional[QgsFeedback] = None,
+        cache: typing.Optional[ResourceCache] = None,
 ) -> typing.Dict:
-    return _post_data(
-        f'{dominode_base_url}/dominode-validation/api/dominode-resources/',
-        {
-            'name': name,
-            'resource_type': resource_type,
-            'artifact_type': artifact_type,
-        },
+    result = _post_data(
+        f'{dominode_base_url}/{RESOURCES_ENDPOINT}',
+        get_resource_payload(name, resource_type, artifact_type),
         network_manager,
         auth_config,
         feedback=feedback
     )
+    if cache is not None:
+        cache.put(dominode_base_url, name, result)
+    return result
 
 
 def post_validation_report(
@@ -218,36 +411,71 @@ def post_validation_report(
         dominode_base_url: str,
         network_manager: QgsNetworkAccessManager,
         auth_config: str,
-        feedback: typing.Optional[QgsFeedback] = None
+        feedback: typing.Optional[QgsFeedback] = None,
+        compress: bool = False
 ) -> typing.Dict:
+    """Upload a validation report
+
+    The report is sent with an idempotency key derived from its contents,
+    so that DomiNode can ignore retried uploads of the same report.
+
+    """
+
     return _post_data(
-        f'{dominode_base_url}/dominode-validation/api/validation-reports/',
-        {
-            'resource': report['dataset'],
-            'result': report['dataset_is_valid'],
-            'validation_datetime': report['generated'],
-            'checklist_name': report['checklist'],
-            'checklist_description': report['description'],
-            'checklist_steps': report['checks'],
-        },
+        f'{dominode_base_url}/{VALIDATION_REPORTS_ENDPOINT}',
+        get_validation_report_payload(report),
         network_manager,
         auth_config,
-        feedback=feedback
+        feedback=feedback,
+        headers={
+            IDEMPOTENCY_KEY_HEADER: get_idempotency_key(
+                report, dominode_base_url),
+        },
+        compress=compress
     )
 
 
+def get_resource_payload(
+        name: str,
+        resource_type: str,
+        artifact_type: str
+) -> typing.Dict:
+    return {
+        'name': name,
+        'resource_type': resource_type,
+        'artifact_type': artifact_type,
+    }
+
+
+def get_validation_report_payload(report: typing.Dict) -> typing.Dict:
+    return {
+        'resource': report['dataset'],
+        'result': report['dataset_is_valid'],
+        'validation_datetime': report['generated'],
+        'checklist_name': report['checklist'],
+        'checklist_description': report['description'],
+        'checklist_steps': report['checks'],
+    }
+
+
 def _post_data(
         url: str,
         data_: typing.Dict,
         network_manager: QgsNetworkAccessManager,
         auth_config: str,
-        feedback: typing.Optional[QgsFeedback] = None
+        feedback: typing.Optional[QgsFeedback] = None,
+        headers: typing.Optional[typing.Dict[str, str]] = None,
+        compress: bool = False
 ):
     request = QNetworkRequest(QUrl(url))
     request.setHeader(QNetworkRequest.ContentTypeHeader, 'application/json')
+    if compress:
+        request.setRawHeader(b'Content-Encoding', b'gzip')
+    for name, value in (headers or {}).items():
+        request.setRawHeader(name.encode('utf-8'), value.encode('utf-8'))
     reply = network_manager.blockingPost(
         request,
-        json.dumps(data_).encode('utf-8'),
+        encode_payload(data_, compress),
         auth_config,
         True,
         feedback=feedback
@@ -257,10 +485,55 @@ def _post_data(
     if status_code == 201:
         result = json.loads(raw_string_contents)
     else:
-        raise QgsProcessingException(
+        raise RequestError(
             f'POST request failed. '
             f'status_code: {status_code} - '
             f'error_string: {reply.errorString()} - '
-            f'reply_contents: {raw_string_contents}'
+            f'reply_contents: {raw_string_contents}',
+            status_code
         )
     return result
+
+
+def encode_payload(data_: typing.Dict, compress: bool = False) -> bytes:
+    """Serialize a payload as JSON, optionally compressed with gzip
+
+    When compressing, the JSON is encoded and compressed incrementally, so
+    that the uncompressed document is never held in memory as a whole.
+
+    """
+
+    if not compress:
+        return json.dumps(data_).encode('utf-8')
+    compressor = zlib.compressobj(wbits=16 + zlib.MAX_WBITS)
+    compressed = []
+    pending = []
+    pending_length = 0
+    for chunk in json.JSONEncoder().iterencode(data_):
+        pending.append(chunk)
+        pending_length += len(chunk)
+        if pending_length >= COMPRESSION_CHUNK_SIZE:
+            compressed.append(
+                compressor.compress(''.join(pending).encode('utf-8')))
+            pending = []
+            pending_length = 0
+    compressed.append(compressor.compress(''.join(pending).encode('utf-8')))
+    compressed.append(compressor.flush())
+    return b''.join(compressed)
+
+
+def summarize_json(data_: typing.Any, max_length: int = MAX_LOG_LENGTH) -> str:
+    """Return the JSON representation of the data, up to a maximum length
+
+    Only as much of the data as needed is encoded.
+
+    """
+
+    parts = []
+    length = 0
+    for chunk in json.JSONEncoder().iterencode(data_):
+        parts.append(chunk)
+        length += len(chunk)
+        if length > max_length:
+            return f'{"".join(parts)[:max_length]}... (truncated)'
+    return ''.join(parts)
@@ -0,0 +1,114 @@
+"""Persistent cache of DomiNode resources for the report uploaders
+
+Resources are cached by DomiNode base URL and resource name in an SQLite
+database in the QGIS profile directory. Cached resources are used as-is
+until they are older than the cache TTL. After that they are revalidated
+with the server, using the ETag of the lookup reply when there is one.
+
+"""
+
+import contextlib
+import json
+import os
+import sqlite3
+import time
+import typing
+
+from qgis.core import QgsApplication
+
+CACHE_TTL = 60 * 60
+CACHE_FILE_NAME = 'dominode-resources.sqlite'
+
+
+class CachedResource(typing.NamedTuple):
+    resource: typing.Dict
+    etag: typing.Optional[str]
+    fetched: float
+
+    def is_fresh(self, ttl: float) -> bool:
+        return time.time() - self.fetched < ttl
+
+
+class ResourceCache:
+
+    def __init__(self, path: typing.Optional[str] = None, ttl: float = CACHE_TTL):
+        self.path = path or get_cache_path()
+        self.ttl = ttl
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        with self._connect() as connection:
+            connection.execute(
+                'CREATE TABLE IF NOT EXISTS resources ('
+                'base_url TEXT NOT NULL, '
+                'name TEXT NOT NULL, '
+                'resource TEXT NOT NULL, '
+                'etag TEXT, '
+                'fetched REAL NOT NULL, '
+                'PRIMARY KEY (base_url, name))'
+            )
+
+    def get(
+            self,
+            base_url: str,
+            name: str
+    ) -> typing.Optional[CachedResource]:
+        """Return the cached resource, regardless of whether it is fresh"""
+        with self._connect() as connection:
+            row = connection.execute(
+                'SELECT resource, etag, fetched FROM resources '
+                'WHERE base_url = ? AND name = ?',
+                (base_url, name)
+            ).fetchone()
+        result = None
+        if row is not None:
+            result = CachedResource(json.loads(row[0]), row[1], row[2])
+        return result
+
+    def put(
+            self,
+            base_url: str,
+            name: str,
+            resource: typing.Dict,
+            etag: typing.Optional[str] = None
+    ):
+        with self._connect() as connection:
+            connection.execute(
+                'INSERT OR REPLACE INTO resources '
+                '(base_url, name, resource, etag, fetched) '
+                'VALUES (?, ?, ?, ?, ?)',
+                (base_url, name, json.dumps(resource), etag, time.time())
+            )
+
+    def touch(self, base_url: str, name: str):
+        """Mark a cached resource as fresh, after the server revalidated it"""
+        with self._connect() as connection:
+            connection.execute(
+                'UPDATE resources SET fetched = ? '
+                'WHERE base_url = ? AND name = ?',
+                (time.time(), base_url, name)
+            )
+
+    def delete(self, base_url: str, name: str):
+        with self._connect() as connection:
+            connection.execute(
+                'DELETE FROM resources WHERE base_url = ? AND name = ?',
+                (base_url, name)
+            )
+
+    def clear(self):
+        with self._connect() as connection:
+            connection.execute('DELETE FROM resources')
+
+    @contextlib.contextmanager
+    def _connect(self) -> typing.Iterator[sqlite3.Connection]:
+        # a new connection each time, as the uploaders may run in any thread
+        connection = sqlite3.connect(self.path, timeout=10)
+        try:
+            with connection:
+                yield connection
+        finally:
+            connection.close()
+
+
+def get_cache_path() -> str:
+    return os.path.join(
+        QgsApplication.qgisSettingsDirPath(), 'dominode', CACHE_FILE_NAME)
@@ -0,0 +1,266 @@
+import os
+import sys
+import typing
+
+from qgis.core import (
+    QgsExpressionContextUtils,
+    QgsFeature,
+    QgsFeatureRequest,
+    QgsFeatureSink,
+    QgsField,
+    QgsFields,
+    QgsProcessing,
+    QgsProcessingAlgorithm,
+    QgsProcessingException,
+    QgsProcessingParameterExpression,
+    QgsProcessingParameterFeatureSink,
+    QgsProcessingParameterFeatureSource,
+    QgsProcessingParameterField,
+    QgsProcessingParameterString,
+    QgsWkbTypes,
+)
+from qgis.PyQt.QtCore import (
+    QCoreApplication,
+    QVariant,
+)
+
+_SCRIPTS_DIR = os.path.dirname(os.path.abspath(__file__))
+if _SCRIPTS_DIR not in sys.path:
+    sys.path.append(_SCRIPTS_DIR)
+
+from dbpool import pooled_connection  # noqa: E402
+from expressiontostringconverter import parse_as_expression  # noqa: E402
+from instrumentation import instrumented  # noqa: E402
+from resourcenames import check_resource_names  # noqa: E402
+
+
+@instrumented
+class DomiNodeResourceNameBatchValidator(QgsProcessingAlgorithm):
+    INPUT_NAMES = 'INPUT_NAMES'
+    INPUT_TABLE = 'INPUT_TABLE'
+    INPUT_TABLE_FIELD = 'INPUT_TABLE_FIELD'
+    INPUT_DB_CONNECTION_NAME = 'INPUT_DB_CONNECTION_NAME'
+    INPUT_DB_SCHEMA = 'INPUT_DB_SCHEMA'
+    OUTPUT = 'OUTPUT'
+
+    CHUNK_SIZE = 10000
+
+    RULES_PATH_VARIABLE = 'dominode_resource_name_rules'
+
+    def tr(self, string):
+        return QCoreApplication.translate('Processing', string)
+
+    def createInstance(self):
+        return self.__class__()
+
+    def name(self):
+        """
+        Returns the unique algorithm name.
+        """
+        return 'resourcenamebatchvalidator'
+
+    def displayName(self):
+        """
+        Returns the translated algorithm name.
+        """
+        return self.tr('Validate resource names in bulk')
+
+    def group(self):
+        """
+        Returns the name of the group this algorithm belongs to.
+        """
+        return self.tr('DomiNode')
+
+    def groupId(self):
+        """
+        Returns the unique ID of the group this algorithm belongs
+        to.
+        """
+        return 'dominode'
+
+    def shortHelpString(self):
+        """
+        Returns a localised short help string for the algorithm.
+        """
+        return self.tr(
+            'Check multiple DomiNode resource names in a single run. Names '
+            'can be provided as a list, one per line, read from a field of '
+            'a table and/or be the names of the tables of a DB schema. The '
+            'output table has the parsed sections of each name and whether '
+            'it complies with the DomiNode resource conventions.\n\n'
+            'Validation rules are read from the JSON file set in the '
+            '{} QGIS global variable, if any'
+        ).format(self.RULES_PATH_VARIABLE)
+
+    def initAlgorithm(self, config=None):
+        self.addParameter(
+            QgsProcessingParameterString(
+                self.INPUT_NAMES,
+                self.tr('Names of DomiNode resources'),
+                multiLine=True,
+                optional=True
+            )
+        )
+        self.addParameter(
+            QgsProcessingParameterFeatureSource(
+                self.INPUT_TABLE,
+                self.tr('Table with names of DomiNode resources'),
+                [QgsProcessing.TypeVector],
+                optional=True
+            )
+        )
+        self.addParameter(
+            QgsProcessingParameterField(
+                self.INPUT_TABLE_FIELD,
+                self.tr('Field with the resource names'),
+                parentLayerParameterName=self.INPUT_TABLE,
+                type=QgsProcessingParameterField.String,
+                optional=True
+            )
+        )
+        self.addParameter(
+            QgsProcessingParameterExpression(
+                self.INPUT_DB_CONNECTION_NAME,
+                self.tr('DB connection name'),
+                defaultValue='@dominode_db_connection_name',
+                optional=True
+            )
+        )
+        self.addParameter(
+            QgsProcessingParameterString(
+                self.INPUT_DB_SCHEMA,
+                self.tr('DB schema with DomiNode resources'),
+                optional=True
+            )
+        )
+        self.addParameter(
+            QgsProcessingParameterFeatureSink(
+                self.OUTPUT,
+                self.tr('Validated names'),
+                QgsProcessing.TypeVector
+            )
+        )
+
+    def processAlgorithm(self, parameters, context, feedback):
+        names = [
+            name.strip() for name in self.parameterAsString(
+                parameters, self.INPUT_NAMES, context).splitlines()
+            if name.strip() != ''
+        ]
+        table = self.parameterAsSource(parameters, self.INPUT_TABLE, context)
+        if table is not None:
+            field_name = self.parameterAsString(
+                parameters, self.INPUT_TABLE_FIELD, context)
+            if field_name == '':
+                raise QgsProcessingException(
+                    self.tr('Select the field with the resource names'))
+            names.extend(get_table_names(table, field_name))
+        schema = self.parameterAsString(
+            parameters, self.INPUT_DB_SCHEMA, context)
+        if schema != '':
+            pg_service = parse_as_expression(
+                self.parameterAsExpression(
+                    parameters, self.INPUT_DB_CONNECTION_NAME, context)
+            )
+            names.extend(get_schema_table_names(pg_service, schema))
+        rules_path = QgsExpressionContextUtils.globalScope().variable(
+            self.RULES_PATH_VARIABLE)
+        feedback.pushInfo(f'Validating {len(names)} names...')
+
+        output_fields = QgsFields()
+        output_fields.append(QgsField('name'))
+        output_fields.append(QgsField('department'))
+        output_fields.append(QgsField('collection_id'))
+        output_fields.append(QgsField('dataset_id'))
+        output_fields.append(QgsField('version'))
+        output_fields.append(QgsField('collection_version'))
+        output_fields.append(QgsField('dataset_name'))
+        output_fields.append(QgsField('is_valid', QVariant.Bool))
+        output_fields.append(QgsField('error'))
+        sink, destination_id = self.parameterAsSink(
+            parameters,
+            self.OUTPUT,
+            context,
+            output_fields,
+            QgsWkbTypes.NoGeometry
+        )
+        if sink is None:
+            raise QgsProcessingException(
+                self.invalidSinkError(parameters, self.OUTPUT))
+
+        chunks = [
+            names[i:i + self.CHUNK_SIZE]
+            for i in range(0, len(names), self.CHUNK_SIZE)
+        ]
+        total = 100 / len(chunks) if len(chunks) > 0 else 0
+        for current, checked in enumerate(
+                check_chunks(chunks, feedback, rules_path)):
+            features = []
+            for name, parsed, error in checked:
+                feature = QgsFeature(output_fields)
+                if parsed is not None:
+                    feature.setAttributes([
+                        name,
+                        parsed.department,
+                        parsed.collection_id,
+                        parsed.dataset_id,
+                        parsed.version,
+                        parsed.collection_version,
+                        parsed.dataset_name,
+                        error is None,
+                        error
+                    ])
+                else:
+                    feature.setAttributes(
+                        [name, None, None, None, None, None, None, False, error])
+                features.append(feature)
+            sink.addFeatures(features, QgsFeatureSink.FastInsert)
+            self.metrics.add_features(len(features))
+            feedback.setProgress(int((current + 1) * total))
+        return {
+            self.OUTPUT: destination_id
+        }
+
+
+def get_table_names(source, field_name: str) -> typing.List[str]:
+    request = QgsFeatureRequest()
+    request.setFlags(QgsFeatureRequest.NoGeometry)
+    request.setSubsetOfAttributes([field_name], source.fields())
+    result = []
+    for feature in source.getFeatures(request):
+        value = feature[field_name]
+        if not is_null(value) and str(value).strip() != '':
+            result.append(str(value).strip())
+    return result
+
+
+def is_null(value: typing.Any) -> bool:
+    """Return whether an attribute value is NULL
+
+    NULL attributes are returned as null QVariants rather than ``None``.
+
+    """
+
+    return value is None or (isinstance(value, QVariant) and value.isNull())
+
+
+def get_schema_table_names(pg_service: str, schema: str) -> typing.List[str]:
+    with pooled_connection(pg_service) as connection:
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'SELECT table_name FROM information_schema.tables '
+                'WHERE table_schema = %s ORDER BY table_name',
+                (schema,)
+            )
+            return [row[0] for row in cursor.fetchall()]
+
+
+def check_chunks(
+        chunks: typing.List[typing.List[str]],
+        feedback,
+        rules_path: typing.Optional[str] = None
+) -> typing.Iterator[typing.List[typing.Tuple]]:
+    for chunk in chunks:
+        if feedback.isCanceled():
+            break
+        yield check_resource_names(chunk, rules_path=rules_path)
@@ -0,0 +1,249 @@
+r"""Parsing and validation of DomiNode resource names
+
+DomiNode resource names follow one of these conventions:
+
+- ``{department}_{dataset_id}_{version}[.{format}]``
+- ``{department}_{collection_id}_{dataset_id}_{collection_version}[.{format}]``
+
+where versions have up to three dot-separated parts and anything after the
+third part is the format suffix.
+
+Parsed names are validated against a set of rules, which may be loaded from
+a JSON file like this one:
+
+    {
+        "departments": ["lsd", "ppd"],
+        "dataset_id_pattern": "[a-z0-9-]+",
+        "version_pattern": "\\d+\\.\\d+\\.\\d+",
+        "min_version": "0.0.1",
+        "department_rules": {
+            "lsd": {"dataset_id_pattern": "topo-[a-z0-9-]+"}
+        }
+    }
+
+All keys are optional and the default rules accept any name that can be
+parsed, so names are only restricted when a rules file is configured.
+Omitting ``departments`` allows any department and
+``department_rules`` override the top-level rules for a single department.
+Versions are compared numerically by their dot-separated parts.
+
+"""
+
+import functools
+import json
+import os
+import re
+import typing
+
+from qgis.core import QgsProcessingException
+
+CACHE_SIZE = 4096
+
+DEFAULT_RULES = {
+    'departments': None,
+    'dataset_id_pattern': r'.*',
+    'version_pattern': r'.*',
+    'min_version': None,
+    'max_version': None,
+    'department_rules': {},
+}
+
+RESOURCE_NAME_PATTERN = re.compile(
+    r'^(?P<department>[^_]*)_'
+    r'(?:(?P<collection_id>[^_]*)_)?'
+    r'(?P<dataset_id>[^_]*)_'
+    r'(?P<version>[^._]*(?:\.[^._]*){0,2})'
+    r'(?P<format_suffix>(?:\.[^_]*)?)$'
+)
+
+
+class ResourceName(typing.NamedTuple):
+    name: str
+    department: str
+    dataset_id: str
+    collection_id: typing.Optional[str]
+    version: typing.Optional[str]
+    collection_version: typing.Optional[str]
+    format_suffix: str
+
+    @property
+    def dataset_name(self) -> str:
+        """Resource name without its format suffix"""
+        return self.name[:len(self.name) - len(self.format_suffix)]
+
+    @property
+    def staging_schema(self) -> str:
+        return f'{self.department}_staging'
+
+
+@functools.lru_cache(maxsize=CACHE_SIZE)
+def parse_resource_name(name: str) -> ResourceName:
+    """Parse a DomiNode resource name into its sections
+
+    Raises ValueError when the name does not follow any of the DomiNode
+    naming conventions.
+
+    """
+
+    match = RESOURCE_NAME_PATTERN.match(name)
+    if match is None:
+        raise ValueError(f'Invalid name {name!r}')
+    collection_id = match.group('collection_id')
+    version = match.group('version')
+    return ResourceName(
+        name=name,
+        department=match.group('department'),
+        dataset_id=match.group('dataset_id'),
+        collection_id=collection_id,
+        version=version if collection_id is None else None,
+        collection_version=version if collection_id is not None else None,
+        format_suffix=match.group('format_suffix'),
+    )
+
+
+class NameRules(typing.NamedTuple):
+    dataset_id_pattern: typing.Pattern
+    version_pattern: typing.Pattern
+    min_version: typing.Optional[typing.Tuple[int, ...]]
+    max_version: typing.Optional[typing.Tuple[int, ...]]
+
+
+class RuleSet(typing.NamedTuple):
+    departments: typing.Optional[typing.FrozenSet[str]]
+    default_rules: NameRules
+    department_rules: typing.Dict[str, NameRules]
+
+    def get_rules(self, department: str) -> NameRules:
+        return self.department_rules.get(department, self.default_rules)
+
+
+def load_rules(path: typing.Optional[str] = None) -> RuleSet:
+    """Return the compiled validation rules stored in the input JSON file
+
+    Rules are compiled only once per process for each version of the file.
+    When no path is given the default rules are used. A rules file that
+    cannot be read or is not valid raises a QgsProcessingException.
+
+    """
+
+    if not path:
+        return _compile_rules(json.dumps(DEFAULT_RULES))
+    try:
+        return _load_rules(path, os.path.getmtime(path))
+    except (
+            OSError, ValueError, KeyError, TypeError, AttributeError,
+            re.error
+    ) as exc:
+        raise QgsProcessingException(
+            f'Invalid resource name rules file {path!r}: '
+            f'{exc.__class__.__name__}: {exc}'
+        ) from exc
+
+
+@functools.lru_cache(maxsize=16)
+def _load_rules(path: str, modification_time: float) -> RuleSet:
+    with open(path, encoding='utf-8') as fh:
+        return _compile_rules(fh.read())
+
+
+@functools.lru_cache(maxsize=16)
+def _compile_rules(raw_rules: str) -> RuleSet:
+    loaded = json.loads(raw_rules)
+    if not isinstance(loaded, dict):
+        raise ValueError('the rules must be a JSON object')
+    config = DEFAULT_RULES.copy()
+    config.update(loaded)
+    default_rules = _compile_name_rules(config, DEFAULT_RULES)
+    departments = config['departments']
+    return RuleSet(
+        departments=frozenset(departments) if departments is not None else None,
+        default_rules=default_rules,
+        department_rules={
+            department: _compile_name_rules(overrides, config)
+            for department, overrides in config['department_rules'].items()
+        }
+    )
+
+
+def _compile_name_rules(config: typing.Dict, defaults: typing.Dict) -> NameRules:
+    settings = defaults.copy()
+    settings.update(config)
+    return NameRules(
+        dataset_id_pattern=re.compile(settings['dataset_id_pattern']),
+        version_pattern=re.compile(settings['version_pattern']),
+        min_version=_parse_version(settings['min_version']),
+        max_version=_parse_version(settings['max_version']),
+    )
+
+
+def _parse_version(
+        version: typing.Optional[str]
+) -> typing.Optional[typing.Tuple[int, ...]]:
+    if version is None:
+        return None
+    return tuple(int(part) for part in version.split('.'))
+
+
+def validate_resource_name(
+        resource_name: ResourceName,
+        rules: RuleSet
+) -> typing.List[str]:
+    """Validate a parsed resource name against the input rules
+
+    Returns a list with the broken rules, which is empty for valid names.
+
+    """
+
+    errors = []
+    department = resource_name.department
+    if rules.departments is not None and department not in rules.departments:
+        errors.append(f'Unknown department {department!r}')
+    name_rules = rules.get_rules(department)
+    if name_rules.dataset_id_pattern.fullmatch(
+            resource_name.dataset_id) is None:
+        errors.append(f'Invalid dataset id {resource_name.dataset_id!r}')
+    if resource_name.collection_id is None:
+        version = resource_name.version
+    else:
+        version = resource_name.collection_version
+    if name_rules.version_pattern.fullmatch(version) is None:
+        errors.append(f'Invalid version {version!r}')
+    elif name_rules.min_version is not None or \
+            name_rules.max_version is not None:
+        try:
+            version_parts = _parse_version(version)
+        except ValueError:
+            errors.append(f'Invalid version {version!r}')
+        else:
+            min_version = name_rules.min_version or version_parts
+            max_version = name_rules.max_version or version_parts
+            if not min_version <= version_parts <= max_version:
+                errors.append(f'Version {version!r} is not allowed')
+    return errors
+
+
+def check_resource_names(
+        names: typing.Iterable[str],
+        rules_path: typing.Optional[str] = None
+) -> typing.List[
+    typing.Tuple[str, typing.Optional[ResourceName], typing.Optional[str]]
+]:
+    """Parse multiple resource names
+
+    Returns a list of ``(name, parsed_name, error)`` tuples. Names that
+    cannot be parsed have no ``parsed_name`` and names that do not comply
+    with the validation rules have an ``error``.
+
+    """
+
+    rules = load_rules(rules_path)
+    result = []
+    for name in names:
+        try:
+            parsed = parse_resource_name(name)
+        except ValueError as exc:
+            result.append((name, None, str(exc)))
+        else:
+            errors = validate_resource_name(parsed, rules)
+            result.append((name, parsed, '; '.join(errors) or None))
+    return result
@@ -1,7 +1,10 @@
+import os
+import sys
 import typing
 
 from qgis import processing
 from qgis.core import (
+    QgsExpressionContextUtils,
     QgsProcessing,
     QgsProcessingAlgorithm,
     QgsProcessingException,
@@ -11,7 +14,20 @@ from qgis.core import (
 )
 from qgis.PyQt.QtCore import QCoreApplication
 
+_SCRIPTS_DIR = os.path.dirname(os.path.abspath(__file__))
+if _SCRIPTS_DIR not in sys.path:
+    sys.path.append(_SCRIPTS_DIR)
 
+from instrumentation import instrumented  # noqa: E402
+from resourcenames import (  # noqa: E402
+    ResourceName,
+    load_rules,
+    parse_resource_name,
+    validate_resource_name,
+)
+
+
+@instrumented
 class DomiNodeResourceNameValidator(QgsProcessingAlgorithm):
 
     INPUT_RESOURCE_NAME = 'INPUT_NAME'
@@ -24,6 +40,8 @@ class DomiNodeResourceNameValidator(QgsProcessingAlgorithm):
     OUTPUT_DATASET_NAME = 'OUTPUT_DATASET_NAME'
     OUTPUT_DB_STAGING_SCHEMA_NAME = 'OUTPUT_DB_STAGING_SCHEMA_NAME'
 
+    RULES_PATH_VARIABLE = 'dominode_resource_name_rules'
+
     def tr(self, string):
         return QCoreApplication.translate('Processing', string)
 
@@ -61,8 +79,10 @@ class DomiNodeResourceNameValidator(QgsProcessingAlgorithm):
         """
         return self.tr(
             'Check the name of a DomiNOde resource in order to determine '
-            'if it complies with the DomiNode resource conventions.'
-        )
+            'if it complies with the DomiNode resource conventions.\n\n'
+            'Validation rules are read from the JSON file set in the '
+            '{} QGIS global variable, if any'
+        ).format(self.RULES_PATH_VARIABLE)
 
     def initAlgorithm(self, config=None):
         self.addParameter(
@@ -134,51 +154,35 @@ class DomiNodeResourceNameValidator(QgsProcessingAlgorithm):
                 parameters, self.INPUT_RESOURCE_NAME, context)
         feedback.pushInfo(f'resource_name: {resource_name}')
 
-        parts = resource_name.split('_')
+        try:
+            parsed = parse_resource_name(resource_name)
+        except ValueError as exc:
+            raise QgsProcessingException(str(exc))
         result = {
-            self.OUTPUT_VERSION: None,
-            self.OUTPUT_COLLECTION_ID: None,
-            self.OUTPUT_COLLECTION_VERSION: None,
-            self.OUTPUT_DATASET_NAME: resource_name,
+            self.OUTPUT_DEPARTMENT_ID: parsed.department,
+            self.OUTPUT_DATASET_ID: parsed.dataset_id,
+            self.OUTPUT_COLLECTION_ID: parsed.collection_id,
+            self.OUTPUT_VERSION: parsed.version,
+            self.OUTPUT_COLLECTION_VERSION: parsed.collection_version,
+            self.OUTPUT_DATASET_NAME: parsed.dataset_name,
+            self.OUTPUT_DB_STAGING_SCHEMA_NAME: parsed.staging_schema,
         }
-        if len(parts) == 4:
-            department, collection_id, dataset_id, version_suffix = parts
-            collection_version, format_suffix = get_format_suffix(
-                version_suffix)
-            result.update({
-                self.OUTPUT_COLLECTION_ID: collection_id,
-                self.OUTPUT_COLLECTION_VERSION: collection_version,
-            })
-        elif len(parts) == 3:
-            department, dataset_id, version_suffix = parts
-            version, format_suffix = get_format_suffix(version_suffix)
-            result.update({
-                self.OUTPUT_VERSION: version,
-            })
-        else:
-            raise QgsProcessingException(f'Invalid name {resource_name!r}')
-        if format_suffix is not None:
-            result[self.OUTPUT_DATASET_NAME] = resource_name.replace(
-                format_suffix, '')
-        result.update({
-            self.OUTPUT_DEPARTMENT_ID: department,
-            self.OUTPUT_DATASET_ID: dataset_id,
-            self.OUTPUT_DB_STAGING_SCHEMA_NAME: f'{department}_staging',
-        })
-        validate_name_sections(result, feedback)
+        rules_path = QgsExpressionContextUtils.globalScope().variable(
+            self.RULES_PATH_VARIABLE)
+        if not validate_name_sections(parsed, feedback, rules_path):
+            raise QgsProcessingException(
+                f'Name {resource_name!r} does not comply with the DomiNode '
+                f'resource conventions'
+            )
         return result
 
 
 def validate_name_sections(
-        sections: typing.Dict,
-        feedback
+        sections: ResourceName,
+        feedback,
+        rules_path: typing.Optional[str] = None
 ) -> bool:
-    return True
-
-
-def get_format_suffix(version_part: str) -> typing.Tuple[str, str]:
-    format_parts = version_part.split('.')[3:]
-    format_suffix = ''
-    if len(format_parts) != 0:
-        format_suffix = '.' + '.'.join(format_parts)
-    return version_part.replace(format_suffix, ''), format_suffix
+    errors = validate_resource_name(sections, load_rules(rules_path))
+    for error in errors:
+        feedback.reportError(error)
+    return len(errors) == 0
@@ -0,0 +1,31 @@
+"""Validators whose outputs are known in advance
+
+Some validators, like the no-op validator used by the legacy checklists,
+always produce the same outputs regardless of the dataset. Their outputs
+are declared here, so that checklist execution can resolve their checks
+without creating the algorithm or loading the dataset, and so that the
+validators themselves return the same outputs when they are run.
+
+"""
+
+import typing
+
+STATIC_VALIDATORS: typing.Dict[str, typing.Dict[str, typing.Any]] = {
+    'script:noopvalidator': {'OUTPUT': True},
+}
+
+
+def get_static_outputs(algorithm_id: str) -> typing.Dict[str, typing.Any]:
+    """Return the declared outputs of an algorithm, if any"""
+    return dict(STATIC_VALIDATORS.get(algorithm_id, {}))
+
+
+def get_static_output(
+        algorithm_id: str,
+        output_name: str
+) -> typing.Tuple[bool, typing.Any]:
+    """Return whether the output of an algorithm is known and its value"""
+    outputs = STATIC_VALIDATORS.get(algorithm_id, {})
+    if output_name not in outputs:
+        return False, None
+    return True, outputs[output_name]
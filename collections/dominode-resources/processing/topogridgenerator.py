@@ -0,0 +1,232 @@
+import math
+import os
+import sys
+import typing
+
+from qgis.core import (
+    QgsFeature,
+    QgsFeatureSink,
+    QgsField,
+    QgsFields,
+    QgsGeometry,
+    QgsProcessingAlgorithm,
+    QgsProcessingException,
+    QgsProcessingParameterCrs,
+    QgsProcessingParameterDistance,
+    QgsProcessingParameterExtent,
+    QgsProcessingParameterFeatureSink,
+    QgsProcessingParameterNumber,
+    QgsRectangle,
+    QgsWkbTypes,
+)
+from qgis.PyQt.QtCore import (
+    QCoreApplication,
+    QVariant,
+)
+
+_SCRIPTS_DIR = os.path.dirname(os.path.abspath(__file__))
+if _SCRIPTS_DIR not in sys.path:
+    sys.path.append(_SCRIPTS_DIR)
+
+from gridcodes import generate_grid_chunk  # noqa: E402
+from instrumentation import instrumented  # noqa: E402
+
+
+@instrumented
+class DomiNodeTopoMapGridGenerator(QgsProcessingAlgorithm):
+    INPUT_EXTENT = 'EXTENT'
+    INPUT_HORIZONTAL_SPACING = 'HSPACING'
+    INPUT_VERTICAL_SPACING = 'VSPACING'
+    INPUT_CRS = 'CRS'
+    INPUT_DEPTH = 'DEPTH'
+    OUTPUT = 'OUTPUT'
+
+    CHUNK_SIZE = 50000
+
+    def tr(self, string):
+        return QCoreApplication.translate('Processing', string)
+
+    def createInstance(self):
+        return self.__class__()
+
+    def name(self):
+        """
+        Returns the unique algorithm name.
+        """
+        return 'topogridgenerator'
+
+    def displayName(self):
+        """
+        Returns the translated algorithm name.
+        """
+        return self.tr('Generate topo maps index grid')
+
+    def group(self):
+        """
+        Returns the name of the group this algorithm belongs to.
+        """
+        return self.tr('DomiNode')
+
+    def groupId(self):
+        """
+        Returns the unique ID of the group this algorithm belongs
+        to.
+        """
+        return 'dominode'
+
+    def shortHelpString(self):
+        """
+        Returns a localised short help string for the algorithm.
+        """
+        return self.tr(
+            'Generate a rectangular topo maps index grid, including the '
+            'identifier columns for the coordinates of each cell. Cells are '
+            'generated in chunks of grid columns and written directly to the '
+            'output, one chunk at a time, which keeps memory usage bounded '
+            'regardless of grid size'
+        )
+
+    def initAlgorithm(self, config=None):
+        self.addParameter(
+            QgsProcessingParameterExtent(
+                self.INPUT_EXTENT,
+                self.tr('Grid extent')
+            )
+        )
+        self.addParameter(
+            QgsProcessingParameterDistance(
+                self.INPUT_HORIZONTAL_SPACING,
+                self.tr('Horizontal spacing'),
+                defaultValue=1700,
+                parentParameterName=self.INPUT_CRS,
+                minValue=1
+            )
+        )
+        self.addParameter(
+            QgsProcessingParameterDistance(
+                self.INPUT_VERTICAL_SPACING,
+                self.tr('Vertical spacing'),
+                defaultValue=950,
+                parentParameterName=self.INPUT_CRS,
+                minValue=1
+            )
+        )
+        self.addParameter(
+            QgsProcessingParameterCrs(
+                self.INPUT_CRS,
+                self.tr('Grid CRS'),
+                defaultValue='ProjectCrs'
+            )
+        )
+        self.addParameter(
+            QgsProcessingParameterNumber(
+                self.INPUT_DEPTH,
+                self.tr('Depth'),
+                defaultValue=1,
+                minValue=1,
+                maxValue=10
+            )
+        )
+        self.addParameter(
+            QgsProcessingParameterFeatureSink(
+                self.OUTPUT,
+                self.tr('Output grid layer'),
+            )
+        )
+
+    def processAlgorithm(self, parameters, context, feedback):
+        crs = self.parameterAsCrs(parameters, self.INPUT_CRS, context)
+        extent = self.parameterAsExtent(
+            parameters, self.INPUT_EXTENT, context, crs)
+        cell_width = self.parameterAsDouble(
+            parameters, self.INPUT_HORIZONTAL_SPACING, context)
+        cell_height = self.parameterAsDouble(
+            parameters, self.INPUT_VERTICAL_SPACING, context)
+        depth = self.parameterAsInt(parameters, self.INPUT_DEPTH, context)
+        if cell_width <= 0 or cell_height <= 0:
+            raise QgsProcessingException(
+                self.tr('Grid spacing must be greater than zero'))
+        if extent.isEmpty():
+            raise QgsProcessingException(self.tr('Grid extent is empty'))
+        output_fields = QgsFields()
+        output_fields.append(QgsField('id', QVariant.LongLong))
+        output_fields.append(QgsField('left', QVariant.Double))
+        output_fields.append(QgsField('top', QVariant.Double))
+        output_fields.append(QgsField('right', QVariant.Double))
+        output_fields.append(QgsField('bottom', QVariant.Double))
+        output_fields.append(QgsField('row_id'))
+        output_fields.append(QgsField('col_id'))
+        sink, destination_id = self.parameterAsSink(
+            parameters,
+            self.OUTPUT,
+            context,
+            output_fields,
+            QgsWkbTypes.Polygon,
+            crs
+        )
+        if sink is None:
+            raise QgsProcessingException(
+                self.invalidSinkError(parameters, self.OUTPUT))
+
+        num_cols = math.ceil(extent.width() / cell_width)
+        num_rows = math.ceil(extent.height() / cell_height)
+        feedback.pushInfo(f'Generating {num_rows} rows by {num_cols} columns')
+        chunks = get_column_chunks(num_cols, num_rows, self.CHUNK_SIZE)
+        chunk_arguments = (
+            (
+                first_col,
+                last_col,
+                num_rows,
+                extent.xMinimum(),
+                extent.yMaximum(),
+                cell_width,
+                cell_height,
+                depth
+            ) for first_col, last_col in chunks
+        )
+        total = 100 / len(chunks) if len(chunks) > 0 else 0
+        for current, cells in enumerate(
+                generate_chunks(chunk_arguments, feedback)):
+            features = []
+            for cell in cells:
+                feature = QgsFeature(output_fields)
+                feature.setGeometry(
+                    QgsGeometry.fromRect(
+                        QgsRectangle(cell[1], cell[4], cell[3], cell[2])))
+                feature.setAttributes(list(cell))
+                features.append(feature)
+            sink.addFeatures(features, QgsFeatureSink.FastInsert)
+            self.metrics.add_features(len(features))
+            feedback.setProgress(int((current + 1) * total))
+        return {
+            self.OUTPUT: destination_id
+        }
+
+
+def get_column_chunks(
+        num_cols: int,
+        num_rows: int,
+        chunk_size: int
+) -> typing.List[typing.Tuple[int, int]]:
+    cols_per_chunk = max(1, chunk_size // max(1, num_rows))
+    return [
+        (first_col, min(first_col + cols_per_chunk, num_cols))
+        for first_col in range(0, num_cols, cols_per_chunk)
+    ]
+
+
+def generate_chunks(
+        chunk_arguments: typing.Iterable[typing.Tuple],
+        feedback
+) -> typing.Iterator[typing.List[typing.Tuple]]:
+    """Yield generated grid chunks in order
+
+    Each chunk is only generated when the previous one has been consumed,
+    which keeps memory usage bounded regardless of grid size.
+
+    """
+
+    for arguments in chunk_arguments:
+        if feedback.isCanceled():
+            break
+        yield generate_grid_chunk(*arguments)
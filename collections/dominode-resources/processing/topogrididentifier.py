@@ -1,9 +1,12 @@
-import string
+import os
+import sys
 import typing
 
+import numpy as np
 from qgis import processing
 from qgis.core import (
     QgsFeature,
+    QgsFeatureRequest,
     QgsFeatureSink,
     QgsField,
     QgsFields,
@@ -18,12 +21,25 @@ from qgis.core import (
 )
 from qgis.PyQt.QtCore import QCoreApplication
 
+_SCRIPTS_DIR = os.path.dirname(os.path.abspath(__file__))
+if _SCRIPTS_DIR not in sys.path:
+    sys.path.append(_SCRIPTS_DIR)
 
+from gridcodes import (  # noqa: E402
+    encode_col_id,
+    encode_row_id,
+)
+from instrumentation import instrumented  # noqa: E402
+
+
+@instrumented
 class DomiNodeTopoMapGridIdentifier(QgsProcessingAlgorithm):
     INPUT = 'INPUT'
     INPUT_DEPTH = 'DEPTH'
     OUTPUT = 'OUTPUT'
 
+    BATCH_SIZE = 10000
+
     def tr(self, string):
         return QCoreApplication.translate('Processing', string)
 
@@ -107,76 +123,94 @@ class DomiNodeTopoMapGridIdentifier(QgsProcessingAlgorithm):
             raise QgsProcessingException(
                 self.invalidSinkError(parameters, self.OUTPUT))
 
-        num_features = input_layer.featureCount()
-        total = 100 / num_features if num_features else 0
+        feedback.pushInfo('Computing grid identifiers...')
+        with self.metrics.step('compute_grid_identifiers'):
+            identifiers = compute_grid_identifiers(
+                input_layer, depth, feedback)
+        num_features = len(identifiers)
+        total = 50 / num_features if num_features else 0
+        batch = []
         for current, feature in enumerate(input_layer.getFeatures()):
             if feedback.isCanceled():
                 break
-            new_feature = QgsFeature(feature)
-            new_feature.setFields(output_fields)
-            for index, field in enumerate(input_layer.fields()):
-                new_feature[index] = feature[index]
-            row_id, col_id = get_grid_coord_identifiers(
-                new_feature, input_layer, depth, feedback)
-            new_feature.setAttribute('row_id', row_id.upper())
-            new_feature.setAttribute('col_id', col_id)
-            sink.addFeature(
-                new_feature, QgsFeatureSink.FastInsert)
-            feedback.setProgress(int(current * total))
+            new_feature = QgsFeature(output_fields, feature.id())
+            new_feature.setGeometry(feature.geometry())
+            new_feature.setAttributes(
+                feature.attributes() + list(identifiers[feature.id()]))
+            batch.append(new_feature)
+            if len(batch) >= self.BATCH_SIZE:
+                sink.addFeatures(batch, QgsFeatureSink.FastInsert)
+                self.metrics.add_features(len(batch))
+                batch = []
+            feedback.setProgress(50 + int(current * total))
+        if len(batch) > 0:
+            sink.addFeatures(batch, QgsFeatureSink.FastInsert)
+            self.metrics.add_features(len(batch))
         return {
             self.OUTPUT: destination_id
         }
 
 
-def get_grid_coord_identifiers(feature, layer, depth, feedback):
-    num_rows, num_cols = get_grid_params(feature, layer, feedback)
-    return find_coord_ids(feature['id'], num_rows, num_cols, depth, feedback)
-
-
-def find_coord_ids(cell, num_rows, num_cols, depth, feedback):
-    row, col = get_coords(cell, num_rows, num_cols)
-    col_levels = find_levels(col - 1, depth, feedback)
-    row_levels = find_alphabetic_levels(row - 1, depth, feedback)
-    return (
-        ''.join(str(i) for i in row_levels),
-        ''.join(str(i) for i in col_levels)
-    )
-
-
-def get_grid_params(feature, layer, feedback):
-    layer_extent = layer.extent()
-    layer_width = layer_extent.width()
-    layer_height = layer_extent.height()
-    cell_width = feature['right'] - feature['left']
-    cell_height = feature['top'] - feature['bottom']
-    num_cols = layer_width // cell_width
-    num_rows = layer_height // cell_height
-    return num_rows, num_cols
-
-
-def find_levels(coord: int, depth: int, feedback, result=None):
-    levels = result or []
-    if depth == 1:
-        levels.append(int(coord + 1))
-        return levels
-    else:
-        depth_treshold = 2 ** (depth - 1)
-        level = int(coord // depth_treshold + 1)
-        levels.append(level)
-        new_coord = coord - depth_treshold * (level - 1)
-        return find_levels(new_coord, depth - 1, feedback, levels)
-
-
-def find_alphabetic_levels(coord, depth, feedback):
-    levels = find_levels(coord, depth, feedback)
-    # feedback.pushInfo(f'found levels: {levels}')
-    result = []
-    for i in levels:
-        result.append(string.ascii_letters[i - 1])
-    return result
-
-
-def get_coords(cell: int, num_rows: int, num_cols: int):
-    row = ((cell - 1) % num_rows) + 1
-    col = (cell - row) / num_rows + 1
-    return row, int(col)
+GRID_ATTRIBUTES = ('id', 'left', 'right', 'top', 'bottom')
+
+
+def compute_grid_identifiers(
+        layer,
+        depth: int,
+        feedback=None
+) -> typing.Dict[int, typing.Tuple[str, str]]:
+    """Compute the row and column identifiers of all cells of a grid layer
+
+    Only the cell attributes are fetched, without geometries, in a single
+    pass. The grid parameters are derived once for the whole layer. Cell
+    coordinates are then calculated with array operations and each distinct
+    row and column is encoded only once.
+
+    Returns a mapping of feature id to a ``(row_id, col_id)`` tuple.
+
+    """
+
+    field_indexes = [layer.fields().lookupField(i) for i in GRID_ATTRIBUTES]
+    missing = [
+        name for name, index in zip(GRID_ATTRIBUTES, field_indexes)
+        if index == -1
+    ]
+    if len(missing) > 0:
+        raise QgsProcessingException(
+            f'Grid layer {layer.name()!r} is missing the fields: '
+            f'{", ".join(missing)}'
+        )
+    request = QgsFeatureRequest()
+    request.setFlags(QgsFeatureRequest.NoGeometry)
+    request.setSubsetOfAttributes(field_indexes)
+    num_features = layer.featureCount()
+    total = 50 / num_features if num_features > 0 else 0
+    feature_ids = []
+    values = []
+    for current, feature in enumerate(layer.getFeatures(request)):
+        if feedback is not None:
+            if feedback.isCanceled():
+                break
+            feedback.setProgress(int(current * total))
+        attributes = feature.attributes()
+        feature_ids.append(feature.id())
+        values.append([attributes[index] for index in field_indexes])
+    if len(values) == 0:
+        return {}
+    values = np.asarray(values, dtype=np.float64)
+    cells = values[:, 0]
+    cell_heights = values[:, 3] - values[:, 4]
+    num_rows = layer.extent().height() // cell_heights
+    rows = ((cells - 1) % num_rows) + 1
+    cols = ((cells - rows) / num_rows + 1).astype(np.int64)
+    rows = rows.astype(np.int64)
+    unique_rows, row_indexes = np.unique(rows, return_inverse=True)
+    unique_cols, col_indexes = np.unique(cols, return_inverse=True)
+    row_codes = [
+        encode_row_id(row - 1, depth).upper() for row in unique_rows.tolist()]
+    col_codes = [encode_col_id(col - 1, depth) for col in unique_cols.tolist()]
+    return {
+        feature_id: (row_codes[row_index], col_codes[col_index])
+        for feature_id, row_index, col_index in zip(
+            feature_ids, row_indexes.tolist(), col_indexes.tolist())
+    }
@@ -0,0 +1,212 @@
+import os
+import re
+import sys
+
+from qgis.core import (
+    QgsFeature,
+    QgsFeatureSink,
+    QgsField,
+    QgsFields,
+    QgsGeometry,
+    QgsProcessingAlgorithm,
+    QgsProcessingException,
+    QgsProcessingParameterCrs,
+    QgsProcessingParameterDistance,
+    QgsProcessingParameterExtent,
+    QgsProcessingParameterFeatureSink,
+    QgsProcessingParameterNumber,
+    QgsProcessingParameterString,
+    QgsRectangle,
+    QgsWkbTypes,
+)
+from qgis.PyQt.QtCore import (
+    QCoreApplication,
+    QVariant,
+)
+
+_SCRIPTS_DIR = os.path.dirname(os.path.abspath(__file__))
+if _SCRIPTS_DIR not in sys.path:
+    sys.path.append(_SCRIPTS_DIR)
+
+from gridcodes import (  # noqa: E402
+    get_cell_extent,
+    split_sheet_code,
+)
+from instrumentation import instrumented  # noqa: E402
+
+
+@instrumented
+class DomiNodeTopoMapGridLookup(QgsProcessingAlgorithm):
+    INPUT_CODES = 'CODES'
+    INPUT_EXTENT = 'EXTENT'
+    INPUT_HORIZONTAL_SPACING = 'HSPACING'
+    INPUT_VERTICAL_SPACING = 'VSPACING'
+    INPUT_CRS = 'CRS'
+    INPUT_DEPTH = 'DEPTH'
+    OUTPUT = 'OUTPUT'
+
+    def tr(self, string):
+        return QCoreApplication.translate('Processing', string)
+
+    def createInstance(self):
+        return self.__class__()
+
+    def name(self):
+        """
+        Returns the unique algorithm name.
+        """
+        return 'topogridlookup'
+
+    def displayName(self):
+        """
+        Returns the translated algorithm name.
+        """
+        return self.tr('Look up topo maps index grid cells by code')
+
+    def group(self):
+        """
+        Returns the name of the group this algorithm belongs to.
+        """
+        return self.tr('DomiNode')
+
+    def groupId(self):
+        """
+        Returns the unique ID of the group this algorithm belongs
+        to.
+        """
+        return 'dominode'
+
+    def shortHelpString(self):
+        """
+        Returns a localised short help string for the algorithm.
+        """
+        return self.tr(
+            'Resolve map sheet codes, like AB12, to the corresponding cells '
+            'of a topo maps index grid. Cells are computed from the grid '
+            'definition, without scanning the grid layer. Multiple codes '
+            'may be separated by commas, spaces or new lines. Codes of '
+            'cells outside of the grid extent are reported and skipped'
+        )
+
+    def initAlgorithm(self, config=None):
+        self.addParameter(
+            QgsProcessingParameterString(
+                self.INPUT_CODES,
+                self.tr('Sheet codes'),
+                multiLine=True
+            )
+        )
+        self.addParameter(
+            QgsProcessingParameterExtent(
+                self.INPUT_EXTENT,
+                self.tr('Grid extent')
+            )
+        )
+        self.addParameter(
+            QgsProcessingParameterDistance(
+                self.INPUT_HORIZONTAL_SPACING,
+                self.tr('Horizontal spacing'),
+                defaultValue=1700,
+                parentParameterName=self.INPUT_CRS,
+                minValue=1
+            )
+        )
+        self.addParameter(
+            QgsProcessingParameterDistance(
+                self.INPUT_VERTICAL_SPACING,
+                self.tr('Vertical spacing'),
+                defaultValue=950,
+                parentParameterName=self.INPUT_CRS,
+                minValue=1
+            )
+        )
+        self.addParameter(
+            QgsProcessingParameterCrs(
+                self.INPUT_CRS,
+                self.tr('Grid CRS'),
+                defaultValue='ProjectCrs'
+            )
+        )
+        self.addParameter(
+            QgsProcessingParameterNumber(
+                self.INPUT_DEPTH,
+                self.tr('Depth'),
+                defaultValue=1,
+                minValue=1,
+                maxValue=10
+            )
+        )
+        self.addParameter(
+            QgsProcessingParameterFeatureSink(
+                self.OUTPUT,
+                self.tr('Grid cells'),
+            )
+        )
+
+    def processAlgorithm(self, parameters, context, feedback):
+        codes = [
+            code for code in re.split(
+                r'[\s,;]+',
+                self.parameterAsString(parameters, self.INPUT_CODES, context)
+            ) if code != ''
+        ]
+        crs = self.parameterAsCrs(parameters, self.INPUT_CRS, context)
+        extent = self.parameterAsExtent(
+            parameters, self.INPUT_EXTENT, context, crs)
+        cell_width = self.parameterAsDouble(
+            parameters, self.INPUT_HORIZONTAL_SPACING, context)
+        cell_height = self.parameterAsDouble(
+            parameters, self.INPUT_VERTICAL_SPACING, context)
+        depth = self.parameterAsInt(parameters, self.INPUT_DEPTH, context)
+        output_fields = QgsFields()
+        output_fields.append(QgsField('code'))
+        output_fields.append(QgsField('row_id'))
+        output_fields.append(QgsField('col_id'))
+        output_fields.append(QgsField('left', QVariant.Double))
+        output_fields.append(QgsField('top', QVariant.Double))
+        output_fields.append(QgsField('right', QVariant.Double))
+        output_fields.append(QgsField('bottom', QVariant.Double))
+        sink, destination_id = self.parameterAsSink(
+            parameters,
+            self.OUTPUT,
+            context,
+            output_fields,
+            QgsWkbTypes.Polygon,
+            crs
+        )
+        if sink is None:
+            raise QgsProcessingException(
+                self.invalidSinkError(parameters, self.OUTPUT))
+
+        features = []
+        for code in codes:
+            try:
+                row_id, col_id = split_sheet_code(code)
+                left, top, right, bottom = get_cell_extent(
+                    row_id,
+                    col_id,
+                    depth,
+                    extent.xMinimum(),
+                    extent.yMaximum(),
+                    cell_width,
+                    cell_height
+                )
+            except ValueError as exc:
+                feedback.reportError(str(exc))
+                continue
+            if (left < extent.xMinimum() or left >= extent.xMaximum() or
+                    top > extent.yMaximum() or top <= extent.yMinimum()):
+                feedback.reportError(
+                    f'Code {code!r} is outside of the grid extent')
+                continue
+            feature = QgsFeature(output_fields)
+            feature.setGeometry(
+                QgsGeometry.fromRect(QgsRectangle(left, bottom, right, top)))
+            feature.setAttributes(
+                [code, row_id.upper(), col_id, left, top, right, bottom])
+            features.append(feature)
+        sink.addFeatures(features, QgsFeatureSink.FastInsert)
+        self.metrics.add_features(len(features))
+        return {
+            self.OUTPUT: destination_id
+        }